@@ -72,6 +72,7 @@ MIDDLEWARE = (
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'utils.middleware.CurrentDateMiddleware',
 )
 
 CRISPY_TEMPLATE_PACK = 'bootstrap3'
@@ -140,6 +141,7 @@ STATICFILES_DIRS = [f'{PROJECT_ROOT}/mwbase/static']
 CONSTANCE_BACKEND = 'constance.backends.database.DatabaseBackend'
 CONSTANCE_CONFIG = {
     'CURRENT_DATE': ('2015-8-1', 'Current Date for training'),
+    'AT_LAST_RECEIVED_ID': (0, "Last Africa's Talking inbox id saved by poll_inbox"),
 }
 
 ################
@@ -189,6 +191,50 @@ ROOT_URLCONF = 'mwach.urls.base'
 SMSBASE_IMPORT_FORMAT = {}
 SMSBANK_CLASS = 'utils.sms_utils.FinalRow'
 
+# Seconds before the in memory AutomatedMessage index is reloaded (None to only reload on changes)
+AUTOMATED_MESSAGE_INDEX_TTL = 300
+
+# Seconds before the in memory facility -> nurse name map is reloaded (None to only reload on changes)
+NURSE_NAME_CACHE_TTL = 300
+
+# Seconds before the in memory identity -> participant map used to receive messages is cleared (None to only on changes)
+CONNECTION_CACHE_TTL = 300
+
+# Seconds before the dashboard pending counts are recounted even without changes (date based visits and calls)
+PENDING_COUNTS_TTL = 300
+
+# Longest wait in seconds for pending/wait/ long-polls and seconds between their checks for changes from other processes
+PENDING_WAIT_TIMEOUT = 25
+PENDING_WAIT_INTERVAL = 1
+
+# Number of recent gateway ids kept in memory to drop retried receive and delivery report callbacks
+RECENT_ID_CACHE_SIZE = 10000
+
+# Default page size for the paginated API lists when no ?limit= is given (None to return whole lists)
+API_PAGE_SIZE = 100
+
+# Rows of each model per changes feed response and seconds of changes it resends so late commits are not missed
+CHANGES_PAGE_SIZE = 500
+CHANGES_OVERLAP = 10
+
+# Texts (any case, trailing punctuation ignored) that stop messaging: English, Swahili and Luo
+STOP_KEYWORDS = ('stop', 'acha', 'simamisha', 'sitisha', 'weyo', 'chung')
+
+# Rows written per transaction by management commands that batch their writes
+WRITE_BATCH_SIZE = 100
+
+# Queue messages sent from web requests for the outbox_worker command instead of calling the gateway
+SMS_OUTBOX = False
+
+# Only stage gateway delivery reports in the callback and apply them with the delivery_reports command
+DELIVERY_REPORT_BUFFER = False
+
+# Max messages per second sent to the SMS gateway by send_messages (None for no limit)
+SMS_SEND_RATE = None
+
+# Minutes the scheduler spreads each send window's messages over
+SEND_WINDOW_SPREAD = 0
+
 GROUP_CHOICES = (
     ('control', 'Control'),
     ('one-way', 'One Way'),
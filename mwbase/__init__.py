@@ -1 +1 @@
-
+default_app_config = 'mwbase.apps.MwbaseConfig'
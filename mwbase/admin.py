@@ -116,6 +116,37 @@ class MessageAdmin(admin.ModelAdmin, ParticipantAdminMixin):
     identity.admin_order_field = 'connection__identity'
 
 
+@admin.register(mwbase.Outbox)
+class OutboxAdmin(admin.ModelAdmin):
+    list_display = ('identity', 'status', 'attempts', 'created', 'modified')
+    list_filter = ('status',)
+    search_fields = ('identity',)
+    readonly_fields = ('created', 'modified')
+    raw_id_fields = ('message',)
+
+
+@admin.register(mwbase.DeliveryReport)
+class DeliveryReportAdmin(admin.ModelAdmin):
+    list_display = ('external_id', 'status', 'failure_reason', 'received')
+    list_filter = ('status',)
+    search_fields = ('external_id',)
+
+
+class SendPlanItemInline(admin.TabularInline):
+    model = mwbase.SendPlanItem
+    fields = ('participant', 'auto', 'status')
+    readonly_fields = fields
+    extra = 0
+
+
+@admin.register(mwbase.SendPlan)
+class SendPlanAdmin(admin.ModelAdmin):
+    list_display = ('stage', 'date', 'day', 'hour', 'created')
+    list_filter = ('stage',)
+    date_hierarchy = 'date'
+    inlines = (SendPlanItemInline,)
+
+
 @admin.register(mwbase.PhoneCall)
 class PhoneCallAdmin(admin.ModelAdmin, ParticipantAdminMixin):
     list_display = ('comment', 'participant_name', 'phone_number', 'outcome', 'is_outgoing', 'created')
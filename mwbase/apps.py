@@ -0,0 +1,37 @@
+# Python Imports
+import logging
+
+# Django Imports
+from django.apps import AppConfig
+from django.db import DatabaseError, connections
+from django.db.models.signals import post_migrate
+
+logger = logging.getLogger(__name__)
+
+# Inbound messages are unique per (connection, external_id) so gateway retries can't be saved twice.
+# Partial unique indexes can't be declared on a model before Django 2.2 so the index is created after migrate.
+INBOUND_INDEX_SQL = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS {table}_inbound_external_id ON {table} (connection_id, external_id) "
+    "WHERE NOT is_outgoing AND external_id <> ''"
+)
+
+
+def create_inbound_index(using='default', **kwargs):
+    from .models import Message
+
+    connection = connections[using]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(INBOUND_INDEX_SQL.format(table=Message._meta.db_table))
+    except DatabaseError as e:
+        # Most likely duplicate inbound messages saved before the index existed
+        logger.warning('Could not create unique inbound message index: %s', e)
+
+
+class MwbaseConfig(AppConfig):
+    name = 'mwbase'
+
+    def ready(self):
+        post_migrate.connect(create_inbound_index, sender=self)
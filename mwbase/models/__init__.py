@@ -1,8 +1,10 @@
 #!/usr/bin/python
 
-from mwbase.models.interactions import Message, PhoneCall, Note
+from mwbase.models.interactions import Message, Outbox, DeliveryReport, PhoneCall, Note
 from mwbase.models.misc import Connection, Practitioner, EventLog
 from mwbase.models.visit import Visit, ScheduledPhoneCall
+from mwbase.models.sendplan import SendPlan, SendPlanItem
+from mwbase.models.pending import PendingCount
 
 # Must be last since participants imports the others
 from mwbase.models.automatedmessage import AutomatedMessage, AutomatedMessageQuerySetBase, AutomatedMessageBase
@@ -1,5 +1,12 @@
+import bisect
+import collections
+import copy
+import threading
+import time
+
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
+from django.db.models.signals import post_delete, post_save
 
 import swapper
 
@@ -7,11 +14,110 @@ import utils.models as utils
 from django.conf import settings
 
 
+class AutomatedMessageIndex(object):
+    """
+    Process wide in memory index of AutomatedMessages by (send_base, send_offset)
+
+    Loaded with one query on first use. Saves and deletes in this process update the index and it is
+    reloaded after settings.AUTOMATED_MESSAGE_INDEX_TTL seconds to pick up changes made by other processes.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._lock = threading.RLock()
+        self._messages = None
+        self._keys = None
+        self._loaded = 0
+
+    def get(self, send_base, send_offset):
+        """ Return messages for send_base and send_offset ordered by pk """
+        with self._lock:
+            ttl = getattr(settings, 'AUTOMATED_MESSAGE_INDEX_TTL', 300)
+            if self._messages is None or (ttl is not None and time.monotonic() - self._loaded > ttl):
+                self.load()
+            return self._messages.get((send_base, send_offset), [])
+
+    def load(self):
+        with self._lock:
+            self._messages, self._keys = collections.defaultdict(list), {}
+            for message in self.model._default_manager.order_by('pk'):
+                self._add(message)
+            self._loaded = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._messages, self._keys = None, None
+
+    def saved(self, message):
+        with self._lock:
+            if self._messages is not None:
+                self.deleted(message)
+                self._add(message)
+
+    def deleted(self, message):
+        with self._lock:
+            if self._messages is not None and message.pk in self._keys:
+                messages = self._messages[self._keys.pop(message.pk)]
+                messages[:] = [m for m in messages if m.pk != message.pk]
+
+    def _add(self, message):
+        key = (message.send_base, message.send_offset)
+        messages = self._messages[key]
+        messages.insert(bisect.bisect([m.pk for m in messages], message.pk), message)
+        self._keys[message.pk] = key
+
+
+_indexes = {}
+
+
+def message_index(model):
+    if model not in _indexes:
+        _indexes[model] = AutomatedMessageIndex(model)
+    return _indexes[model]
+
+
+def message_saved(sender, instance, **kwargs):
+    message_index(sender).saved(instance)
+
+
+def message_deleted(sender, instance, **kwargs):
+    message_index(sender).deleted(instance)
+
+
+post_save.connect(message_saved, sender=swapper.get_model_name('mwbase', 'AutomatedMessage'))
+post_delete.connect(message_deleted, sender=swapper.get_model_name('mwbase', 'AutomatedMessage'))
+
+
 class AutomatedMessageQuerySetBase(utils.BaseQuerySet):
     """
     Used to map a single description to an AutomatedMessage.
+
+    Lookups on the manager use the in memory AutomatedMessageIndex. Lookups on a filtered queryset
+    make one query for the send_base and send_offset.
     """
 
+    def offset_messages(self, send_base, send_offset):
+        """ Return the messages with send_base and send_offset ordered by pk """
+        if self.query.has_filters():
+            return list(self.filter(send_base=send_base, send_offset=send_offset).order_by('pk'))
+        return message_index(self.model).get(send_base, send_offset)
+
+    def invalidate_index(self):
+        message_index(self.model).invalidate()
+
+    def get_from(self, messages, **kwargs):
+        """ Return the single message in messages matching kwargs like QuerySet.get """
+        matches = self.filter_from(messages, **kwargs)
+        if len(matches) == 1:
+            return matches[0]
+        if not matches:
+            raise self.model.DoesNotExist("%s matching query does not exist." % self.model._meta.object_name)
+        raise self.model.MultipleObjectsReturned(
+            "get() returned more than one %s -- it returned %s!" % (self.model._meta.object_name, len(matches)))
+
+    def filter_from(self, messages, **kwargs):
+        return [m for m in messages if all(getattr(m, field) == value for field, value in kwargs.items())]
+
     def from_description(self, description, exact=False):
         """
         Return AutomatedMessage for description
@@ -33,40 +139,41 @@ class AutomatedMessageQuerySetBase(utils.BaseQuerySet):
         
     def from_parameters(self, send_base, group, condition='normal', send_offset=0, exact=False):
 
+        # Messages with send_base and offset
+        message_offset = self.offset_messages(send_base, send_offset)
+
         # Look for exact match of parameters
         try:
-            return self.get(send_base=send_base, send_offset=send_offset,
-                            group=group, condition=condition)
+            return self.get_from(message_offset, group=group, condition=condition)
         except ObjectDoesNotExist as e:
             if exact == True:
                 return None
             # No match for participant conditions continue to find best match
             pass
 
-        # Create the base query set with send_base and offset
-        message_offset = self.filter(send_base=send_base, send_offset=send_offset)
-
         if condition != "normal":
             # Force condition to normal and try again
             try:
-                return message_offset.get(condition="normal", group=group)
+                return self.get_from(message_offset, condition="normal", group=group)
             except ObjectDoesNotExist as e:
                 pass
 
         if group == "two-way":
             # Force group to one-way and try again
             try:
-                return message_offset.get(condition=condition, group="one-way")
+                return self.get_from(message_offset, condition=condition, group="one-way")
             except ObjectDoesNotExist as e:
                 pass
 
         if condition != "normal" and group != "one-way":
             # Force group to one-way and force hiv_messaging off return message or None
-            return message_offset.filter(condition='normal', group='one-way').first()
+            matches = self.filter_from(message_offset, condition='normal', group='one-way')
+            return matches[0] if matches else None
 
-    def from_excel(self, msg):
+    def from_excel(self, msg, batch=None):
         """
         Replace fields of message content with matching description
+        :param batch utils.batch.WriteBatch - if set changed messages are saved with batch
         """
         auto = self.from_description(msg.description(), exact=True)
         if auto is None:
@@ -75,10 +182,16 @@ class AutomatedMessageQuerySetBase(utils.BaseQuerySet):
             msg_english = msg.english if msg.english != '' else msg.new
             changed = msg_english != auto.english or msg.swahili != auto.swahili or msg.luo != auto.luo
 
+            # auto is shared with the message index so edit a copy, importers reload the index when done
+            auto = copy.copy(auto)
             auto.english = msg_english
             auto.swahili = msg.swahili
             auto.luo = msg.luo
-            auto.save()
+            if batch is not None:
+                if changed:
+                    batch.update(auto, 'english', 'swahili', 'luo')
+            else:
+                auto.save()
 
             return auto, 'changed' if changed else 'same'
 
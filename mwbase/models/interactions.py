@@ -1,11 +1,16 @@
 #!/usr/bin/python
 # Django Imports
+import collections
+
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.utils import timezone
 from jsonfield import JSONField
 
 import utils
+from utils.batch import bulk_update, chunks, default_chunk_size, post_bulk_create
 from utils.models import TimeStampedModel, BaseQuerySet, ForUserQuerySet
 # Local Imports
 from .visit import ScheduledPhoneCall
@@ -54,12 +59,22 @@ class Message(TimeStampedModel):
         ('Failed', 'Failed'),
         ('Sent', 'Sent'),
         ('Message Rejected By Gateway', 'Message Rejected By Gateway'),
-        ('Could Not Send', 'Could Not Send')
+        ('Could Not Send', 'Could Not Send'),
+        ('Queued', 'Queued'),
     )
 
+    # Delivery statuses only move forward in this order. Any other status (Success, Failed, ...) is final
+    EXTERNAL_STATUS_ORDER = ('', 'Queued', 'Sent', 'Submitted', 'Buffered')
+
     class Meta:
         ordering = ('-created',)
         app_label = 'mwbase'
+        # created is last so the default ordering is read from the index
+        indexes = [
+            models.Index(fields=['is_outgoing', 'is_viewed', 'created']),  # pending()
+            models.Index(fields=['translation_status', 'is_system', 'created']),  # to_translate()
+            models.Index(fields=['modified']),  # changed_since()
+        ]
 
     text = models.TextField(help_text='Text of the SMS message')
 
@@ -89,7 +104,7 @@ class Message(TimeStampedModel):
     participant = models.ForeignKey(swapper.get_model_name('mwbase', 'Participant'), models.CASCADE, blank=True, null=True)
 
     # Africa's Talking Data Only for outgoing messages
-    external_id = models.CharField(max_length=50, blank=True)
+    external_id = models.CharField(max_length=50, blank=True, db_index=True)
     external_success = models.NullBooleanField(verbose_name="Success")
     external_status = models.CharField(max_length=50, blank=True, choices=EXTERNAL_CHOICES)
     external_success_time = models.DateTimeField(default=None, blank=True, null=True)
@@ -98,6 +113,23 @@ class Message(TimeStampedModel):
     # Description message of system message
     auto = models.CharField(max_length=50, blank=True)
 
+    @staticmethod
+    def external_fields(msg_id, msg_success, external_data):
+        """ Return the external_* field values for a transport (id, success, data) result """
+        return {
+            'external_id': msg_id,
+            'external_success': msg_success,
+            'external_status': "Sent" if msg_success else external_data.get("status", "Failed"),
+            'external_data': external_data,
+        }
+
+    @classmethod
+    def status_rank(cls, status):
+        try:
+            return cls.EXTERNAL_STATUS_ORDER.index(status)
+        except ValueError:
+            return len(cls.EXTERNAL_STATUS_ORDER)
+
     def is_pending(self):
         return not self.is_viewed and not self.is_outgoing
 
@@ -122,14 +154,32 @@ class Message(TimeStampedModel):
     def is_pregnant(self):
         return self.participant.was_pregnant(today=self.created.date())
 
-    def dismiss(self, is_related=None, topic='', **kwargs):
+    def dismiss(self, is_related=None, topic='', batch=None, **kwargs):
         if is_related is not None:
             self.is_related = is_related
         if topic != '':
             self.topic = topic
         self.is_viewed = True
         self.set_action_time()
-        self.save()
+        if batch is not None:
+            batch.update(self, 'is_related', 'topic', 'is_viewed', 'action_time', 'modified')
+        else:
+            self.save()
+
+    def translate(self, status, languages, text=None, batch=None):
+        self.translation_status = status
+        self.languages = languages
+        if status == 'done':
+            self.translated_text = text
+
+        # Set translation time to now if it is currently none
+        if self.translation_time is None:
+            self.translation_time = timezone.now()
+
+        if batch is not None:
+            batch.update(self, 'translation_status', 'languages', 'translated_text', 'translation_time', 'modified')
+        else:
+            self.save()
 
     def set_action_time(self):
         if self.action_time is None:
@@ -173,6 +223,152 @@ class Message(TimeStampedModel):
                                                                       is_outgoing=True).first()
             return self._previous_outgoing
 
+class OutboxQuerySet(BaseQuerySet):
+
+    def pending(self):
+        return self.filter(status='pending')
+
+    def claim(self, limit=100):
+        """ Mark up to limit pending entries as sending and return them """
+        ids = list(self.pending().order_by('id').values_list('id', flat=True)[:limit])
+        self.filter(id__in=ids, status='pending').update(status='sending', modified=timezone.now())
+        return self.filter(id__in=ids, status='sending').select_related('message')
+
+
+class Outbox(TimeStampedModel):
+    """
+    An Outbox entry is a queued outgoing Message waiting for the outbox_worker command to send it
+    """
+
+    objects = OutboxQuerySet.as_manager()
+
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+
+    class Meta:
+        ordering = ('created',)
+        app_label = 'mwbase'
+        verbose_name_plural = 'outbox'
+
+    message = models.OneToOneField(Message, models.CASCADE)
+    identity = models.CharField(max_length=25)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', db_index=True)
+    attempts = models.IntegerField(default=0)
+
+    def __str__(self):
+        return "{0.identity} ({0.status})".format(self)
+
+    def record(self, msg_id, msg_success, external_data, max_attempts=3):
+        """ Save the transport result on the Message. Transport errors are retried up to max_attempts """
+        self.attempts += 1
+        if msg_success:
+            self.status = 'sent'
+        elif 'error' in external_data and self.attempts < max_attempts:
+            self.status = 'pending'
+            self.save()
+            return
+        else:
+            self.status = 'failed'
+        self.save()
+
+        for field, value in Message.external_fields(msg_id, msg_success, external_data).items():
+            setattr(self.message, field, value)
+        self.message.save()
+
+
+class DeliveryReportQuerySet(BaseQuerySet):
+
+    def apply(self, chunk_size=None, max_age=None):
+        """ Fold staged reports into their Messages in chunked bulk updates and delete them.
+            Reports without a Message are kept, since the send may not be saved yet, and deleted
+            once older than max_age (timedelta).
+            :returns: (applied, unmatched) report counts
+        """
+        applied, last_id = 0, 0
+        while True:
+            reports = list(self.filter(id__gt=last_id).order_by('id')[:default_chunk_size(chunk_size)])
+            if not reports:
+                break
+            last_id = reports[-1].id
+            with transaction.atomic():
+                applied += self.model.apply_chunk(reports)
+
+        if max_age is not None:
+            self.filter(received__lt=timezone.now() - max_age).delete()
+        return applied, self.count()
+
+
+class DeliveryReport(models.Model):
+    """
+    A DeliveryReport is a gateway delivery callback staged for DeliveryReport.objects.apply()
+    """
+
+    objects = DeliveryReportQuerySet.as_manager()
+
+    # Message fields read and written when applying reports
+    MESSAGE_FIELDS = ('id', 'external_id', 'external_status', 'external_data')
+    UPDATE_FIELDS = ('external_status', 'external_success_time', 'external_data', 'modified')
+
+    class Meta:
+        app_label = 'mwbase'
+
+    external_id = models.CharField(max_length=50)
+    status = models.CharField(max_length=50)
+    failure_reason = models.CharField(max_length=100, blank=True, null=True)
+    received = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return "{0.external_id} ({0.status})".format(self)
+
+    def fold(self, message):
+        """ Apply the report to message if it moves the status forward. Returns True if message changed """
+        if Message.status_rank(self.status) <= Message.status_rank(message.external_status):
+            return False
+        message.external_status = self.status
+        message.external_success_time = self.received
+        if self.failure_reason is not None:
+            message.external_data = dict(message.external_data or {}, reason=self.failure_reason)
+        return True
+
+    def apply(self):
+        """ Apply an unsaved report to its Messages now, staging it if there are none yet.
+            Returns True if a Message was found
+        """
+        messages = Message.objects.filter(external_id=self.external_id).only(*self.MESSAGE_FIELDS)
+        found = False
+        for message in messages:
+            found = True
+            if self.fold(message):
+                message.save(update_fields=self.UPDATE_FIELDS)
+        if not found:
+            self.save()
+        return found
+
+    @classmethod
+    def apply_chunk(cls, reports):
+        """ Apply reports in order to their Messages. Returns the number of reports applied """
+        by_id = collections.defaultdict(list)
+        for report in reports:
+            by_id[report.external_id].append(report)
+
+        messages = list(Message.objects.filter(external_id__in=by_id).only(*cls.MESSAGE_FIELDS))
+        changed = []
+        for message in messages:
+            if [report for report in by_id[message.external_id] if report.fold(message)]:
+                changed.append(message)
+        # Replayed and out of order reports change nothing
+        bulk_update(changed, cls.UPDATE_FIELDS)
+
+        matched = {message.external_id for message in messages}
+        applied = [report.id for external_id in matched for report in by_id[external_id]]
+        cls.objects.filter(id__in=applied).delete()
+        return len(applied)
+
+
 class PhoneCall(TimeStampedModel):
     """
     A PhoneCall represents the *log* of a call made.
@@ -209,8 +405,11 @@ class Note(TimeStampedModel):
     class Meta:
         ordering = ('-created',)
         app_label = 'mwbase'
+        indexes = [
+            models.Index(fields=['modified']),  # changed_since()
+        ]
 
-    objects = BaseQuerySet.as_manager()
+    objects = ForUserQuerySet.as_manager()
 
     participant = models.ForeignKey(swapper.get_model_name('mwbase', 'Participant'), models.CASCADE)
     admin = models.ForeignKey(settings.MESSAGING_ADMIN, models.CASCADE, blank=True, null=True)
@@ -218,3 +417,88 @@ class Note(TimeStampedModel):
 
     def is_pregnant(self):
         return self.participant.was_pregnant(today=self.created.date())
+
+
+#############################################
+# Participant interaction counters
+#############################################
+
+def counter_fields(obj):
+    """ Participant counter fields obj is counted in """
+    if isinstance(obj, Message):
+        return ('message_count', 'message_outgoing_count' if obj.is_outgoing else 'message_incoming_count')
+    return ('note_count',) if isinstance(obj, Note) else ('phonecall_count',)
+
+
+def interaction_counts():
+    """ {counter field: subquery counting the participant's interactions} """
+    def count(model, **filters):
+        interactions = model.objects.filter(participant=models.OuterRef('pk'), **filters).order_by()
+        interactions = interactions.values('participant').annotate(count=models.Count('pk')).values('count')
+        return Coalesce(models.Subquery(interactions, output_field=models.IntegerField()), 0)
+
+    return {
+        'note_count': count(Note),
+        'phonecall_count': count(PhoneCall),
+        'message_count': count(Message),
+        'message_incoming_count': count(Message, is_outgoing=False),
+        'message_outgoing_count': count(Message, is_outgoing=True),
+    }
+
+
+def adjust_counters(objs, delta):
+    """ Add delta to the participant counters of each interaction in objs with one UPDATE per distinct change """
+    Participant = swapper.load_model('mwbase', 'Participant')
+    changes = collections.defaultdict(list)
+    counts = collections.Counter((counter_fields(obj), obj.participant_id) for obj in objs if obj.participant_id)
+    for (fields, participant_id), count in counts.items():
+        changes[fields, count * delta].append(participant_id)
+
+    for (fields, change), participant_ids in changes.items():
+        for chunk in chunks(participant_ids):
+            Participant.objects_no_link.filter(pk__in=chunk).update(
+                **{field: models.F(field) + change for field in fields})
+
+
+# Receivers run in the transaction of the write (e.g. WriteBatch chunks, receive() and cascading deletes)
+def interaction_saving(sender, instance, raw=False, update_fields=None, **kwargs):
+    """ Load what an existing interaction is counted as when the save may move it to another counter """
+    instance._counted_as = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    fields = ('participant_id', 'is_outgoing') if sender is Message else ('participant_id',)
+    if update_fields is not None and not {'participant', *fields}.intersection(update_fields):
+        return
+    if 'participant_id' in instance.get_deferred_fields():
+        return  # Only the loaded fields are saved
+    counted = sender._base_manager.filter(pk=instance.pk).values(*fields).order_by().first()
+    if counted is not None:
+        instance._counted_as = sender(**counted)
+
+
+def interaction_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        adjust_counters([instance], 1)
+        return
+    counted_as = getattr(instance, '_counted_as', None)
+    if counted_as is not None and \
+            (counter_fields(counted_as), counted_as.participant_id) != (counter_fields(instance), instance.participant_id):
+        adjust_counters([counted_as], -1)
+        adjust_counters([instance], 1)
+
+
+def interaction_deleted(sender, instance, **kwargs):
+    adjust_counters([instance], -1)
+
+
+def interactions_bulk_created(sender, objs, **kwargs):
+    adjust_counters(objs, 1)
+
+
+for interaction in (Message, Note, PhoneCall):
+    pre_save.connect(interaction_saving, sender=interaction)
+    post_save.connect(interaction_saved, sender=interaction)
+    post_delete.connect(interaction_deleted, sender=interaction)
+    post_bulk_create.connect(interactions_bulk_created, sender=interaction)
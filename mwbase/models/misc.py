@@ -1,8 +1,13 @@
 # !/usr/bin/python
+# Python Imports
+import threading
+import time
+
 # Django Imports
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models.signals import post_delete, post_save
 from jsonfield import JSONField
 
 # Local Imports
@@ -12,11 +17,59 @@ from utils.models import TimeStampedModel, BaseQuerySet
 import swapper
 
 
+class ConnectionCache(object):
+    """
+    Process wide {identity: participant_id} map for the receive path, filled as identities are seen.
+    Entries are dropped when their Connection changes and all are reloaded after CONNECTION_CACHE_TTL seconds.
+    Identities without a participant are not stored since they may be linked by another process.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._participants = {}
+        self._loaded = time.monotonic()
+        self._generation = 0
+
+    def participant_id(self, identity):
+        with self._lock:
+            ttl = getattr(settings, 'CONNECTION_CACHE_TTL', 300)
+            if ttl is not None and time.monotonic() - self._loaded > ttl:
+                self.invalidate()
+            if identity in self._participants:
+                return self._participants[identity]
+            generation = self._generation
+
+        connection, created = Connection.objects.get_or_create(identity=identity)
+        with self._lock:
+            # Don't store a value read before an invalidation
+            if generation == self._generation and connection.participant_id is not None:
+                self._participants[identity] = connection.participant_id
+        return connection.participant_id
+
+    def invalidate(self, identity=None):
+        with self._lock:
+            self._generation += 1
+            if identity is None:
+                self._participants, self._loaded = {}, time.monotonic()
+            else:
+                self._participants.pop(identity, None)
+
+
+connections = ConnectionCache()
+
+
+class ConnectionQuerySet(BaseQuerySet):
+
+    def participant_id(self, identity):
+        """ Return the cached participant id for identity (None if not linked), creating the Connection if needed """
+        return connections.participant_id(identity)
+
+
 class Connection(models.Model):
     class Meta:
         app_label = 'mwbase'
 
-    objects = BaseQuerySet.as_manager()
+    objects = ConnectionQuerySet.as_manager()
 
     identity = models.CharField(max_length=25, primary_key=True)
     participant = models.ForeignKey(swapper.get_model_name('mwbase', 'Participant'), models.CASCADE, blank=True, null=True)
@@ -57,11 +110,51 @@ class Connection(models.Model):
         return new_message
 
 
+class NurseNameCache(object):
+    """
+    Process wide map of facility -> first name of the facility's practitioner used to personalize messages
+
+    Loaded with one query on first use. Cleared when a Practitioner or User.first_name changes in this process
+    and reloaded after settings.NURSE_NAME_CACHE_TTL seconds to pick up changes made by other processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names = None
+        self._loaded = 0
+
+    def names(self):
+        with self._lock:
+            ttl = getattr(settings, 'NURSE_NAME_CACHE_TTL', 300)
+            if self._names is None or (ttl is not None and time.monotonic() - self._loaded > ttl):
+                names = {}
+                # Same practitioner as PractitionerQuerySet.for_participant: first by pk with a first name
+                practitioners = Practitioner.objects.exclude(user__first_name='').order_by('pk')
+                for facility, first_name in practitioners.values_list('facility', 'user__first_name'):
+                    names.setdefault(facility, first_name.title())
+                self._names, self._loaded = names, time.monotonic()
+            return self._names
+
+    def invalidate(self):
+        with self._lock:
+            self._names = None
+
+
+nurse_names = NurseNameCache()
+
+
 class PractitionerQuerySet(BaseQuerySet):
 
     def for_participant(self, participant):
         return self.filter(facility=participant.facility).exclude(user__first_name='').select_related('user').first()
 
+    def nurse_names(self):
+        """ Return the cached {facility: nurse first name} map """
+        return nurse_names.names()
+
+    def nurse_name(self, facility, default='Nurse'):
+        return nurse_names.names().get(facility, default)
+
 
 class Practitioner(models.Model):
     '''
@@ -88,6 +181,29 @@ class Practitioner(models.Model):
         return '<{0!s}> <{1}>'.format(self.facility, self.user.username)
 
 
+def connection_changed(sender, instance, **kwargs):
+    connections.invalidate(instance.identity)
+
+
+post_save.connect(connection_changed, sender=Connection)
+post_delete.connect(connection_changed, sender=Connection)
+
+
+def practitioner_changed(sender, instance, **kwargs):
+    nurse_names.invalidate()
+
+
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # Logins save last_login with update_fields
+    if update_fields is None or 'first_name' in update_fields:
+        nurse_names.invalidate()
+
+
+post_save.connect(practitioner_changed, sender=Practitioner)
+post_delete.connect(practitioner_changed, sender=Practitioner)
+post_save.connect(user_saved, sender=User)
+
+
 class EventLog(TimeStampedModel):
     """
     The basic idea behind this model is to keep track of which staff accounts take which actions.
@@ -2,17 +2,20 @@
 # Python Imports
 import collections
 import datetime
+import functools
 import numbers
 import swapper
 from hashlib import sha256
 
 # Django Imports
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
 
 import utils
 # Local Imports
-from mwbase.models import PhoneCall, Practitioner, Visit, Connection
+from mwbase.models import PhoneCall, Practitioner, Visit, Connection, Message, Outbox
+from mwbase.models.interactions import interaction_counts
 from transports import router, TransportError
 from utils import enums
 from utils.models import TimeStampedModel, ForUserQuerySet
@@ -43,6 +46,14 @@ class ParticipantQuerySet(ForUserQuerySet):
             msg_other=models.F('msg_outgoing') - models.F('msg_delivered') - models.F('msg_sent'),
         )
 
+    def add_actual_counts(self):
+        """ Annotate actual_<counter> with the counted interactions for each participant counter """
+        return self.annotate(**{'actual_' + field: count for field, count in interaction_counts().items()})
+
+    def repair_counters(self):
+        """ Recompute the interaction counters with one UPDATE. Returns the number of participants updated """
+        return self.update(**interaction_counts())
+
     def send_batch(self, english, swahili=None, luo=None, auto='', send=False, control=False):
         """ Send a message to all participants in the query set
             english: required text
@@ -92,18 +103,14 @@ class ParticipantManager(models.Manager):
 
     def get_queryset(self):
         qs = super(ParticipantManager, self).get_queryset()
-        return qs.annotate(
-            note_count=models.Count('note', distinct=True),
-            phonecall_count=models.Count('phonecall', distinct=True),
-            message_count=models.Count('message', distinct=True),
-        ).prefetch_related('connection_set',
-                           models.Prefetch(
-                               'visit_set',
-                               queryset=Visit.objects.order_by('scheduled').filter(arrived__isnull=True,
-                                                                                   status='pending'),
-                               to_attr='pending_visits'
-                           )
-                       )
+        return qs.prefetch_related(
+            'connection_set',
+            models.Prefetch(
+                'visit_set',
+                queryset=Visit.objects.order_by('scheduled').filter(arrived__isnull=True, status='pending'),
+                to_attr='pending_visits'
+            )
+        )
 
 class BaseParticipant(TimeStampedModel):
     PREG_STATUS_CHOICES = (
@@ -216,13 +223,36 @@ class BaseParticipant(TimeStampedModel):
     is_validated = models.BooleanField(default=False, blank=True)
     validation_key = models.CharField(max_length=5, blank=True)
 
+    # Interaction counters kept current by signals in interactions.py (fix with the repair_counters command)
+    note_count = models.IntegerField(default=0, editable=False)
+    phonecall_count = models.IntegerField(default=0, editable=False)
+    message_count = models.IntegerField(default=0, editable=False)
+    message_incoming_count = models.IntegerField(default=0, editable=False)
+    message_outgoing_count = models.IntegerField(default=0, editable=False)
+    COUNTER_FIELDS = ('note_count', 'phonecall_count', 'message_count', 'message_incoming_count',
+                      'message_outgoing_count')
+
     class Meta:
         abstract = True
+        # Concrete participant models should inherit this Meta to keep the indexes
+        indexes = [
+            models.Index(fields=['facility']),
+            # Weekly send: send_day with active_users()
+            models.Index(fields=['send_day', 'sms_status', 'preg_status']),
+            # Changes feed: changed_since()
+            models.Index(fields=['modified']),
+        ]
 
     def save(self, force_insert=False, force_update=False, *args, **kwargs):
         # Force capitalization of display_name
         self.display_name = self.display_name.capitalize()
 
+        # The counters are only changed by UPDATEs (adjust_counters) so saves must not write back stale counts
+        if not force_insert and not self._state.adding and len(args) < 2 and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields if not field.primary_key and
+                                       field.attname not in deferred and field.name not in self.COUNTER_FIELDS]
+
         super().save(force_insert, force_update, *args, **kwargs)
 
     def __str__(self):
@@ -358,16 +388,24 @@ class BaseParticipant(TimeStampedModel):
         return '{} {}'.format(self.study_id, self.display_name)
 
     def add_call(self, outcome='answered', comment=None, length=None, is_outgoing=True,
-                 created=None, admin_user=None, scheduled=None):
+                 created=None, admin_user=None, scheduled=None, batch=None):
         if created is None:
             created = utils.today()
         else:
             created = utils.angular_datepicker(created)
 
-        new_call = PhoneCall.objects.create(outcome=outcome, participant=self, is_outgoing=is_outgoing,
-                                            comment=comment, created=created, connection=self.connection(),
-                                            length=length,
-                                            scheduled=scheduled)
+        new_call = PhoneCall(outcome=outcome, participant=self, is_outgoing=is_outgoing,
+                             comment=comment, created=created, connection=self.connection(),
+                             length=length,
+                             scheduled=scheduled)
+        # Checked here since a batched call is only inserted when the batch is flushed
+        new_call.clean_fields(exclude=['participant', 'connection', 'admin_user', 'scheduled'])
+        if new_call.connection is None:
+            raise ValueError('participant has no phone number')
+        if batch is not None:
+            batch.create(new_call)
+        else:
+            new_call.save(force_insert=True)
         return new_call
 
     def delivery(self, delivery_date, comment='', user=None, source=None):
@@ -383,7 +421,8 @@ class BaseParticipant(TimeStampedModel):
         self.schedule_year_call()
 
         # mark any delivery visits as attended
-        self.visit_set.filter(visit_type='delivery').update(status='attended', arrived=delivery_date)
+        self.visit_set.filter(visit_type='delivery').update(status='attended', arrived=delivery_date,
+                                                            modified=timezone.now())
 
         # Add 6wk visits
         six_wk_date = delivery_date + datetime.timedelta(days=42)
@@ -501,55 +540,77 @@ class BaseParticipant(TimeStampedModel):
         return one_year_call
 
     def message_kwargs(self):
-        nurse_obj = Practitioner.objects.for_participant(self)
         return {
             'name': self.sms_name.title(),
-            'nurse': nurse_obj.user.first_name.title() if nurse_obj is not None else 'Nurse',
+            'nurse': Practitioner.objects.nurse_name(self.facility),
             'clinic': self.facility.title()
         }
 
-    def send_message(self, text, control=False, **kwargs):
+    def send_message(self, text, control=False, dispatcher=None, enqueue=False, batch=None, **kwargs):
+        """ Send text to this participant over the system transport and save the new Message
+            :param dispatcher transports.dispatch.Dispatcher - if set run the transport call on the
+                dispatcher's thread pool and return a PendingSend that resolves to the new Message
+            :param enqueue bool - if True save the Message as Queued with an Outbox entry for the
+                outbox_worker command to send instead of calling the transport now
+            :param batch utils.batch.WriteBatch - if set the new Message is added to batch unsaved
+        """
+        text, result = self.outgoing(text, control)
+        if result is not None:
+            send = lambda: result
+
+        elif enqueue:
+            # Save as queued and let the outbox_worker send it
+            with transaction.atomic():
+                new_message = self.message_set.create(
+                    text=text,
+                    connection=self.connection(),
+                    **Message.external_fields("", None, {"status": "Queued"}),
+                    **kwargs)
+                Outbox.objects.create(message=new_message, identity=new_message.connection_id)
+            return new_message
+
+        else:
+            # Send message over system transport
+            send = functools.partial(transport_send, self.phone_number(), text)
+
+        def create_message(result):
+            # Create new message
+            if batch is not None:
+                new_message = Message(participant=self, text=text, connection=self.connection(),
+                                      **Message.external_fields(*result), **kwargs)
+                batch.create(new_message)
+                return new_message
+            return self.message_set.create(
+                text=text,
+                connection=self.connection(),
+                **Message.external_fields(*result),
+                **kwargs)
+
+        if dispatcher is not None:
+            return dispatcher.submit(send, create_message)
+        return create_message(send())
 
+    def outgoing(self, text, control=False):
+        """ Return (text, result) where result is the (id, success, data) of a message that is not sent or
+            None if text goes to the transport
+        """
         # Control check - don't send messages to participants in the control
         if self.study_group == 'control' and control is False:
-            text = 'CONTROL NOT SENT: ' + text
-            msg_id = 'control'
-            msg_success = False
-            external_data = {}
+            return 'CONTROL NOT SENT: ' + text, not_sent('control')
 
         # Status check - don't send messages to participants with NO_SMS_STATUS
-        elif self.preg_status in enums.NO_SMS_STATUS and control is False:
-            text = 'STATUS {} NOT SENT: '.format(self.preg_status.upper()) + text
-            msg_id = self.preg_status
-            msg_success = False
-            external_data = {}
+        if self.preg_status in enums.NO_SMS_STATUS and control is False:
+            return 'STATUS {} NOT SENT: '.format(self.preg_status.upper()) + text, not_sent(self.preg_status)
 
-        else:
-            # Send message over system transport
-            try:
-                msg_id, msg_success, external_data = router.send(self.phone_number(), text)
-            except TransportError as e:
-                msg_id = ""
-                msg_success = False
-                external_data = {"error": str(e)}
-
-        # Create new message
-        new_message = self.message_set.create(
-            text=text,
-            connection=self.connection(),
-            external_id=msg_id,
-            external_success=msg_success,
-            external_status="Sent" if msg_success else external_data.get("status", "Failed"),
-            external_data=external_data,
-            **kwargs)
-
-        return new_message
-
-    def send_automated_message(self, control=False, send=True, exact=False, extra_kwargs=None, **kwargs):
+        return text, None
+
+    def send_automated_message(self, control=False, send=True, exact=False, extra_kwargs=None, dispatcher=None,
+                               enqueue=False, **kwargs):
         """ kwargs get passed into self.description
             :param control bool - if True allow sending to control
             :param exact bool - if True only send exact match
             :param send bool - if True send message
+            :param dispatcher, enqueue - passed to self.send_message
             :kwargs
                 - hiv_messaging bool - hiv_messaging or not
                 - group - string for study group
@@ -559,14 +620,7 @@ class BaseParticipant(TimeStampedModel):
                 - condition - defaults to self.condition
         """
         description = self.description(**kwargs)
-        # print(kwargs)
-        # print(description)
-        AutomatedMessage = swapper.load_model("mwbase", "AutomatedMessage")
-        message = AutomatedMessage.objects.from_description(description, exact=exact)
-        if message is None:
-            return None  # TODO: logging on this
-
-        text = message.text_for(self, extra_kwargs)
+        message, text = self.automated_message(description, exact=exact, extra_kwargs=extra_kwargs)
         if text is None:
             return None  # TODO: logging on this
 
@@ -575,17 +629,50 @@ class BaseParticipant(TimeStampedModel):
         self.save()
 
         if send:
-            translated_text = message.english if self.language != 'english' else ''
             return self.send_message(
                 text=text,
-                translation_status='auto',
-                auto=message.description(),
                 control=control,
-                translated_text=translated_text
+                dispatcher=dispatcher,
+                enqueue=enqueue,
+                **self.automated_fields(message)
             )
         else:
             return message
 
+    def automated_send(self, exact=False, extra_kwargs=None, **kwargs):
+        """ Return (participant, text, fields) to send the automated message for kwargs with send_many or
+            None if there is no message. Sets last_msg_system like send_automated_message
+        """
+        message, text = self.automated_message(self.description(**kwargs), exact=exact, extra_kwargs=extra_kwargs)
+        if text is None:
+            return None
+
+        self.last_msg_system = utils.today()
+        self.save()
+        return self, text, self.automated_fields(message)
+
+    def automated_fields(self, message):
+        """ Message fields for sending AutomatedMessage message to this participant """
+        return {
+            'translation_status': 'auto',
+            'auto': message.description(),
+            'translated_text': message.english if self.language != 'english' else '',
+        }
+
+    def automated_message(self, description, exact=False, extra_kwargs=None):
+        """ Return (AutomatedMessage, text) for description or (None, None) if there is no message to send
+            :param exact bool - if True only return an exact match
+        """
+        AutomatedMessage = swapper.load_model("mwbase", "AutomatedMessage")
+        message = AutomatedMessage.objects.from_description(description, exact=exact)
+        if message is None:
+            return None, None
+
+        text = message.text_for(self, extra_kwargs)
+        if text is None:
+            return None, None
+        return message, text
+
     def get_recent_messages(self,n=8):
         """
         :return: most recent n messages for serialization
@@ -617,9 +704,56 @@ class BaseParticipant(TimeStampedModel):
 
 
 
+def transport_send(identity, text):
+    """ Send text to identity over the system transport. Returns an (id, success, data) tuple """
+    try:
+        return router.send(identity, text)
+    except TransportError as e:
+        return "", False, {"error": str(e)}
+
+
+def not_sent(msg_id):
+    return msg_id, False, {}
+
+
+def send_many(sends, control=False, dispatcher=None, enqueue=False, batch=None):
+    """ Send (participant, text, fields) tuples with one router.send_many call and save the new Messages
+        Texts to control and NO_SMS_STATUS participants are saved as not sent like send_message.
+        :param dispatcher, enqueue, batch - as for send_message. With a dispatcher the one transport call
+            runs on its thread pool and a PendingSend that resolves to the list of Messages is returned
+        Returns the new Messages in the order of sends
+    """
+    if enqueue:
+        return [participant.send_message(text, control=control, enqueue=True, **fields)
+                for participant, text, fields in sends]
+
+    outgoing = [(participant, fields) + participant.outgoing(text, control) for participant, text, fields in sends]
+    to_send = [(participant.phone_number(), text) for participant, fields, text, result in outgoing if result is None]
+
+    def send():
+        return router.send_many(to_send) if to_send else []
+
+    def create_messages(results):
+        results = iter(results)
+        messages = []
+        for participant, fields, text, result in outgoing:
+            message = Message(participant=participant, text=text, connection=participant.connection(),
+                              **Message.external_fields(*(result or next(results))), **fields)
+            if batch is not None:
+                batch.create(message)
+            else:
+                message.save()
+            messages.append(message)
+        return messages
+
+    if dispatcher is not None:
+        return dispatcher.submit(send, create_messages)
+    return create_messages(send())
+
+
 class Participant(BaseParticipant):
     ## only includes base elements and swappable meta
-    class Meta:
+    class Meta(BaseParticipant.Meta):
         app_label = 'mwbase'
         swappable = swapper.swappable_setting('mwbase', 'Participant')
 
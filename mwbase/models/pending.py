@@ -0,0 +1,164 @@
+#!/usr/bin/python
+# Python Imports
+import datetime
+import threading
+import time
+
+# Django Imports
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+# Local Imports
+from utils.batch import post_bulk_update
+from utils.models import BaseQuerySet
+from .interactions import Message
+from .visit import Visit, ScheduledPhoneCall
+import swapper
+
+
+class PendingCountQuerySet(BaseQuerySet):
+
+    def for_facility(self, facility):
+        """ Return the PendingCount for facility, recounted if stale or older than PENDING_COUNTS_TTL seconds """
+        pending, created = self.get_or_create(facility=facility)
+        ttl = getattr(settings, 'PENDING_COUNTS_TTL', 300)
+        expired = ttl is not None and pending.counted is not None and \
+            timezone.now() - pending.counted > datetime.timedelta(seconds=ttl)
+        if pending.is_stale or pending.counted is None or expired:
+            pending.recount()
+        return pending
+
+    def wait(self, facility, etag, timeout):
+        """ Return the PendingCount for facility once its etag is not etag or after timeout seconds
+
+            Changes made in this process wake the wait straight away. Other processes (e.g. the gateway
+            callbacks) are seen within PENDING_WAIT_INTERVAL seconds, each check being one primary key lookup.
+        """
+        deadline = time.monotonic() + timeout
+        interval = getattr(settings, 'PENDING_WAIT_INTERVAL', 1)
+        while True:
+            pending = self.for_facility(facility)
+            remaining = deadline - time.monotonic()
+            if pending.etag != etag or remaining <= 0:
+                return pending
+            with pending_changed_condition:
+                pending_changed_condition.wait(min(interval, remaining))
+
+    def for_participant(self, participant_id):
+        Participant = swapper.load_model('mwbase', 'Participant')
+        return self.filter(facility__in=Participant.objects_no_link.filter(pk=participant_id).values('facility'))
+
+
+class PendingCount(models.Model):
+    """
+    Dashboard badge counts for one facility. New pending messages are added as they are saved, other
+    changes to messages, visits and calls mark the counts stale so the next read recounts them.
+    version changes whenever the counts do and is used as the ETag of the pending list.
+    """
+
+    objects = PendingCountQuerySet.as_manager()
+
+    COUNTS = ('messages', 'visits', 'calls', 'translations')
+
+    class Meta:
+        app_label = 'mwbase'
+
+    facility = models.CharField(max_length=15, primary_key=True)
+    messages = models.IntegerField(default=0)
+    visits = models.IntegerField(default=0)
+    calls = models.IntegerField(default=0)
+    translations = models.IntegerField(default=0)
+
+    version = models.IntegerField(default=0)
+    is_stale = models.BooleanField(default=True)
+    counted = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return "{0.facility} (v{0.version})".format(self)
+
+    @property
+    def etag(self):
+        return '"{0.facility}-{0.version}"'.format(self)
+
+    def current_counts(self):
+        return {
+            'messages': Message.objects.by_facility(self.facility).pending().count(),
+            'visits': Visit.objects.by_facility(self.facility).get_visit_checks().count(),
+            'calls': ScheduledPhoneCall.objects.by_facility(self.facility).pending_calls().count(),
+            'translations': Message.objects.by_facility(self.facility).to_translate().count(),
+        }
+
+    def recount(self):
+        counts = self.current_counts()
+        updates = dict(counts, is_stale=False, counted=timezone.now())
+        if any(getattr(self, name) != value for name, value in counts.items()):
+            updates['version'] = models.F('version') + 1
+        PendingCount.objects.filter(pk=self.pk).update(**updates)
+        self.refresh_from_db()
+
+
+# Wakes PendingCountQuerySet.wait() calls in this process when counts change
+pending_changed_condition = threading.Condition()
+
+
+def notify_waiters():
+    # After the commit since a waiter woken earlier would read the old counts and sleep again
+    transaction.on_commit(notify_all_waiters)
+
+
+def notify_all_waiters():
+    with pending_changed_condition:
+        pending_changed_condition.notify_all()
+
+
+# Message fields that decide if a message is pending or needs translation
+PENDING_MESSAGE_FIELDS = {'is_viewed', 'is_outgoing', 'is_system', 'translation_status', 'participant'}
+
+
+def message_saved(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    # Checked before participant_id which may be deferred on partial saves like delivery reports
+    if raw or not (created or update_fields is None or PENDING_MESSAGE_FIELDS.intersection(update_fields)):
+        return
+    if instance.participant_id is None:
+        return
+    if created:
+        counts = {}
+        if instance.is_pending():
+            counts['messages'] = models.F('messages') + 1
+        if not instance.is_system and instance.translation_status == 'todo':
+            counts['translations'] = models.F('translations') + 1
+        if counts:
+            PendingCount.objects.for_participant(instance.participant_id).update(
+                version=models.F('version') + 1, **counts)
+            notify_waiters()
+    else:
+        PendingCount.objects.for_participant(instance.participant_id).update(is_stale=True)
+        notify_waiters()
+
+
+def pending_changed(sender, instance, **kwargs):
+    if not kwargs.get('raw', False):
+        PendingCount.objects.for_participant(instance.participant_id).update(is_stale=True)
+        notify_waiters()
+
+
+def bulk_updated(sender, objs, fields, **kwargs):
+    if sender is Message and not PENDING_MESSAGE_FIELDS.intersection(fields):
+        return
+    participant_ids = {obj.participant_id for obj in objs if obj.participant_id is not None}
+    if participant_ids:
+        Participant = swapper.load_model('mwbase', 'Participant')
+        facilities = Participant.objects_no_link.filter(pk__in=participant_ids).values('facility')
+        PendingCount.objects.filter(facility__in=facilities).update(is_stale=True)
+        notify_waiters()
+
+
+post_save.connect(message_saved, sender=Message)
+post_delete.connect(pending_changed, sender=Message)
+for event in (Visit, ScheduledPhoneCall):
+    post_save.connect(pending_changed, sender=event)
+    post_delete.connect(pending_changed, sender=event)
+for model in (Message, Visit, ScheduledPhoneCall):
+    post_bulk_update.connect(bulk_updated, sender=model)
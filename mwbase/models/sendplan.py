@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# Django Imports
+from django.db import models
+from jsonfield import JSONField
+
+import utils
+from utils.models import TimeStampedModel, BaseQuerySet
+# Local Imports
+from .visit import Visit
+from .participants import send_many
+import swapper
+
+
+class SendPlan(TimeStampedModel):
+    """
+    A SendPlan is the list of automated messages for one stage of the send_messages command on a
+    date and hour. The plan is built up front so a dry run only has to plan and an interrupted
+    send can resume from the items that are still pending.
+    """
+
+    objects = BaseQuerySet.as_manager()
+
+    STAGE_CHOICES = (
+        ('weekly', 'Weekly Messages'),
+        ('appointment', 'Appointment Reminders'),
+        ('missed', 'Missed Visit Reminders'),
+    )
+
+    class Meta:
+        app_label = 'mwbase'
+        unique_together = ('stage', 'date', 'day', 'hour')
+
+    stage = models.CharField(max_length=20, choices=STAGE_CHOICES)
+    date = models.DateField()
+    day = models.IntegerField()
+    hour = models.IntegerField()
+
+    # Counts and report lines for participants that did not get an item
+    summary = JSONField(default=dict)
+
+    def __str__(self):
+        return "{0.stage} {0.date} D:{0.day} H:{0.hour}".format(self)
+
+    @property
+    def is_started(self):
+        return self.items.exclude(status='pending').exists()
+
+    def pending(self):
+        return self.items.filter(status='pending').select_related('participant', 'visit')
+
+
+class SendPlanItem(TimeStampedModel):
+    """
+    A planned automated message: the rendered text for one participant (and visit for reminders)
+    """
+
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('error', 'Error'),
+    )
+
+    class Meta:
+        ordering = ('id',)
+        app_label = 'mwbase'
+
+    plan = models.ForeignKey(SendPlan, models.CASCADE, related_name='items')
+    participant = models.ForeignKey(swapper.get_model_name('mwbase', 'Participant'), models.CASCADE)
+    visit = models.ForeignKey(Visit, models.CASCADE, blank=True, null=True)
+
+    # Participant description used to find the AutomatedMessage
+    description = models.CharField(max_length=50)
+    auto = models.CharField(max_length=50)
+    text = models.TextField()
+    translated_text = models.TextField(blank=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+
+    def __str__(self):
+        return "{0.auto} ({0.status})".format(self)
+
+    def send(self, dispatcher=None, batch=None):
+        """ Send the planned text. Returns the new Message or a PendingSend when using a dispatcher
+            :param batch utils.batch.WriteBatch - if set database writes are added to batch
+        """
+        self.sending(batch)
+        return self.participant.send_message(text=self.text, dispatcher=dispatcher, batch=batch,
+                                             **self.message_fields())
+
+    @classmethod
+    def send_many(cls, items, dispatcher=None, batch=None):
+        """ Send the planned texts of items with one router.send_many call
+            Returns the new Messages in order or a PendingSend that resolves to them when using a dispatcher
+        """
+        for item in items:
+            item.sending(batch)
+        return send_many([(item.participant, item.text, item.message_fields()) for item in items],
+                         dispatcher=dispatcher, batch=batch)
+
+    def sending(self, batch=None):
+        """ Count a missed visit reminder and set last_msg_system before the text is sent """
+        if self.plan.stage == 'missed':
+            self.visit.missed_sms_sent(batch=batch)
+
+        self.participant.last_msg_system = utils.today()
+        if batch is not None:
+            batch.update(self.participant, 'last_msg_system', 'modified')
+        else:
+            self.participant.save()
+
+    def message_fields(self):
+        return {'translation_status': 'auto', 'auto': self.auto, 'translated_text': self.translated_text}
+
+    def record(self, status='sent', batch=None):
+        self.status = status
+        if batch is not None:
+            batch.update(self, 'status', 'modified')
+        else:
+            self.save(update_fields=('status', 'modified'))
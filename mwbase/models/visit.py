@@ -62,6 +62,10 @@ class ScheduledEvent(TimeStampedModel):
         abstract = True
         ordering = ('-scheduled',)
         app_label = 'mwbase'
+        indexes = [
+            models.Index(fields=['status', 'arrived', 'scheduled']),  # pending() and visit_range()
+            models.Index(fields=['modified']),  # changed_since()
+        ]
 
     scheduled = models.DateField()
     arrived = models.DateField(blank=True, null=True, default=None)
@@ -87,7 +91,7 @@ class ScheduledEvent(TimeStampedModel):
     def is_pregnant(self):
         return self.participant.was_pregnant(today=self.scheduled)
 
-    def seen(self, seen=None):
+    def seen(self, seen=None, batch=None):
         ''' Mark visit as seen today '''
         if seen is None:
             seen = utils.today()
@@ -96,23 +100,29 @@ class ScheduledEvent(TimeStampedModel):
 
         self.notify_count += 1
         self.notification_last_seen = seen
-        self.save()
+        if batch is not None:
+            batch.update(self, 'notify_count', 'notification_last_seen', 'modified')
+        else:
+            self.save()
 
-    def attended(self, arrived=None):
+    def attended(self, arrived=None, batch=None):
         ''' Mark visted as attended on @arrived (default today) '''
         if arrived is None:
             arrived = utils.today()
         else:
             arrived = utils.angular_datepicker(arrived)
 
-        self.set_status('attended', arrived)
+        self.set_status('attended', arrived, batch=batch)
 
-    def set_status(self, status, arrived=None):
+    def set_status(self, status, arrived=None, batch=None):
         ''' Mark scheduled event status '''
         if arrived is not None:
             self.arrived = arrived
         self.status = status
-        self.save()
+        if batch is not None:
+            batch.update(self, 'status', 'arrived', 'modified')
+        else:
+            self.save()
 
     def __str__(self):
         return str(self.scheduled)
@@ -179,42 +189,59 @@ class Visit(ScheduledEvent):
     missed_sms_last_sent = models.DateField(null=True, blank=True, default=None)
     missed_sms_count = models.IntegerField(default=0)
 
-    def send_visit_reminder(self, send=True, extra_kwargs=None):
+    def send_visit_reminder(self, send=True, extra_kwargs=None, dispatcher=None):
         if self.no_sms:
             return
 
         if extra_kwargs is None:
-            scheduled_date = datetime.date.today() + datetime.timedelta(days=2)
-            extra_kwargs = {'days': 2, 'date': scheduled_date.strftime('%b %d')}
+            extra_kwargs = self.reminder_kwargs()
         condition = self.get_condition('pre')
 
-        return self.participant.send_automated_message(send=send, send_base='visit',
-                                                       condition=condition, extra_kwargs=extra_kwargs)
+        return self.participant.send_automated_message(send=send, send_base='visit', condition=condition,
+                                                       extra_kwargs=extra_kwargs, dispatcher=dispatcher)
+
+    def reminder_kwargs(self):
+        scheduled_date = datetime.date.today() + datetime.timedelta(days=2)
+        return {'days': 2, 'date': scheduled_date.strftime('%b %d')}
 
-    def send_visit_attended_message(self, send=True):
+    def send_visit_attended_message(self, send=True, enqueue=False):
         if self.no_sms:
             return
 
         condition = self.get_condition('attend')
 
         message = self.participant.send_automated_message(send=send, send_base='visit',
-                                                          condition=condition, exact=True)
+                                                          condition=condition, exact=True, enqueue=enqueue)
 
-    def send_missed_visit_reminder(self, send=True):
+    def attended_send(self):
+        """ Return the (participant, text, fields) of the attended message for send_many or None """
+        if self.no_sms:
+            return None
+        return self.participant.automated_send(send_base='visit', condition=self.get_condition('attend'), exact=True)
+
+    def send_missed_visit_reminder(self, send=True, dispatcher=None):
         if self.no_sms:
             return
 
         condition = self.get_condition('missed')
 
         if send is True:
-            self.missed_sms_count += 1
-            self.missed_sms_last_sent = datetime.date.today()
-            if self.missed_sms_count >= 2:
-                self.status = 'missed'
+            self.missed_sms_sent()
+
+        return self.participant.send_automated_message(send=send, send_base='visit', condition=condition,
+                                                       dispatcher=dispatcher)
+
+    def missed_sms_sent(self, batch=None):
+        """ Count a missed visit reminder and mark the visit missed after the second one """
+        self.missed_sms_count += 1
+        self.missed_sms_last_sent = datetime.date.today()
+        if self.missed_sms_count >= 2:
+            self.status = 'missed'
+        if batch is not None:
+            batch.update(self, 'missed_sms_count', 'missed_sms_last_sent', 'status', 'modified')
+        else:
             self.save()
 
-        return self.participant.send_automated_message(send=send, send_base='visit', condition=condition)
-
     def get_condition(self, postfix='pre'):
         if self.is_pregnant():
             prefix = 'anc'
@@ -248,13 +275,14 @@ class ScheduledPhoneCall(ScheduledEvent):
 
     call_type = models.CharField(max_length=2, choices=CALL_TYPE_OPTIONS, default='m')
 
-    def called(self, outcome, created=None, length=None, comment=None, admin_user=None):
+    def called(self, outcome, created=None, length=None, comment=None, admin_user=None, batch=None):
+
+        # Make a new phone call for participant first so bad values fail before the event is changed
+        call = self.participant.add_call(created=created, outcome=outcome, length=length, comment=comment,
+                                         scheduled=self, admin_user=admin_user, batch=batch)
 
         if outcome == 'answered':
-            self.attended(created)
+            self.attended(created, batch=batch)
         else:
-            self.seen(created)
-
-        # Make a new phone call for participant
-        return self.participant.add_call(created=created, outcome=outcome, length=length, comment=comment,
-                                         scheduled=self, admin_user=admin_user)
+            self.seen(created, batch=batch)
+        return call
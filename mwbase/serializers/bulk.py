@@ -0,0 +1,55 @@
+# Django Imports
+from django.core.exceptions import ValidationError
+
+# Rest Framework Imports
+from rest_framework.exceptions import ParseError
+from rest_framework.response import Response
+
+# Local Imports
+import mwbase.models as mwbase
+from utils.batch import WriteBatch
+
+MAX_ITEMS = 1000
+
+
+def bulk_action(request, queryset, apply, event=None):
+    """ Run apply(obj, item, batch) for each {"id": ..} item in the request body in one transaction
+
+        apply saves through batch (bulk_update / bulk_create) and returns None or a dict added to the item's
+        result. KeyError, TypeError, ValueError and ValidationError mark just that item as failed, so apply must
+        check its values before queueing anything. event is an optional (EventLog event, data key) logged for each
+        applied item. Returns one compact result per item:
+        {"id": 1, "ok": true} or {"id": 2, "ok": false, "error": "not found"}
+    """
+    items = request.data
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ParseError('Expected a list of objects with an id')
+    if len(items) > MAX_ITEMS:
+        raise ParseError('At most {} items'.format(MAX_ITEMS))
+
+    objs = queryset.in_bulk([item['id'] for item in items if isinstance(item.get('id'), int)])
+    results = []
+    # One chunk so everything is written in one transaction
+    with WriteBatch(chunk_size=len(items) * 3 + 1) as batch:
+        for item in items:
+            obj = objs.get(item.get('id'))
+            if obj is None:
+                results.append({'id': item.get('id'), 'ok': False, 'error': 'not found'})
+                continue
+            payload = {key: value for key, value in item.items() if key != 'id'}
+            try:
+                result = apply(obj, payload, batch)
+            except KeyError as e:
+                results.append({'id': obj.pk, 'ok': False, 'error': 'missing {}'.format(e)})
+                continue
+            except (TypeError, ValueError) as e:
+                results.append({'id': obj.pk, 'ok': False, 'error': str(e)})
+                continue
+            except ValidationError as e:
+                results.append({'id': obj.pk, 'ok': False, 'error': ' '.join(e.messages)})
+                continue
+
+            if event is not None:
+                batch.create(mwbase.EventLog(user=request.user, event=event[0], data={event[1]: obj.pk}))
+            results.append(dict(result or {}, id=obj.pk, ok=True))
+    return Response(results)
@@ -0,0 +1,177 @@
+# Python Imports
+import base64
+import binascii
+import datetime
+import json
+
+# Django Imports
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+# Rest Framework Imports
+from rest_framework import serializers
+from rest_framework import viewsets
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+# Local Imports
+import mwbase.models as mwbase
+from .messages import MessageSimpleSerializer, ParticipantSimpleSerializer
+from .rows import MessageRows, ParticipantRows, VisitRows
+from .visits import VisitSimpleSerializer
+
+#Swappable Imports
+import swapper
+Participant = swapper.load_model("mwbase", "Participant")
+
+
+#############################################
+#  Serializer Definitions
+#############################################
+
+# Rows in the feed are flat and point to their participant by study_id
+
+class ParticipantChangeSerializer(ParticipantSimpleSerializer):
+
+    class Meta(ParticipantSimpleSerializer.Meta):
+        fields = ParticipantSimpleSerializer.Meta.fields + ('modified',)
+
+
+class MessageChangeSerializer(MessageSimpleSerializer):
+    participant = serializers.CharField(source='participant.study_id', default=None)
+
+    class Meta(MessageSimpleSerializer.Meta):
+        fields = MessageSimpleSerializer.Meta.fields + ('participant', 'modified')
+
+
+class VisitChangeSerializer(VisitSimpleSerializer):
+    participant = serializers.CharField(source='participant.study_id')
+
+    class Meta(VisitSimpleSerializer.Meta):
+        fields = VisitSimpleSerializer.Meta.fields + ('participant', 'modified')
+
+
+class ScheduledPhoneCallChangeSerializer(serializers.ModelSerializer):
+    participant = serializers.CharField(source='participant.study_id')
+
+    class Meta:
+        model = mwbase.ScheduledPhoneCall
+        fields = ('id', 'participant', 'scheduled', 'arrived', 'notification_last_seen', 'status',
+                  'call_type', 'days_overdue', 'notify_count', 'modified')
+
+
+class NoteChangeSerializer(serializers.ModelSerializer):
+    participant = serializers.CharField(source='participant.study_id')
+
+    class Meta:
+        model = mwbase.Note
+        fields = ('id', 'participant', 'admin', 'comment', 'created', 'modified')
+
+
+# The participant, message and visit feeds are built from .values() rows with the same output
+
+class ParticipantChangeRows(ParticipantRows):
+    serializer_class = ParticipantChangeSerializer
+    values = ParticipantRows.values + ('modified',)
+
+
+class MessageChangeRows(MessageRows):
+    serializer_class = MessageChangeSerializer
+    values = MessageRows.values + ('participant__study_id', 'modified')
+
+    def get_participant(self, row):
+        return row['participant__study_id']
+
+
+class VisitChangeRows(VisitRows):
+    serializer_class = VisitChangeSerializer
+    values = VisitRows.values + ('participant__study_id', 'modified')
+
+    def get_participant(self, row):
+        return row['participant__study_id']
+
+
+#############################################
+#  ViewSet Definitions
+#############################################
+
+class ChangesViewSet(viewsets.ViewSet):
+    """
+    Incremental sync: GET changes/?since=<token>&limit=N
+
+    Returns the participants, messages, visits, calls and notes of the user's facility modified since token
+    (everything without one) with up to limit rows of each. Pass the returned token as since on the next poll
+    and poll again straight away while more is true. The last CHANGES_OVERLAP seconds are sent again so rows
+    committed late are not missed; clients should update rows by id. Deleted rows are not reported.
+    """
+
+    feeds = (
+        ('participants', lambda user: ParticipantChangeRows.project(Participant.objects.for_user(user, superuser=True)),
+         ParticipantChangeRows),
+        ('messages', lambda user: MessageChangeRows.project(mwbase.Message.objects.for_user(user, superuser=True)),
+         MessageChangeRows),
+        ('visits', lambda user: VisitChangeRows.project(mwbase.Visit.objects.for_user(user, superuser=True)),
+         VisitChangeRows),
+        ('calls', lambda user: mwbase.ScheduledPhoneCall.objects.for_user(user, superuser=True).select_related(
+            'participant'), ScheduledPhoneCallChangeSerializer),
+        ('notes', lambda user: mwbase.Note.objects.for_user(user, superuser=True).select_related('participant'),
+         NoteChangeSerializer),
+    )
+
+    def list(self, request):
+        cursors = decode_token(request.query_params.get('since'))
+        limit = get_limit(request)
+        settled = (timezone.now() - datetime.timedelta(seconds=getattr(settings, 'CHANGES_OVERLAP', 10)), 0)
+
+        changes, next_cursors, more = {}, {}, False
+        for name, get_queryset, serializer_class in self.feeds:
+            cursor = cursors.get(name)
+            queryset = get_queryset(request.user)
+            changed = queryset.changed_since(*cursor) if cursor else queryset.changed_since()
+            rows = list(changed[:limit + 1])
+            if len(rows) > limit:
+                rows, more = rows[:limit], True
+                next_cursors[name] = row_cursor(rows[-1])
+            else:
+                # Caught up: hold the cursor back to the overlap so late commits are sent next time
+                caught_up = min(row_cursor(rows[-1]), settled) if rows else settled
+                next_cursors[name] = max(cursor, caught_up) if cursor else caught_up
+            changes[name] = serializer_class(rows, many=True, context={'request': request}).data
+
+        changes.update(token=encode_token(next_cursors), more=more)
+        return Response(changes)
+
+
+def row_cursor(row):
+    """ (modified, pk) of a model instance or a .values() row """
+    if isinstance(row, dict):
+        return row['modified'], row['id']
+    return row.modified, row.pk
+
+
+def get_limit(request):
+    limit = request.query_params.get('limit', getattr(settings, 'CHANGES_PAGE_SIZE', 500))
+    try:
+        return min(max(int(limit), 1), 1000)
+    except ValueError:
+        raise NotFound('Invalid limit')
+
+
+def encode_token(cursors):
+    cursors = {name: [modified.isoformat(), pk] for name, (modified, pk) in cursors.items()}
+    return base64.urlsafe_b64encode(json.dumps(cursors, sort_keys=True).encode('utf-8')).decode('ascii')
+
+
+def decode_token(token):
+    """ Return {feed name: (modified, pk)} for a token from encode_token. No token is an empty dict """
+    if not token:
+        return {}
+    try:
+        cursors = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        cursors = {name: (parse_datetime(modified), int(pk)) for name, (modified, pk) in cursors.items()}
+    except (AttributeError, TypeError, ValueError, binascii.Error):
+        raise NotFound('Invalid token')
+    if any(modified is None for modified, pk in cursors.values()):
+        raise NotFound('Invalid token')
+    return cursors
@@ -0,0 +1,73 @@
+# Python Imports
+import calendar
+import hashlib
+
+# Django Imports
+from django.db import models
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+import swapper
+
+# Local Imports
+import mwbase.models as mwbase
+from mwbase.models.interactions import interaction_counts
+import utils
+
+
+def queryset_validators(queryset, *related):
+    """ (last modified, row count) of queryset from one aggregate. The count changes the ETag on deletes
+
+        related are relations whose modified is also checked, e.g. 'participant' for a nested participant.
+    """
+    related_modified = {'{}_modified'.format(name): models.Max('{}__modified'.format(name)) for name in related}
+    state = queryset.order_by().aggregate(
+        modified=models.Max('modified'), count=models.Count('pk', distinct=bool(related)), **related_modified
+    )
+    count = state.pop('count')
+    last_modified = max((value for value in state.values() if value is not None), default=None)
+    return last_modified, count
+
+
+def participant_validators(study_id):
+    """ Validators for a participant detail: the participant, its counters and the newest message and visit
+
+        Counters are bumped with UPDATE so they do not change modified. The date is included since age and
+        the pending visits depend on it. Returns None if there is no participant.
+    """
+    Participant = swapper.load_model('mwbase', 'Participant')
+
+    def newest(model):
+        queryset = model.objects.filter(participant=models.OuterRef('pk')).order_by('-modified')
+        return models.Subquery(queryset.values('modified')[:1])
+
+    counters = list(interaction_counts())
+    state = Participant.objects_no_link.filter(study_id=study_id).annotate(
+        message_modified=newest(mwbase.Message), visit_modified=newest(mwbase.Visit)
+    ).values('modified', 'message_modified', 'visit_modified', *counters).first()
+    if state is None:
+        return None
+
+    last_modified = max(value for value in (state.pop('modified'), state.pop('message_modified'),
+                                            state.pop('visit_modified')) if value is not None)
+    return last_modified, utils.today(), sorted(state.items())
+
+
+def conditional_response(request, render, last_modified, *parts):
+    """ Return 304 Not Modified when the request's If-None-Match or If-Modified-Since match else render()
+
+        The ETag hashes last_modified with parts (anything else the payload depends on). render is only
+        called for a full response so unchanged resources are never serialized.
+    """
+    etag = '"{}"'.format(hashlib.md5(repr((last_modified,) + parts).encode('utf-8')).hexdigest())
+    timestamp = calendar.timegm(last_modified.utctimetuple()) if last_modified is not None else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = render()
+        if not 200 <= response.status_code < 300:
+            return response
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
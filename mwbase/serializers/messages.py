@@ -1,5 +1,4 @@
 # Rest Framework Imports
-from django.utils import timezone
 from rest_framework import serializers
 from rest_framework import viewsets
 from rest_framework.decorators import action
@@ -7,6 +6,9 @@ from rest_framework.response import Response
 
 # Local Imports
 import mwbase.models as mwbase
+import utils
+from .bulk import bulk_action
+from .conditional import conditional_response, queryset_validators
 
 #Swappable Imports
 import swapper
@@ -84,6 +86,20 @@ class MessageViewSet(viewsets.ModelViewSet):
     queryset = mwbase.Message.objects.all().select_related('connection', 'participant').prefetch_related(
         'participant__connection_set')
 
+    def list(self, request, *args, **kwargs):
+        render = lambda: super(MessageViewSet, self).list(request, *args, **kwargs)
+        return conditional_response(request, render, *queryset_validators(self.get_queryset(), 'participant'))
+
+    def retrieve(self, request, *args, **kwargs):
+        # The nested participant shows its next visit and age so those are part of the validators
+        render = lambda: super(MessageViewSet, self).retrieve(request, *args, **kwargs)
+        try:
+            message = self.get_queryset().filter(pk=kwargs['pk'])
+        except (TypeError, ValueError):
+            return render()  # Not found
+        return conditional_response(request, render, *queryset_validators(message, 'participant', 'participant__visit'),
+                                    utils.today())
+
     @action(methods=['put'], detail=True)
     def dismiss(self, request, pk, *args, **kwargs):
 
@@ -107,16 +123,26 @@ class MessageViewSet(viewsets.ModelViewSet):
     def translate(self, request, pk, *args, **kwargs):
 
         instance = self.get_object()
-        instance.translation_status = request.data['status']
-        instance.languages = request.data['languages']
-
-        if instance.translation_status == 'done':
-            instance.translated_text = request.data['text']
+        status = request.data['status']
+        instance.translate(status, request.data['languages'], request.data['text'] if status == 'done' else None)
 
-        # Set translation time to now if it is currently none
-        if instance.translation_time is None:
-            instance.translation_time = timezone.now()
-
-        instance.save()
         msg = MessageSerializer(instance, context={'request': request})
         return Response(msg.data)
+
+    ########################################
+    # Bulk actions: PUT a list of {"id": .., ..} items, see bulk.bulk_action
+    ########################################
+
+    @action(methods=['put'], detail=False)
+    def bulk_dismiss(self, request, *args, **kwargs):
+        """ [{"id": 1, "is_related": true, "topic": "..."}, ...] """
+        return bulk_action(request, self.get_queryset(), lambda message, item, batch: message.dismiss(batch=batch, **item),
+                           event=('message.dismissed', 'message_id'))
+
+    @action(methods=['put'], detail=False)
+    def bulk_translate(self, request, *args, **kwargs):
+        """ [{"id": 1, "status": "done", "languages": "...", "text": "..."}, ...] text is only needed when done """
+        def translate(message, item, batch):
+            status = item['status']
+            message.translate(status, item['languages'], item['text'] if status == 'done' else None, batch=batch)
+        return bulk_action(request, self.get_queryset(), translate, event=('message.translated', 'message_id'))
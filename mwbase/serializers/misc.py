@@ -1,14 +1,20 @@
+# Python Imports
+import math
+
 # From Django
+from django.conf import settings
 from django.urls import reverse
 # Rest Framework Imports
-from rest_framework import serializers
+from rest_framework import serializers, status
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
 # Local Imports
 import mwbase.models as mwbase
+from .bulk import bulk_action
 from .messages import MessageSerializer, ParticipantSimpleSerializer
+from .pagination import paginated_response
 from .visits import VisitSerializer
 
 
@@ -19,44 +25,70 @@ from .visits import VisitSerializer
 class PendingViewSet(viewsets.ViewSet):
 
     def list(self, request):
+        try:
+            pending_count = mwbase.PendingCount.objects.for_facility(request.user.practitioner.facility)
+        except mwbase.Practitioner.DoesNotExist:
+            pending_count = mwbase.PendingCount(facility='')  # No facility so nothing is pending
+        return self.pending_response(request, pending_count)
+
+    @action(detail=False)
+    def wait(self, request):
+        """ Long-poll: answer as soon as the counts differ from the If-None-Match ETag else 304 after ?timeout= """
+        etag = request.META.get('HTTP_IF_NONE_MATCH', '')
+        max_timeout = getattr(settings, 'PENDING_WAIT_TIMEOUT', 25)
+        try:
+            timeout = float(request.query_params.get('timeout', max_timeout))
+        except ValueError:
+            timeout = max_timeout
+        # nan would never time out
+        timeout = min(max(timeout, 0), max_timeout) if math.isfinite(timeout) else max_timeout
+
+        try:
+            pending_count = mwbase.PendingCount.objects.wait(request.user.practitioner.facility, etag, timeout)
+        except mwbase.Practitioner.DoesNotExist:
+            pending_count = mwbase.PendingCount(facility='')
+        return self.pending_response(request, pending_count)
+
+    def pending_response(self, request, pending_count):
+        # Dashboards poll this so unchanged counts are answered with a 304
+        headers = {'ETag': pending_count.etag, 'Cache-Control': 'private, no-cache'}
+        if request.META.get('HTTP_IF_NONE_MATCH') == pending_count.etag:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
         pending = {
             'message_url': request.build_absolute_uri(reverse('pending-messages')),
-            'messages': mwbase.Message.objects.for_user(request.user).pending().count(),
+            'messages': pending_count.messages,
 
-            'visits': mwbase.Visit.objects.for_user(request.user).get_visit_checks().count(),
+            'visits': pending_count.visits,
             'visits_url': request.build_absolute_uri(reverse('pending-visits')),
 
-            'calls': mwbase.ScheduledPhoneCall.objects.for_user(request.user).pending_calls().count(),
+            'calls': pending_count.calls,
             'calls_url': request.build_absolute_uri(reverse('pending-calls')),
 
-            'translations': mwbase.Message.objects.for_user(request.user).to_translate().count(),
+            'translations': pending_count.translations,
             'translations_url': request.build_absolute_uri(reverse('pending-translations')),
         }
-        return Response(pending)
+        return Response(pending, headers=headers)
 
     @action(detail=False)
     def messages(self, request):
         messages = mwbase.Message.objects.for_user(request.user).pending()
-        messages_seri = MessageSerializer(messages, many=True, context={'request': request})
-        return Response(messages_seri.data)
+        return paginated_response(request, messages, MessageSerializer)
 
     @action(detail=False)
     def visits(self, request):
         visit_checks = mwbase.Visit.objects.for_user(request.user).get_visit_checks()
-        serialized_visits = VisitSerializer(visit_checks, many=True, context={'request': request})
-        return Response(serialized_visits.data)
+        return paginated_response(request, visit_checks, VisitSerializer, ordering=('-scheduled', '-id'))
 
     @action(detail=False)
     def calls(self, request):
         calls_pending = mwbase.ScheduledPhoneCall.objects.for_user(request.user).pending_calls()
-        serialized_calls = PendingCallSerializer(calls_pending, many=True, context={'request': request})
-        return Response(serialized_calls.data)
+        return paginated_response(request, calls_pending, PendingCallSerializer, ordering=('-scheduled', '-id'))
 
     @action(detail=False)
     def translations(self, request):
         messages = mwbase.Message.objects.for_user(request.user).to_translate()
-        serialized_messages = MessageSerializer(messages, many=True, context={'request': request})
-        return Response(serialized_messages.data)
+        return paginated_response(request, messages, MessageSerializer)
 
 
 ########################################
@@ -110,3 +142,12 @@ class PendingCallViewSet(viewsets.ModelViewSet):
         new_call_serialized = PhoneCallSerializer(new_call, context={'request': request}).data
 
         return Response({'scheduled': instance_serialized, 'phonecall': new_call_serialized})
+
+    @action(methods=['put'], detail=False)
+    def bulk_called(self, request):
+        """ [{"id": 1, "outcome": "answered", "created": "2018-01-01", "length": 5, "comment": "..."}, ...] """
+        def called(call, item, batch):
+            call.called(admin_user=request.user, batch=batch, **item)
+
+        calls = self.get_queryset().select_related('participant').prefetch_related('participant__connection_set')
+        return bulk_action(request, calls, called, event=('call.called', 'call_id'))
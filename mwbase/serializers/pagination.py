@@ -0,0 +1,107 @@
+# Python Imports
+import base64
+import binascii
+import datetime
+import json
+
+# Django Imports
+from django.conf import settings
+from django.db import models
+
+# Rest Framework Imports
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(pagination.BasePagination):
+    """ Cursor pagination on the ordering fields that never counts the queryset
+
+        The response body stays a plain list so existing clients keep working. When there are more rows a
+        Link header points at the next page: <...?limit=50&cursor=...>; rel="next". The cursor is an opaque
+        encoding of the ordering values of the last row so each page is one indexed range query.
+
+        Pages have ?limit= rows (default settings.API_PAGE_SIZE). With neither the list is not paginated.
+        Set the default so lists don't grow with the cohort; clients follow the Link header for the rest.
+    """
+
+    ordering = ('-created', '-id')
+    limit_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    max_limit = 1000
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+        self.next_cursor = None
+
+    def get_limit(self, request):
+        limit = request.query_params.get(self.limit_query_param, getattr(settings, 'API_PAGE_SIZE', None))
+        if limit is None:
+            return None
+        try:
+            return min(max(int(limit), 1), self.max_limit)
+        except ValueError:
+            raise NotFound('Invalid limit')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        limit = self.get_limit(request)
+        if limit is None:
+            return None
+        self.request = request
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode_cursor(cursor)))
+
+        # One extra row tells if there is a next page without a COUNT
+        page = list(queryset[:limit + 1])
+        if len(page) > limit:
+            page = page[:limit]
+            self.next_cursor = self.encode_cursor(page[-1])
+        return page
+
+    def get_paginated_response(self, data):
+        headers = {}
+        if self.next_cursor is not None:
+            url = replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+            headers['Link'] = '<{}>; rel="next"'.format(url)
+        return Response(data, headers=headers)
+
+    def after(self, values):
+        """ Q for the rows after values in ordering: (a > x) OR (a = x AND b > y) ... """
+        after_Q, equal = models.Q(), {}
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = '{}__{}'.format(name, 'lt' if field.startswith('-') else 'gt')
+            after_Q |= models.Q(**equal, **{lookup: value})
+            equal[name] = value
+        return after_Q
+
+    def encode_cursor(self, obj):
+        # obj is a model instance or a .values() row
+        get = obj.get if isinstance(obj, dict) else lambda name: getattr(obj, name)
+        values = [get(field.lstrip('-')) for field in self.ordering]
+        values = [value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else value
+                  for value in values]
+        return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound('Invalid cursor')
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound('Invalid cursor')
+        return values
+
+
+def paginated_response(request, queryset, serializer_class, ordering=None):
+    """ Serialize one page of queryset (or all of it when not paginated) for a ViewSet action """
+    paginator = KeysetPagination(ordering)
+    page = paginator.paginate_queryset(queryset, request)
+    if page is None:
+        return Response(serializer_class(queryset, many=True, context={'request': request}).data)
+    return paginator.get_paginated_response(serializer_class(page, many=True, context={'request': request}).data)
@@ -3,6 +3,7 @@ import datetime
 import json
 
 # Django imports
+from django.conf import settings
 from django.utils import timezone
 from django.db import models, transaction
 
@@ -17,7 +18,10 @@ import mwbase.forms as forms
 import mwbase.models as mwbase
 import utils
 from .messages import MessageSerializer, ParticipantSimpleSerializer, MessageSimpleSerializer
+from .conditional import conditional_response, participant_validators, queryset_validators
 from .misc import PhoneCallSerializer, NoteSerializer
+from .pagination import KeysetPagination, paginated_response
+from .rows import MessageRows, ParticipantRows
 from .visits import VisitSimpleSerializer, VisitSerializer
 
 #Swappable Imports
@@ -53,43 +57,26 @@ class ParticipantSerializer(serializers.ModelSerializer):
     recent_messages = MessageSimpleSerializer(source='get_recent_messages',many=True)
     visits = VisitSimpleSerializer(source='pending_visits', many=True)
 
-    phonecall_count = serializers.SerializerMethodField()
-    note_count = serializers.SerializerMethodField()
-    message_count = serializers.SerializerMethodField()
-
     class Meta:
         model = mwbase.Participant
         fields = '__all__'
 
-    def get_note_count(self, obj):
-        try:
-            return getattr(obj, 'note_count')
-        except AttributeError as e:
-            return obj.note_set.count()
-
-    def get_phonecall_count(self, obj):
-        try:
-            return getattr(obj, 'phonecall_count')
-        except AttributeError as e:
-            return obj.phonecall_set.count()
-
-    def get_message_count(self, obj):
-        try:
-            return getattr(obj, 'message_count')
-        except AttributeError as e:
-            return obj.message_set.count()
-
 
 #############################################
 #  ViewSet Definitions
 #############################################
 
+class ParticipantPagination(KeysetPagination):
+    ordering = ('study_id',)
+
+
 class ParticipantViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows users to be viewed or edited.
     """
     forms = forms
     lookup_field = 'study_id'
+    pagination_class = ParticipantPagination
 
     def get_queryset(self):
         qs = Participant.objects.all().order_by('study_id')
@@ -107,6 +94,23 @@ class ParticipantViewSet(viewsets.ModelViewSet):
         else:
             return ParticipantSerializer
 
+    def list(self, request, *args, **kwargs):
+        ''' GET - the facility's participants built from .values() rows, see rows.ParticipantRows '''
+        queryset = ParticipantRows.project(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        context = self.get_serializer_context()
+        if page is None:
+            return Response(ParticipantRows(queryset, many=True, context=context).data)
+        return self.get_paginated_response(ParticipantRows(page, many=True, context=context).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        ''' GET - a participant or 304 Not Modified if nothing in it has changed '''
+        validators = participant_validators(kwargs[self.lookup_field])
+        render = lambda: super(ParticipantViewSet, self).retrieve(request, *args, **kwargs)
+        if validators is None:
+            return render()  # Not found
+        return conditional_response(request, render, *validators)
+
     ########################################
     # Overide Router POST, PUT, PATCH
     ########################################
@@ -159,7 +163,8 @@ class ParticipantViewSet(viewsets.ModelViewSet):
 
                 # Send Welcome Message
                 participant.send_automated_message(send_base='signup', send_offset=0,
-                                                   control=True, hiv_messaging=False)
+                                                   control=True, hiv_messaging=False,
+                                                   enqueue=getattr(settings, 'SMS_OUTBOX', False))
 
             participant.pending_visits = participant.visit_set.order_by('scheduled').filter(arrived__isnull=True,
                                                                                             status='pending')
@@ -188,8 +193,7 @@ class ParticipantViewSet(viewsets.ModelViewSet):
     @action(methods=['post', 'get'], detail=True)
     def messages(self, request, study_id=None, *args, **kwargs):
         if request.method == 'GET':
-            # Get Query Parameters
-            limit = request.query_params.get('limit', None)
+            # Get Query Parameters. limit is the page size and max_id / min_id are kept for old clients
             max_id = request.query_params.get('max_id', None)
             min_id = request.query_params.get('min_id', None)
 
@@ -199,14 +203,10 @@ class ParticipantViewSet(viewsets.ModelViewSet):
                 participant_Q &= models.Q(pk__lte=int(max_id))
             if min_id is not None:
                 participant_Q &= models.Q(pk__gte=int(min_id))
-            if limit is not None:
-                limit = int(limit)
 
-            participant_messages = mwbase.Message.objects.filter(participant_Q).select_related(
-                'connection__participant', 'participant'
-                ).prefetch_related('participant__connection_set')[:limit]
-            participant_messages = MessageSimpleSerializer(participant_messages, many=True, context={'request': request})
-            return Response(participant_messages.data)
+            participant_messages = mwbase.Message.objects.filter(participant_Q)
+            render = lambda: paginated_response(request, MessageRows.project(participant_messages), MessageRows)
+            return conditional_response(request, render, *queryset_validators(participant_messages))
 
         elif request.method == 'POST':
             '''A POST to participant/:study_id:/messages sends a new message to that participant'''
@@ -233,7 +233,7 @@ class ParticipantViewSet(viewsets.ModelViewSet):
                     message['parent'].dismiss(**request.data['reply'])
                 message['parent'].save()
 
-            new_message = participant.send_message(**message)
+            new_message = participant.send_message(enqueue=getattr(settings, 'SMS_OUTBOX', False), **message)
 
             return Response(MessageSerializer(new_message, context={'request': request}).data)
 
@@ -241,8 +241,8 @@ class ParticipantViewSet(viewsets.ModelViewSet):
     def calls(self, request, study_id=None):
         if request.method == 'GET':  # Return serialized call history
             call_history = mwbase.PhoneCall.objects.filter(participant__study_id=study_id)
-            call_serialized = PhoneCallSerializer(call_history, many=True, context={'request': request})
-            return Response(call_serialized.data)
+            render = lambda: Response(PhoneCallSerializer(call_history, many=True, context={'request': request}).data)
+            return conditional_response(request, render, *queryset_validators(call_history))
         elif request.method == 'POST':  # Save a new call
             participant = self.get_object()
             new_call = participant.add_call(**request.data)
@@ -253,10 +253,13 @@ class ParticipantViewSet(viewsets.ModelViewSet):
     def visits(self, request, study_id=None, *args, **kwargs):
         if request.method == 'GET':  # Return a serialized list of all visits
 
-            instance = self.get_object()
-            visits = instance.visit_set.exclude(status='deleted')
-            visits_serialized = VisitSerializer(visits, many=True, context={'request': request})
-            return Response(visits_serialized.data)
+            # Visits include the participant and days overdue so they share the participant's validators
+            validators = participant_validators(study_id)
+            if validators is None:
+                self.get_object()  # Not found
+            visits = mwbase.Visit.objects.filter(participant__study_id=study_id).exclude(status='deleted')
+            render = lambda: Response(VisitSerializer(visits, many=True, context={'request': request}).data)
+            return conditional_response(request, render, *validators)
 
         elif request.method == 'POST':  # Schedual a new visit
 
@@ -272,8 +275,8 @@ class ParticipantViewSet(viewsets.ModelViewSet):
         if request.method == 'GET':  # Return a serialized list of all notes
 
             notes = mwbase.Note.objects.filter(participant__study_id=study_id)
-            notes_serialized = NoteSerializer(notes, many=True, context={'request', request})
-            return Response(notes_serialized.data)
+            render = lambda: Response(NoteSerializer(notes, many=True, context={'request', request}).data)
+            return conditional_response(request, render, *queryset_validators(notes))
 
         elif request.method == 'POST':  # Add a new note
 
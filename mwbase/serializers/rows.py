@@ -0,0 +1,179 @@
+# Python Imports
+import operator
+from urllib.parse import quote
+
+# Django Imports
+from django.db import models
+
+# Rest Framework Imports
+from rest_framework import serializers
+
+# Local Imports
+import mwbase.models as mwbase
+import utils
+from utils import enums
+from .messages import MessageSimpleSerializer, ParticipantSimpleSerializer
+from .visits import VisitSimpleSerializer
+
+# Characters reverse() leaves unquoted in url arguments
+URL_SAFE = "!$&'()*+,;=/~:@"
+URL_MARKER = 'ROWURLMARKER'
+
+
+class RowSerializer(object):
+    """
+    Read-only list serializer giving the same output as serializer_class from .values() rows
+
+    Use as RowSerializer(project(queryset), many=True, context={'request': request}).data. Fields named in
+    values are passed to the serializer's own field so dates and the like are formatted the same. Other fields
+    are read by a get_<name>(row) method using the url prefixes and choice labels set up once in prepare().
+    """
+
+    serializer_class = None
+    values = ()
+
+    def __init__(self, instance=None, many=True, context=None):
+        self.instance = instance
+        self.context = context or {}
+
+    @classmethod
+    def annotations(cls):
+        return {}
+
+    @classmethod
+    def project(cls, queryset):
+        """ queryset as the rows this serializer reads. Prefetches are dropped since they need instances """
+        annotations = cls.annotations()
+        return queryset.prefetch_related(None).annotate(**annotations).values(*cls.values, *annotations)
+
+    @property
+    def data(self):
+        fields = self.serializer_class(context=self.context).fields
+        self.prepare(fields)
+        columns = [(name, self.column(name, field)) for name, field in fields.items() if not field.write_only]
+        return [{name: column(row) for name, column in columns} for row in self.instance]
+
+    def prepare(self, fields):
+        pass
+
+    def column(self, name, field):
+        get = getattr(self, 'get_{}'.format(name), None) or operator.itemgetter(name)
+        if isinstance(field, (serializers.SerializerMethodField, serializers.HyperlinkedIdentityField)):
+            return get
+        to_representation = field.to_representation
+
+        def column(row):
+            value = get(row)
+            return None if value is None else to_representation(value)
+        return column
+
+    def url(self, field):
+        """ Return a function from lookup value to the url of a HyperlinkedIdentityField with one reverse() """
+        format = self.context.get('format')
+        if format and field.format and field.format != format:
+            format = field.format
+        url = field.reverse(field.view_name, kwargs={field.lookup_url_kwarg: URL_MARKER},
+                            request=self.context.get('request'), format=format)
+        prefix, suffix = url.split(URL_MARKER)
+        return lambda value: None if value in (None, '') else prefix + quote(str(value), safe=URL_SAFE) + suffix
+
+    def labels(self, name):
+        """ Return a function from value to label like get_<name>_display() for a model field with choices """
+        field = self.serializer_class.Meta.model._meta.get_field(name)
+        labels = {value: str(label) for value, label in field.flatchoices}
+        return lambda value: labels.get(value, value)
+
+
+class ParticipantRows(RowSerializer):
+    serializer_class = ParticipantSimpleSerializer
+    values = ('id', 'display_name', 'study_id', 'study_group', 'anc_num', 'preg_status', 'sms_status', 'due_date',
+              'delivery_date', 'last_msg_client')
+
+    @classmethod
+    def annotations(cls):
+        connections = mwbase.Connection.objects.filter(participant=models.OuterRef('pk'), is_primary=True)
+        visits = mwbase.Visit.objects.pending().filter(participant=models.OuterRef('pk')).order_by('scheduled', 'id')
+        return {
+            'phone_number': models.Subquery(connections.values('identity')[:1], output_field=models.CharField()),
+            'next_visit_date': models.Subquery(visits.values('scheduled')[:1], output_field=models.DateField()),
+            'next_visit_type': models.Subquery(visits.values('visit_type')[:1], output_field=models.CharField()),
+        }
+
+    def prepare(self, fields):
+        self.href_url = self.url(fields['href'])
+        self.status_label = self.labels('preg_status')
+        self.sms_status_label = self.labels('sms_status')
+        self.study_group_label = self.labels('study_group')
+
+    def get_href(self, row):
+        return self.href_url(row['study_id'])
+
+    def get_status(self, row):
+        return self.status_label(row['preg_status'])
+
+    def get_sms_status(self, row):
+        return self.sms_status_label(row['sms_status'])
+
+    def get_study_group(self, row):
+        return self.study_group_label(row['study_group'])
+
+    def get_active(self, row):
+        if row['sms_status'] in enums.NOT_ACTIVE_STATUS:
+            return 'sms'
+        if row['preg_status'] in enums.NOT_ACTIVE_STATUS:
+            return 'preg'
+        return 'active'
+
+    def get_study_base_date(self, row):
+        return row['delivery_date'] or row['due_date']
+
+    def get_next_visit_type(self, row):
+        return 'none' if row['next_visit_date'] is None else row['next_visit_type']
+
+
+class MessageRows(RowSerializer):
+    serializer_class = MessageSimpleSerializer
+    values = ('id', 'text', 'translated_text', 'translation_status', 'is_outgoing', 'is_viewed', 'is_system',
+              'is_related', 'topic', 'created', 'external_status', 'auto')
+
+    def prepare(self, fields):
+        self.href_url = self.url(fields['href'])
+
+    def get_href(self, row):
+        return self.href_url(row['id'])
+
+    def get_is_pending(self, row):
+        return not row['is_viewed'] and not row['is_outgoing']
+
+    def get_sent_by(self, row):
+        if row['is_outgoing']:
+            return 'system' if row['is_system'] else 'nurse'
+        return 'participant'
+
+
+class VisitRows(RowSerializer):
+    serializer_class = VisitSimpleSerializer
+    values = ('id', 'scheduled', 'arrived', 'notification_last_seen', 'status', 'comment', 'visit_type')
+
+    def prepare(self, fields):
+        self.href_url = self.url(fields['href'])
+        self.status_label = self.labels('status')
+        self.visit_type_label = self.labels('visit_type')
+        self.today = utils.today()
+
+    def get_href(self, row):
+        return self.href_url(row['id'])
+
+    def get_status(self, row):
+        return self.status_label(row['status'])
+
+    def get_visit_type_display(self, row):
+        return self.visit_type_label(row['visit_type'])
+
+    def get_days_overdue(self, row):
+        return (self.today - row['scheduled']).days if row['status'] == 'pending' else 0
+
+    def get_days_str(self, row):
+        if row['status'] == 'attended' and row['arrived'] is not None:
+            return utils.days_as_str((self.today - row['arrived']).days)
+        return utils.days_as_str(-1 * (self.today - row['scheduled']).days)
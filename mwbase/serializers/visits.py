@@ -1,5 +1,8 @@
 # Python Imports
 
+# Django Imports
+from django.conf import settings
+
 # Rest Framework Imports
 from rest_framework import serializers
 from rest_framework import viewsets
@@ -8,7 +11,9 @@ from rest_framework.response import Response
 
 # Local Imports
 import mwbase.models as mwbase
+from mwbase.models.participants import send_many
 import utils
+from .bulk import bulk_action
 from .messages import ParticipantSimpleSerializer
 
 
@@ -87,7 +92,7 @@ class VisitViewSet(viewsets.ModelViewSet):
             next_visit_serialized = VisitSerializer(next_visit, context={'request': request}).data
 
         # send visit attended reminder
-        instance.send_visit_attended_message()
+        instance.send_visit_attended_message(enqueue=getattr(settings, 'SMS_OUTBOX', False))
 
         mwbase.EventLog.objects.create(user=request.user, event='visit.attended', data={'visit_id': instance.id})
         return Response({'visit': instance_serialized, 'next': next_visit_serialized})
@@ -116,3 +121,45 @@ class VisitViewSet(viewsets.ModelViewSet):
 
         instance_serialized = self.get_serializer(instance)
         return Response(instance_serialized.data)
+
+    ########################################
+    # Bulk actions: PUT a list of {"id": .., ..} items, see bulk.bulk_action
+    ########################################
+
+    @action(methods=['put'], detail=False)
+    def bulk_seen(self, request):
+        """ [{"id": 1, "seen": "2018-01-01"}, ...] seen defaults to today """
+        return bulk_action(request, self.get_queryset(), lambda visit, item, batch: visit.seen(item.get('seen'), batch),
+                           event=('visit.seen', 'visit_id'))
+
+    @action(methods=['put'], detail=False)
+    def bulk_attended(self, request):
+        """ [{"id": 1, "arrived": "2018-01-01", "next": "2018-02-01", "type": "clinic"}, ...]
+            arrived defaults to today and a next visit is made when next and type are given
+        """
+        attended = []
+
+        def attend(visit, item, batch):
+            next_visit = None
+            if 'next' in item:
+                next_visit = mwbase.Visit(participant=visit.participant, visit_type=item['type'],
+                                          scheduled=utils.angular_datepicker(item['next']))
+            visit.attended(item.get('arrived'), batch)
+            if next_visit is not None:
+                batch.create(next_visit)
+            attended.append(visit)
+
+        visits = self.get_queryset().select_related('participant').prefetch_related('participant__connection_set')
+        response = bulk_action(request, visits, attend,
+                               event=('visit.attended', 'visit_id'))
+
+        # Reminders are sent once the visits are saved, with one transport call for all of them
+        sends = [send for send in (visit.attended_send() for visit in attended) if send is not None]
+        send_many(sends, enqueue=getattr(settings, 'SMS_OUTBOX', False))
+        return response
+
+    @action(methods=['put'], detail=False)
+    def bulk_missed(self, request):
+        """ [{"id": 1}, ...] """
+        return bulk_action(request, self.get_queryset(), lambda visit, item, batch: visit.set_status('missed', batch=batch),
+                           event=('visit.missed', 'visit_id'))
@@ -0,0 +1,86 @@
+# Python Imports
+from unittest import mock
+
+# Django Imports
+from django import test
+from django.contrib.auth.models import User
+
+# Local Imports
+from mwbase.models import AutomatedMessage, Practitioner
+from utils.batch import WriteBatch
+
+
+class AutomatedMessageIndexTests(test.TestCase):
+
+    def setUp(self):
+        # The index is process wide and test transactions are rolled back without signals
+        AutomatedMessage.objects.invalidate_index()
+        self.normal = AutomatedMessage.objects.create(send_base='edd', send_offset=4, group='one-way',
+                                                      condition='normal', english='normal')
+        self.art = AutomatedMessage.objects.create(send_base='edd', send_offset=4, group='two-way',
+                                                   condition='art', english='art')
+
+    def test_fallback(self):
+        self.assertEqual(AutomatedMessage.objects.from_description('edd.two-way.art.4'), self.art)
+        # condition normal -> group one-way
+        self.assertEqual(AutomatedMessage.objects.from_description('edd.two-way.normal.4'), self.normal)
+        # condition and group forced to normal one-way
+        self.assertEqual(AutomatedMessage.objects.from_description('edd.two-way.first.4'), self.normal)
+        self.assertIsNone(AutomatedMessage.objects.from_description('edd.two-way.first.4', exact=True))
+        self.assertIsNone(AutomatedMessage.objects.from_description('dd.one-way.normal.4'))
+
+    def test_no_queries_once_loaded(self):
+        AutomatedMessage.objects.from_description('edd.one-way.normal.4')
+        with self.assertNumQueries(0):
+            for offset in range(10):
+                AutomatedMessage.objects.from_description('edd.two-way.first.{}'.format(offset))
+
+    def test_updated_on_save_and_delete(self):
+        self.assertEqual(AutomatedMessage.objects.from_description('edd.two-way.first.4'), self.normal)
+
+        first = AutomatedMessage.objects.create(send_base='edd', send_offset=4, group='two-way',
+                                                condition='first', english='first')
+        self.assertEqual(AutomatedMessage.objects.from_description('edd.two-way.first.4'), first)
+
+        first.send_offset = 5
+        first.save()
+        self.assertEqual(AutomatedMessage.objects.from_description('edd.two-way.first.4'), self.normal)
+        self.assertEqual(AutomatedMessage.objects.from_description('edd.two-way.first.5'), first)
+
+        first.delete()
+        self.assertIsNone(AutomatedMessage.objects.from_description('edd.two-way.first.5'))
+
+    def test_from_excel_failed_import(self):
+        # Batched changes are not in the index before they are saved
+        msg = mock.Mock(english='changed', swahili='', luo='', new='',
+                        **{'description.return_value': 'edd.two-way.art.4'})
+        with self.assertRaises(ValueError), WriteBatch() as batch:
+            auto, status = AutomatedMessage.objects.from_excel(msg, batch=batch)
+            self.assertEqual((auto.english, status), ('changed', 'changed'))
+            raise ValueError('import failed')
+        self.assertEqual(AutomatedMessage.objects.from_description('edd.two-way.art.4').english, 'art')
+
+
+class NurseNameCacheTests(test.TestCase):
+
+    def setUp(self):
+        Practitioner.objects.nurse_names()  # Load before the test data to check invalidation
+        self.user = User.objects.create_user('nurse', first_name='jane')
+        Practitioner.objects.create(user=self.user, facility='bondo')
+
+    def test_names(self):
+        self.assertEqual(Practitioner.objects.nurse_name('bondo'), 'Jane')
+        self.assertEqual(Practitioner.objects.nurse_name('ahero'), 'Nurse')
+        with self.assertNumQueries(0):
+            Practitioner.objects.nurse_name('bondo')
+
+    def test_invalidated_by_first_name(self):
+        self.assertEqual(Practitioner.objects.nurse_name('bondo'), 'Jane')
+
+        self.user.save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            Practitioner.objects.nurse_name('bondo')
+
+        self.user.first_name = 'mary'
+        self.user.save()
+        self.assertEqual(Practitioner.objects.nurse_name('bondo'), 'Mary')
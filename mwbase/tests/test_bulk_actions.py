@@ -0,0 +1,144 @@
+# Python Imports
+import datetime
+import json
+from unittest import mock
+
+# Django Imports
+from django import test
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+import swapper
+
+# Local Imports
+import utils
+from mwbase.models import (AutomatedMessage, Connection, EventLog, Message, PendingCount, PhoneCall, Practitioner,
+                           ScheduledPhoneCall, Visit)
+from transports import router
+
+Participant = swapper.load_model('mwbase', 'Participant')
+
+
+class BulkActionTests(test.TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('nurse', password='nurse')
+        Practitioner.objects.create(user=user, facility='bondo')
+        self.client.login(username='nurse', password='nurse')
+
+        self.participant = Participant.objects.create(
+            study_id='0001', anc_num='1', facility='bondo', study_group='control', sms_name='Jane',
+            display_name='Jane', birthdate=datetime.date(1990, 1, 1), due_date=datetime.date(2020, 1, 1)
+        )
+        self.connection = Connection.objects.create(identity='+254700000001', participant=self.participant,
+                                                    is_primary=True)
+        self.today = utils.today()
+
+    def put(self, name, items):
+        response = self.client.put(reverse(name), json.dumps(items), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_dismiss_and_translate(self):
+        messages = [Message.objects.create(text='Hello {}'.format(i), is_outgoing=False, is_system=False,
+                                           connection=self.connection, participant=self.participant) for i in range(3)]
+        pending = PendingCount.objects.for_facility('bondo')
+        self.assertEqual(pending.messages, 3)
+
+        results = self.put('message-bulk-dismiss', [{'id': messages[0].pk, 'topic': 'visits'},
+                                                     {'id': messages[1].pk}, {'id': 0}])
+        self.assertEqual([r['ok'] for r in results], [True, True, False])
+        self.assertEqual(results[2]['error'], 'not found')
+        self.assertEqual(Message.objects.get(pk=messages[0].pk).topic, 'visits')
+        # Bulk updates mark the pending counts stale
+        self.assertEqual(PendingCount.objects.for_facility('bondo').messages, 1)
+
+        results = self.put('message-bulk-translate', [
+            {'id': messages[0].pk, 'status': 'done', 'languages': 'english', 'text': 'Hi'},
+            {'id': messages[1].pk, 'status': 'done', 'languages': 'english'},
+        ])
+        self.assertEqual(results[1], {'id': messages[1].pk, 'ok': False, 'error': "missing 'text'"})
+        message = Message.objects.get(pk=messages[0].pk)
+        self.assertEqual((message.translation_status, message.translated_text), ('done', 'Hi'))
+        self.assertIsNotNone(message.translation_time)
+        self.assertEqual(Message.objects.get(pk=messages[1].pk).translation_status, 'todo')
+
+        logged = [(log.event, log.data) for log in EventLog.objects.order_by('id')]
+        self.assertEqual(logged, [('message.dismissed', {'message_id': messages[0].pk}),
+                                        ('message.dismissed', {'message_id': messages[1].pk}),
+                                        ('message.translated', {'message_id': messages[0].pk})])
+
+    def test_visits(self):
+        visits = [self.participant.visit_set.create(scheduled=self.today, visit_type='clinic') for i in range(3)]
+
+        with CaptureQueriesContext(connection) as queries:
+            self.put('visit-bulk-seen', [{'id': visit.pk} for visit in visits])
+        # One bulk_update, one EventLog insert and marking the pending counts stale
+        writes = [query['sql'].split()[0] for query in queries if query['sql'].split()[0] in ('INSERT', 'UPDATE')]
+        self.assertEqual(writes, ['INSERT', 'UPDATE', 'UPDATE'])
+        self.assertEqual(set(Visit.objects.values_list('notify_count', 'notification_last_seen')), {(1, self.today)})
+        self.assertEqual(EventLog.objects.filter(event='visit.seen').count(), 3)
+
+        next_visit = (self.today + datetime.timedelta(days=30)).strftime('%Y-%m-%d')
+        results = self.put('visit-bulk-attended', [{'id': visits[0].pk, 'next': next_visit, 'type': 'clinic'},
+                                                   {'id': visits[1].pk, 'next': next_visit}])
+        self.assertEqual([r['ok'] for r in results], [True, False])
+        self.assertEqual(Visit.objects.get(pk=visits[0].pk).status, 'attended')
+        self.assertEqual(Visit.objects.get(pk=visits[1].pk).status, 'pending')
+        self.assertEqual(self.participant.visit_set.filter(status='pending').count(), 3)
+
+        self.put('visit-bulk-missed', [{'id': visits[2].pk}])
+        self.assertEqual(Visit.objects.get(pk=visits[2].pk).status, 'missed')
+        self.assertEqual(EventLog.objects.get(event='visit.missed').data, {'visit_id': visits[2].pk})
+
+    def test_attended_sent_together(self):
+        AutomatedMessage.objects.invalidate_index()
+        AutomatedMessage.objects.create(send_base='visit', send_offset=0, group='two-way', condition='anc_attend',
+                                        english='Thank you {name}')
+        Participant.objects.filter(pk=self.participant.pk).update(study_group='two-way')
+        other = Participant.objects.create(
+            study_id='0002', anc_num='2', facility='bondo', study_group='two-way', sms_name='Mary',
+            display_name='Mary', birthdate=datetime.date(1990, 1, 1), due_date=datetime.date(2020, 1, 1)
+        )
+        Connection.objects.create(identity='+254700000002', participant=other, is_primary=True)
+        visits = [participant.visit_set.create(scheduled=self.today, visit_type='clinic')
+                  for participant in Participant.objects.order_by('study_id')]
+
+        results = [('ATXid_1', True, {}), ('ATXid_2', True, {})]
+        with mock.patch.object(router, 'send_many', return_value=results) as send_many:
+            self.put('visit-bulk-attended', [{'id': visit.pk} for visit in visits])
+        send_many.assert_called_once_with([('+254700000001', 'Thank you Jane'), ('+254700000002', 'Thank you Mary')])
+
+        messages = Message.objects.filter(is_outgoing=True).order_by('external_id')
+        self.assertEqual([(m.participant_id, m.auto, m.external_status) for m in messages],
+                         [(self.participant.pk, 'visit.two-way.anc_attend.0', 'Sent'),
+                          (other.pk, 'visit.two-way.anc_attend.0', 'Sent')])
+
+    def test_called(self):
+        calls = [ScheduledPhoneCall.objects.create(participant=self.participant, scheduled=self.today, call_type='m'),
+                 ScheduledPhoneCall.objects.create(participant=self.participant, scheduled=self.today, call_type='y')]
+        results = self.put('pending-call-bulk-called', [{'id': calls[0].pk, 'outcome': 'answered'},
+                                                        {'id': calls[1].pk, 'outcome': 'no_answer', 'length': 1}])
+        self.assertEqual([r['ok'] for r in results], [True, True])
+        self.assertEqual([ScheduledPhoneCall.objects.get(pk=call.pk).status for call in calls], ['attended', 'pending'])
+        self.assertEqual(PhoneCall.objects.filter(participant=self.participant, connection=self.connection).count(), 2)
+        self.participant.refresh_from_db()
+        self.assertEqual(self.participant.phonecall_count, 2)
+        self.assertEqual(EventLog.objects.filter(event='call.called').count(), 2)
+
+    def test_called_bad_values(self):
+        calls = [ScheduledPhoneCall.objects.create(participant=self.participant, scheduled=self.today, call_type='m')
+                 for _ in range(3)]
+        results = self.put('pending-call-bulk-called', [{'id': calls[0].pk, 'outcome': 'answered', 'length': 'abc'},
+                                                        {'id': calls[1].pk, 'outcome': 'hung_up'},
+                                                        {'id': calls[2].pk, 'outcome': 'answered', 'length': '3'}])
+        self.assertEqual([r['ok'] for r in results], [False, False, True])
+        # The failed items changed nothing
+        self.assertEqual([ScheduledPhoneCall.objects.get(pk=call.pk).status for call in calls],
+                         ['pending', 'pending', 'attended'])
+        self.assertEqual(list(PhoneCall.objects.values_list('scheduled_id', 'length')), [(calls[2].pk, 3)])
+
+    def test_bad_body(self):
+        response = self.client.put(reverse('visit-bulk-seen'), json.dumps({'id': 1}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
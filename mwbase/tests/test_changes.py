@@ -0,0 +1,91 @@
+# Python Imports
+import datetime
+
+# Django Imports
+from django import test
+from django.contrib.auth.models import User
+from django.urls import reverse
+import swapper
+
+# Local Imports
+from mwbase.models import Connection, Message, Note, Practitioner
+from transports import router
+
+Participant = swapper.load_model('mwbase', 'Participant')
+
+
+@test.utils.override_settings(CHANGES_OVERLAP=0)
+class ChangesFeedTests(test.TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('nurse', password='nurse')
+        Practitioner.objects.create(user=user, facility='bondo')
+        self.client.login(username='nurse', password='nurse')
+
+        self.participant = self.create_participant('0001', 'bondo')
+        self.other = self.create_participant('0002', 'ahero')
+        for i in range(5):
+            self.receive(self.participant, 'Hello {}'.format(i))
+        self.receive(self.other, 'Other facility')
+
+    def create_participant(self, study_id, facility):
+        participant = Participant.objects.create(
+            study_id=study_id, anc_num=study_id, facility=facility, study_group='two-way', sms_name='Jane',
+            display_name='Jane', birthdate=datetime.date(1990, 1, 1), due_date=datetime.date(2020, 1, 1)
+        )
+        participant.test_connection = Connection.objects.create(identity='+25470000' + study_id, participant=participant)
+        return participant
+
+    def receive(self, participant, text):
+        return Message.objects.create(text=text, is_outgoing=False, connection=participant.test_connection,
+                                      participant=participant)
+
+    def get_changes(self, since=None, **params):
+        if since is not None:
+            params['since'] = since
+        response = self.client.get(reverse('changes-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_sync(self):
+        changes = self.get_changes()
+        self.assertEqual([p['study_id'] for p in changes['participants']], ['0001'])
+        self.assertEqual([m['text'] for m in changes['messages']], ['Hello {}'.format(i) for i in range(5)])
+        self.assertFalse(changes['more'])
+
+        # Nothing new since the token
+        token = changes['token']
+        changes = self.get_changes(token)
+        self.assertEqual(sum(len(changes[name]) for name in ('participants', 'messages', 'visits', 'calls', 'notes')), 0)
+
+        message = Message.objects.get(text='Hello 2')
+        message.dismiss()
+        Note.objects.create(participant=self.participant, comment='Called')
+        changes = self.get_changes(token)
+        self.assertEqual([(m['text'], m['participant']) for m in changes['messages']], [('Hello 2', '0001')])
+        self.assertEqual([n['comment'] for n in changes['notes']], ['Called'])
+
+    def test_paging(self):
+        texts, token, more = [], None, True
+        while more:
+            changes = self.get_changes(token, limit=2)
+            texts += [m['text'] for m in changes['messages']]
+            token, more = changes['token'], changes['more']
+        self.assertEqual(texts, ['Hello {}'.format(i) for i in range(5)])
+
+    def test_overlap(self):
+        # Rows modified in the overlap before the token was made are sent again
+        with test.utils.override_settings(CHANGES_OVERLAP=3600):
+            token = self.get_changes()['token']
+        self.assertEqual(len(self.get_changes(token)['messages']), 5)
+
+    def test_last_msg_client(self):
+        token = self.get_changes()['token']
+        router.receive(self.participant.test_connection.identity, 'Hello again')
+        participants = self.get_changes(token)['participants']
+        self.assertEqual([(p['study_id'], p['last_msg_client']) for p in participants],
+                         [('0001', datetime.date.today().isoformat())])
+
+    def test_invalid_token(self):
+        response = self.client.get(reverse('changes-list'), {'since': 'nope'})
+        self.assertEqual(response.status_code, 404)
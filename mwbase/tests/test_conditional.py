@@ -0,0 +1,80 @@
+# Python Imports
+import datetime
+
+# Django Imports
+from constance import config
+from django import test
+from django.contrib.auth.models import User
+from django.urls import reverse
+import swapper
+
+# Local Imports
+from mwbase.models import Connection, Message, Note, Practitioner
+
+Participant = swapper.load_model('mwbase', 'Participant')
+
+
+class ConditionalGetTests(test.TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('nurse', password='nurse')
+        Practitioner.objects.create(user=user, facility='bondo')
+        self.client.login(username='nurse', password='nurse')
+
+        self.participant = Participant.objects.create(
+            study_id='0001', anc_num='1', facility='bondo', study_group='two-way', sms_name='Jane',
+            display_name='Jane', birthdate=datetime.date(1990, 1, 1), due_date=datetime.date(2020, 1, 1)
+        )
+        self.connection = Connection.objects.create(identity='+254700000001', participant=self.participant)
+        self.message = self.receive('Hello')
+
+    def receive(self, text):
+        return Message.objects.create(text=text, is_outgoing=False, connection=self.connection,
+                                      participant=self.participant)
+
+    def assertNotModified(self, url, changed):
+        """ Get url, check a 304 for its ETag, run changed and check for a new 200 """
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        changed()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_participant(self):
+        self.assertNotModified(reverse('participant-detail', args=['0001']), lambda: self.receive('Hello again'))
+
+    def test_participant_messages(self):
+        self.assertNotModified(reverse('participant-messages', args=['0001']), self.message.dismiss)
+
+    def test_participant_visits(self):
+        self.assertNotModified(reverse('participant-visits', args=['0001']), lambda: self.participant.visit_set.create(
+            scheduled=datetime.date.today() + datetime.timedelta(days=7), visit_type='clinic'))
+
+    def test_participant_notes(self):
+        note = Note.objects.create(participant=self.participant, comment='Note')
+        self.assertNotModified(reverse('participant-notes', args=['0001']), note.delete)
+
+    def test_message(self):
+        self.assertNotModified(reverse('message-detail', args=[self.message.pk]),
+                               lambda: self.participant.visit_set.create(scheduled=datetime.date.today(), visit_type='clinic'))
+
+    def test_fake_date_changed(self):
+        def next_day():
+            config.CURRENT_DATE = datetime.date(2015, 8, 2)
+
+        config.CURRENT_DATE = datetime.date(2015, 8, 1)
+        self.assertNotModified(reverse('participant-detail', args=['0001']), next_day)
+        config.CURRENT_DATE = datetime.date(2015, 8, 1)
+        self.assertNotModified(reverse('message-detail', args=[self.message.pk]), next_day)
+
+    def test_not_found(self):
+        response = self.client.get(reverse('participant-detail', args=['0002']))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(self.client.get(reverse('message-detail', args=['nope'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('participant-visits', args=['0002'])).status_code, 404)
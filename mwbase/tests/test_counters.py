@@ -0,0 +1,85 @@
+# Python Imports
+import datetime
+
+# Django Imports
+from django import test
+import swapper
+
+# Local Imports
+from mwbase.models import Connection, Message, Note, PhoneCall
+from utils.batch import WriteBatch
+
+Participant = swapper.load_model('mwbase', 'Participant')
+
+
+class InteractionCounterTests(test.TestCase):
+
+    def setUp(self):
+        self.participant = Participant.objects.create(
+            study_id='0001', anc_num='1', facility='bondo', study_group='two-way', sms_name='Jane',
+            display_name='Jane', birthdate=datetime.date(1990, 1, 1), due_date=datetime.date(2020, 1, 1))
+        self.connection = Connection.objects.create(identity='+254700000001', participant=self.participant)
+
+    def counters(self):
+        return Participant.objects_no_link.filter(pk=self.participant.pk).values(
+            'note_count', 'phonecall_count', 'message_count', 'message_incoming_count', 'message_outgoing_count').get()
+
+    def message(self, is_outgoing):
+        return Message(text='Hello', is_outgoing=is_outgoing, connection=self.connection, participant=self.participant)
+
+    def test_counters_follow_creates_and_deletes(self):
+        Note.objects.create(participant=self.participant, comment='note')
+        PhoneCall.objects.create(participant=self.participant, connection=self.connection, created=datetime.date.today())
+        self.message(False).save()
+        with WriteBatch() as batch:
+            for _ in range(3):
+                batch.create(self.message(True))
+
+        self.assertEqual(self.counters(), {'note_count': 1, 'phonecall_count': 1, 'message_count': 4,
+                                           'message_incoming_count': 1, 'message_outgoing_count': 3})
+
+        Message.objects.filter(is_outgoing=True).delete()
+        self.assertEqual(self.counters()['message_count'], 1)
+        self.assertEqual(self.counters()['message_outgoing_count'], 0)
+
+    def test_save_keeps_counters(self):
+        # As in ParticipantViewSet.create: the instance was loaded before the counters were incremented
+        self.participant.note_set.create(comment='note')
+        self.message(False).save()
+        self.participant.display_name = 'jane'
+        self.participant.save()
+
+        self.assertEqual(self.counters()['note_count'], 1)
+        self.assertEqual(self.counters()['message_count'], 1)
+        self.assertEqual(Participant.objects_no_link.get(pk=self.participant.pk).display_name, 'Jane')
+
+    def test_counters_follow_changed_participant(self):
+        other = Participant.objects.create(
+            study_id='0002', anc_num='2', facility='bondo', study_group='two-way', sms_name='Mary',
+            display_name='Mary', birthdate=datetime.date(1990, 1, 1), due_date=datetime.date(2020, 1, 1))
+        message = Message.objects.create(text='Hello', is_outgoing=False, connection=self.connection)
+        self.assertEqual(self.counters()['message_count'], 0)
+
+        message.participant = self.participant
+        message.save()
+        self.assertEqual(self.counters()['message_incoming_count'], 1)
+
+        message.participant = other
+        message.save(update_fields=['participant'])
+        self.assertEqual(self.counters()['message_count'], 0)
+        self.assertEqual(Participant.objects_no_link.get(pk=other.pk).message_count, 1)
+
+        message = Message.objects.get(pk=message.pk)
+        message.is_viewed = True
+        with self.assertNumQueries(3):  # Counted as before, the update and the pending counts
+            message.save()
+
+    def test_repair(self):
+        self.message(True).save()
+        Note.objects.create(participant=self.participant, comment='note')
+        Participant.objects_no_link.update(message_count=10, note_count=0)
+        self.assertEqual(Participant.objects_no_link.add_actual_counts().get().actual_message_count, 1)
+
+        Participant.objects_no_link.repair_counters()
+        self.assertEqual(self.counters(), {'note_count': 1, 'phonecall_count': 0, 'message_count': 1,
+                                           'message_incoming_count': 0, 'message_outgoing_count': 1})
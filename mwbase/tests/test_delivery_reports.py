@@ -0,0 +1,72 @@
+# Python Imports
+import datetime
+
+# Django Imports
+from django import test
+from django.urls import reverse
+
+# Local Imports
+from mwbase.models import Connection, DeliveryReport, Message
+from transports import router
+
+
+class DeliveryReportTests(test.TestCase):
+
+    def setUp(self):
+        router.delivery_report_ids.clear()
+        connection = Connection.objects.create(identity='+254700000001')
+        self.messages = [
+            Message.objects.create(text='Hello {}'.format(i), connection=connection,
+                                   **Message.external_fields('ATXid_{}'.format(i), True, {'status': 'Success'}))
+            for i in range(3)
+        ]
+
+    def test_apply_in_order(self):
+        DeliveryReport.objects.create(external_id='ATXid_0', status='Buffered')
+        DeliveryReport.objects.create(external_id='ATXid_1', status='Failed', failure_reason='UserInBlacklist')
+        DeliveryReport.objects.create(external_id='ATXid_0', status='Success')
+        DeliveryReport.objects.create(external_id='ATXid_9', status='Success')
+
+        self.assertEqual(DeliveryReport.objects.apply(chunk_size=2), (3, 1))
+
+        statuses = {m.external_id: (m.external_status, m.external_data.get('reason')) for m in Message.objects.all()}
+        self.assertEqual(statuses, {
+            'ATXid_0': ('Success', None),
+            'ATXid_1': ('Failed', 'UserInBlacklist'),
+            'ATXid_2': ('Sent', None),
+        })
+        self.assertIsNotNone(Message.objects.get(external_id='ATXid_0').external_success_time)
+        self.assertEqual(list(DeliveryReport.objects.values_list('external_id', flat=True)), ['ATXid_9'])
+
+        self.assertEqual(DeliveryReport.objects.apply(max_age=datetime.timedelta(0)), (0, 0))
+
+    @test.override_settings(DELIVERY_REPORT_BUFFER=True)
+    def test_callback_buffered(self):
+        url = reverse('africas-talking-delivery-report')
+        with self.assertNumQueries(1):
+            response = self.client.post(url, {'id': 'ATXid_2', 'status': 'Success'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Message.objects.get(external_id='ATXid_2').external_status, 'Sent')
+
+        DeliveryReport.objects.apply()
+        self.assertEqual(Message.objects.get(external_id='ATXid_2').external_status, 'Success')
+
+    def test_status_only_moves_forward(self):
+        DeliveryReport.objects.create(external_id='ATXid_0', status='Success')
+        DeliveryReport.objects.create(external_id='ATXid_0', status='Buffered')
+        DeliveryReport.objects.create(external_id='ATXid_1', status='Queued')
+        self.assertEqual(DeliveryReport.objects.apply(), (3, 0))
+        self.assertEqual(Message.objects.get(external_id='ATXid_0').external_status, 'Success')
+        self.assertEqual(Message.objects.get(external_id='ATXid_1').external_status, 'Sent')
+
+    def test_callback_retry(self):
+        url = reverse('africas-talking-delivery-report')
+        with self.assertNumQueries(2):  # select, update
+            self.client.post(url, {'id': 'ATXid_2', 'status': 'Success'})
+        with self.assertNumQueries(0):
+            self.client.post(url, {'id': 'ATXid_2', 'status': 'Success'})
+        router.delivery_report_ids.clear()
+        with self.assertNumQueries(1):
+            self.client.post(url, {'id': 'ATXid_2', 'status': 'Failed'})
+        self.assertEqual(Message.objects.get(external_id='ATXid_2').external_status, 'Success')
+        self.assertFalse(DeliveryReport.objects.exists())
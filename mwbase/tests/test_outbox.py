@@ -0,0 +1,42 @@
+# Python Imports
+from unittest import mock
+
+# Django Imports
+from django import test
+
+# Local Imports
+from mwbase.models import Message, Outbox
+
+
+@mock.patch.object(Message, 'save')
+@mock.patch.object(Outbox, 'save')
+class OutboxRecordTests(test.SimpleTestCase):
+
+    def setUp(self):
+        self.message = Message(text='Hello', **Message.external_fields('', None, {'status': 'Queued'}))
+        self.outbox = Outbox(message=self.message, identity='+254700000001')
+
+    def test_sent(self, outbox_save, message_save):
+        self.outbox.record('ATXid_1', True, {'status': 'Success'})
+
+        self.assertEqual(self.outbox.status, 'sent')
+        self.assertEqual(self.message.external_id, 'ATXid_1')
+        self.assertEqual(self.message.external_status, 'Sent')
+        message_save.assert_called_once_with()
+
+    def test_transport_error_retried(self, outbox_save, message_save):
+        self.outbox.record('', False, {'error': 'timeout'}, max_attempts=2)
+        self.assertEqual(self.outbox.status, 'pending')
+        self.assertEqual(self.message.external_status, 'Queued')
+        message_save.assert_not_called()
+
+        self.outbox.record('', False, {'error': 'timeout'}, max_attempts=2)
+        self.assertEqual(self.outbox.status, 'failed')
+        self.assertEqual(self.outbox.attempts, 2)
+        self.assertEqual(self.message.external_status, 'Failed')
+
+    def test_rejected_not_retried(self, outbox_save, message_save):
+        self.outbox.record('ATXid_1', False, {'status': 'Invalid Phone Number'})
+
+        self.assertEqual(self.outbox.status, 'failed')
+        self.assertEqual(self.message.external_status, 'Invalid Phone Number')
@@ -0,0 +1,72 @@
+# Python Imports
+import datetime
+
+# Django Imports
+from django import test
+from django.contrib.auth.models import User
+from django.urls import reverse
+import swapper
+
+# Local Imports
+from mwbase.models import Connection, Message, Practitioner
+
+Participant = swapper.load_model('mwbase', 'Participant')
+
+
+class KeysetPaginationTests(test.TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('nurse', password='nurse')
+        Practitioner.objects.create(user=user, facility='bondo')
+        self.client.login(username='nurse', password='nurse')
+
+        self.participants = [Participant.objects.create(
+            study_id='000{}'.format(i), anc_num=str(i), facility='bondo', study_group='two-way', sms_name='Jane',
+            display_name='Jane', birthdate=datetime.date(1990, 1, 1), due_date=datetime.date(2020, 1, 1)
+        ) for i in range(3)]
+        connection = Connection.objects.create(identity='+254700000001', participant=self.participants[0])
+        # Messages with the same created time are ordered by id
+        created = Message._meta.get_field('created').default()
+        for i in range(5):
+            Message.objects.create(text='Hello {}'.format(i), is_outgoing=False, connection=connection,
+                                   participant=self.participants[0], created=created)
+
+    def get_pages(self, url, **params):
+        pages = []
+        while url:
+            response = self.client.get(url, params)
+            pages.append([item.get('study_id') or item.get('text') or item['participant']['study_id']
+                          for item in response.data])
+            url, params = response.get('Link', '<>')[1:].split('>')[0], {}
+        return pages
+
+    def test_pending_messages(self):
+        pages = self.get_pages(reverse('pending-messages'), limit=2)
+        self.assertEqual(pages, [['Hello 4', 'Hello 3'], ['Hello 2', 'Hello 1'], ['Hello 0']])
+
+        # Pages of settings.API_PAGE_SIZE without a limit, not paginated when that is None
+        with test.utils.override_settings(API_PAGE_SIZE=3):
+            pages = self.get_pages(reverse('pending-messages'))
+        self.assertEqual(pages, [['Hello 4', 'Hello 3', 'Hello 2'], ['Hello 1', 'Hello 0']])
+        with test.utils.override_settings(API_PAGE_SIZE=None):
+            pages = self.get_pages(reverse('pending-messages'))
+        self.assertEqual(pages, [['Hello 4', 'Hello 3', 'Hello 2', 'Hello 1', 'Hello 0']])
+
+    def test_pending_calls(self):
+        for i, participant in enumerate(self.participants):
+            participant.scheduledphonecall_set.create(scheduled=datetime.date(2015, 7, 10 - i))
+        pages = self.get_pages(reverse('pending-calls'), limit=2)
+        self.assertEqual(pages, [['0000', '0001'], ['0002']])
+
+    def test_participants_and_messages(self):
+        with test.utils.override_settings(API_PAGE_SIZE=2):
+            pages = self.get_pages(reverse('participant-list'))
+        self.assertEqual(pages, [['0000', '0001'], ['0002']])
+
+        max_id = Message.objects.get(text='Hello 2').pk
+        pages = self.get_pages(reverse('participant-messages', args=['0000']), limit=2, max_id=max_id)
+        self.assertEqual(pages, [['Hello 2', 'Hello 1'], ['Hello 0']])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('pending-messages'), {'limit': 2, 'cursor': 'nope'})
+        self.assertEqual(response.status_code, 404)
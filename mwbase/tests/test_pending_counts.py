@@ -0,0 +1,98 @@
+# Python Imports
+import datetime
+import time
+from unittest import mock
+
+# Django Imports
+from django import test
+from django.contrib.auth.models import User
+from django.urls import reverse
+import swapper
+
+# Local Imports
+from mwbase.models import Connection, Message, PendingCount, Practitioner
+from mwbase.models import pending
+from mwbase.models.pending import pending_changed_condition
+
+Participant = swapper.load_model('mwbase', 'Participant')
+
+
+class PendingCountTests(test.TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('nurse', password='nurse')
+        Practitioner.objects.create(user=user, facility='bondo')
+        self.client.login(username='nurse', password='nurse')
+
+        self.participant = Participant.objects.create(
+            study_id='0001', anc_num='1', facility='bondo', study_group='two-way', sms_name='Jane',
+            display_name='Jane', birthdate=datetime.date(1990, 1, 1), due_date=datetime.date(2020, 1, 1)
+        )
+        self.connection = Connection.objects.create(identity='+254700000001', participant=self.participant)
+
+    def receive(self, text):
+        return Message.objects.create(text=text, is_outgoing=False, is_system=False, connection=self.connection,
+                                      participant=self.participant)
+
+    def test_counts_follow_messages(self):
+        self.receive('Hello')
+        pending = PendingCount.objects.for_facility('bondo')
+        self.assertEqual((pending.messages, pending.translations), (1, 1))
+
+        # New messages are added without a recount
+        message = self.receive('Hello again')
+        pending.refresh_from_db()
+        self.assertEqual((pending.messages, pending.is_stale), (2, False))
+
+        message.dismiss()
+        pending.refresh_from_db()
+        self.assertTrue(pending.is_stale)
+        self.assertEqual(PendingCount.objects.for_facility('bondo').messages, 1)
+
+    def test_etag(self):
+        self.receive('Hello')
+        response = self.client.get(reverse('pending-list'))
+        self.assertEqual(response.data['messages'], 1)
+        etag = response['ETag']
+
+        response = self.client.get(reverse('pending-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.receive('Hello again')
+        response = self.client.get(reverse('pending-list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['messages'], 2)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_wait(self):
+        etag = self.client.get(reverse('pending-list'))['ETag']
+
+        # Times out with a 304 while nothing changes
+        start = time.monotonic()
+        response = self.client.get(reverse('pending-wait'), {'timeout': 0.2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+        # A message received while waiting ends the wait with the new counts
+        with mock.patch.object(pending_changed_condition, 'wait', side_effect=lambda timeout: self.receive('Hello')):
+            response = self.client.get(reverse('pending-wait'), {'timeout': 60}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['messages'], 1)
+        self.assertNotEqual(response['ETag'], etag)
+
+    @test.override_settings(PENDING_WAIT_TIMEOUT=0.2)
+    def test_wait_timeout_not_finite(self):
+        etag = self.client.get(reverse('pending-list'))['ETag']
+        with mock.patch.object(PendingCount.objects, 'wait', wraps=PendingCount.objects.wait) as wait:
+            for timeout in ('nan', 'inf', '-inf', 'soon'):
+                response = self.client.get(reverse('pending-wait'), {'timeout': timeout}, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+        self.assertEqual([call[0][2] for call in wait.call_args_list], [0.2] * 4)
+
+    def test_waiters_notified_after_commit(self):
+        with mock.patch.object(pending.transaction, 'on_commit') as on_commit, \
+                mock.patch.object(pending_changed_condition, 'notify_all') as notify_all:
+            self.receive('Hello')
+            notify_all.assert_not_called()
+            on_commit.call_args[0][0]()
+            notify_all.assert_called_once_with()
@@ -0,0 +1,103 @@
+# Python Imports
+import datetime
+
+# Django Imports
+from django import test
+from django.contrib.auth.models import User
+from django.urls import reverse
+import swapper
+
+# Rest Framework Imports
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+# Local Imports
+from mwbase.models import Connection, Message, Practitioner, Visit
+from mwbase.serializers import changes
+from mwbase.serializers.messages import MessageSimpleSerializer, ParticipantSimpleSerializer
+from mwbase.serializers.rows import MessageRows, ParticipantRows, VisitRows
+from mwbase.serializers.visits import VisitSimpleSerializer
+
+Participant = swapper.load_model('mwbase', 'Participant')
+
+
+class RowSerializerTests(test.TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('nurse', password='nurse')
+        Practitioner.objects.create(user=user, facility='bondo')
+        self.client.login(username='nurse', password='nurse')
+        self.request = Request(APIRequestFactory().get('/'))
+
+        # Participants with and without a phone number, visits, a delivery date and an inactive status
+        first = self.create_participant('0001', primary='+254700000001')
+        second = self.create_participant('00 2', sms_status='stopped', preg_status='post',
+                                         delivery_date=datetime.date(2015, 7, 1))
+        Connection.objects.create(identity='+254700000002', participant=second)
+        self.create_participant('0003', study_group='')
+
+        Visit.objects.create(participant=first, scheduled=datetime.date(2015, 9, 1), visit_type='study')
+        Visit.objects.create(participant=first, scheduled=datetime.date(2015, 7, 1))
+        Visit.objects.create(participant=first, scheduled=datetime.date(2015, 6, 1), status='attended',
+                             arrived=datetime.date(2015, 6, 3))
+        Visit.objects.create(participant=second, scheduled=datetime.date(2015, 8, 1), status='missed',
+                             notification_last_seen=datetime.date(2015, 7, 30), comment='Traveling')
+
+        connection = first.connection()
+        Message.objects.create(text='Hi', is_outgoing=False, connection=connection, participant=first)
+        Message.objects.create(text='Seen', is_outgoing=False, is_viewed=True, is_related=True, topic='visit',
+                               connection=connection, participant=first, translation_status='done',
+                               translated_text='Seen')
+        Message.objects.create(text='Welcome', is_outgoing=True, connection=connection, participant=first,
+                               auto='edd.-1.two-way', external_status='Success')
+        Message.objects.create(text='Reply', is_outgoing=True, is_system=False, connection=connection,
+                               participant=first)
+
+    def create_participant(self, study_id, primary=None, **kwargs):
+        fields = dict(study_id=study_id, anc_num=study_id, facility='bondo', study_group='two-way', sms_name='Jane',
+                      display_name='Jane', birthdate=datetime.date(1990, 1, 1), due_date=datetime.date(2015, 9, 1),
+                      last_msg_client=datetime.date(2015, 7, 30))
+        fields.update(kwargs)
+        participant = Participant.objects.create(**fields)
+        if primary is not None:
+            Connection.objects.create(identity=primary, participant=participant, is_primary=True)
+        return participant
+
+    def assertSameJSON(self, serializer_class, rows_class, queryset):
+        context = {'request': self.request}
+        expected = serializer_class(queryset, many=True, context=context).data
+        rows = rows_class(rows_class.project(queryset), many=True, context=context).data
+        self.assertEqual(JSONRenderer().render(rows), JSONRenderer().render(expected))
+
+    def test_participants(self):
+        self.assertSameJSON(ParticipantSimpleSerializer, ParticipantRows, Participant.objects.order_by('study_id'))
+
+    def test_messages(self):
+        self.assertSameJSON(MessageSimpleSerializer, MessageRows, Message.objects.order_by('id'))
+
+    def test_visits(self):
+        self.assertSameJSON(VisitSimpleSerializer, VisitRows, Visit.objects.order_by('id'))
+
+    def test_changes(self):
+        self.assertSameJSON(changes.ParticipantChangeSerializer, changes.ParticipantChangeRows, Participant.objects.all())
+        self.assertSameJSON(changes.MessageChangeSerializer, changes.MessageChangeRows, Message.objects.all())
+        self.assertSameJSON(changes.VisitChangeSerializer, changes.VisitChangeRows, Visit.objects.all())
+
+    def test_participant_list(self):
+        # One query for the participants, their phone numbers and next visits
+        with self.assertNumQueries(1):
+            participants = ParticipantRows(ParticipantRows.project(Participant.objects.order_by('study_id')),
+                                           many=True, context={'request': self.request}).data
+        self.assertEqual([p['phone_number'] for p in participants], [None, '+254700000001', None])
+        self.assertEqual(participants[1]['next_visit_date'], datetime.date(2015, 7, 1))
+        self.assertEqual(participants[0]['href'], 'http://testserver/api/v0.1/participants/00%202/')
+
+        response = self.client.get(reverse('participant-list'), {'limit': 2})
+        self.assertEqual([p['study_id'] for p in response.data], ['00 2', '0001'])
+        response = self.client.get(response['Link'][1:response['Link'].index('>')])
+        self.assertEqual([p['study_id'] for p in response.data], ['0003'])
+
+    def test_participant_messages(self):
+        response = self.client.get(reverse('participant-messages', args=['0001']))
+        self.assertEqual([m['sent_by'] for m in response.data], ['nurse', 'system', 'participant', 'participant'])
@@ -12,6 +12,7 @@ AutomatedMessage = swapper.load_model("mwbase", "AutomatedMessage")
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 import utils.sms_utils as sms
+from utils.batch import WriteBatch
 import mwbase.models as mwbase
 
 module_name, class_name = settings.SMSBANK_CLASS.rsplit(".", 1)
@@ -64,18 +65,24 @@ def import_messages(file):
     total , add , create = 0 , 0 , 0
     counts = collections.defaultdict(int)
     diff , existing = [] , []
-    for message in messages:
-        valid, msg = message
-        if valid:
-            counts['total'] += 1
-            auto , status = AutomatedMessage.objects.from_excel(msg)
-            counts['add'] += 1
-            counts[status] += 1
-
-            if status != 'created':
-                existing.append( (msg,auto) )
-            if status == 'changed':
-                diff.append( (msg,auto) )
+    try:
+        with WriteBatch() as batch:
+            for message in messages:
+                valid, msg = message
+                if valid:
+                    counts['total'] += 1
+                    auto , status = AutomatedMessage.objects.from_excel(msg,batch=batch)
+                    counts['add'] += 1
+                    counts[status] += 1
+
+                    if status != 'created':
+                        existing.append( (msg,auto) )
+                    if status == 'changed':
+                        diff.append( (msg,auto) )
+                batch.tick()
+    finally:
+        # from_excel saves may be rolled back
+        AutomatedMessage.objects.invalidate_index()
 
     return counts, existing, diff
 
@@ -27,6 +27,7 @@ def change_current_date(request, direction, delta):
     delta = int(delta) * (-1 if direction == 'back' else 1)
     td = datetime.timedelta(days=delta)
     config.CURRENT_DATE = utils.today() + td
+    utils.current_date.set(config.CURRENT_DATE)
     return JsonResponse({'current_date': config.CURRENT_DATE.strftime('%Y-%m-%d')})
 
 
@@ -1,3 +1,5 @@
+import copy
+
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
 
@@ -29,53 +31,55 @@ class AutomatedMessageHIVQuerySet(AutomatedMessageQuerySetBase):
         
     def from_parameters(self, send_base, group, condition='normal', send_offset=0, hiv=False, second_preg=False, exact=False):
         # TODO: Need Logic for second_preg lookup ordering
+        # Messages with send_base and offset
+        message_offset = self.offset_messages(send_base, send_offset)
+
         # Look for exact match of parameters
         try:
-            return self.get(send_base=send_base, send_offset=send_offset,
-                            group=group, condition=condition, hiv_messaging=hiv, second_preg=second_preg)
+            return self.get_from(message_offset, group=group, condition=condition, hiv_messaging=hiv,
+                                 second_preg=second_preg)
         except ObjectDoesNotExist as e:
             if exact == True:
                 return None
             # No match for participant conditions continue to find best match
             pass
 
-        # Create the base query set with send_base and offset
-        message_offset = self.filter(send_base=send_base, send_offset=send_offset)
-
         if hiv:
             # Try to find a non HIV message for this conditon
             try:
-                return message_offset.get(condition=condition, group=group, hiv_messaging=False)
+                return self.get_from(message_offset, condition=condition, group=group, hiv_messaging=False)
             except ObjectDoesNotExist as e:
                 pass
 
             # Force condition to normal and try again with group and hiv=True
             try:
-                return message_offset.get(condition="normal", group=group, hiv_messaging=hiv)
+                return self.get_from(message_offset, condition="normal", group=group, hiv_messaging=hiv)
             except ObjectDoesNotExist as e:
                 pass
 
         if condition != "normal":
             # Force condition to normal and try again
             try:
-                return message_offset.get(condition="normal", group=group, hiv_messaging=False)
+                return self.get_from(message_offset, condition="normal", group=group, hiv_messaging=False)
             except ObjectDoesNotExist as e:
                 pass
 
         if group == "two-way":
             # Force group to one-way and try again
             try:
-                return message_offset.get(condition=condition, group="one-way", hiv_messaging=False)
+                return self.get_from(message_offset, condition=condition, group="one-way", hiv_messaging=False)
             except ObjectDoesNotExist as e:
                 pass
 
         if condition != "normal" and group != "one-way":
             # Force group to one-way and force hiv_messaging off return message or None
-            return message_offset.filter(condition='normal', group='one-way', hiv_messaging=False).first()
+            matches = self.filter_from(message_offset, condition='normal', group='one-way', hiv_messaging=False)
+            return matches[0] if matches else None
 
-    def from_excel(self, msg):
+    def from_excel(self, msg, batch=None):
         """
         Replace fields of message content with matching description
+        :param batch utils.batch.WriteBatch - if set changed messages are saved with batch
         """
         auto = self.from_description(msg.description(), exact=True)
         if auto is None:
@@ -84,10 +88,16 @@ class AutomatedMessageHIVQuerySet(AutomatedMessageQuerySetBase):
             msg_english = msg.english if msg.english != '' else msg.new
             changed = msg_english != auto.english or msg.swahili != auto.swahili or msg.luo != auto.luo
 
+            # auto is shared with the message index so edit a copy, importers reload the index when done
+            auto = copy.copy(auto)
             auto.english = msg_english
             auto.swahili = msg.swahili
             auto.luo = msg.luo
-            auto.save()
+            if batch is not None:
+                if changed:
+                    batch.update(auto, 'english', 'swahili', 'luo')
+            else:
+                auto.save()
 
             return auto, 'changed' if changed else 'same'
 
@@ -13,6 +13,7 @@ from django.db import models
 import utils
 # Local Imports
 from mwbase.models import PhoneCall, Practitioner, Visit, Connection, BaseParticipant, BaseStatusChange
+from mwbase.models.interactions import interaction_counts
 from transports import router, TransportError
 from utils import enums
 from utils.models import TimeStampedModel, ForUserQuerySet
@@ -43,6 +44,14 @@ class ParticipantQuerySet(ForUserQuerySet):
             msg_other=models.F('msg_outgoing') - models.F('msg_delivered') - models.F('msg_sent'),
         )
 
+    def add_actual_counts(self):
+        """ Annotate actual_<counter> with the counted interactions for each participant counter """
+        return self.annotate(**{'actual_' + field: count for field, count in interaction_counts().items()})
+
+    def repair_counters(self):
+        """ Recompute the interaction counters with one UPDATE. Returns the number of participants updated """
+        return self.update(**interaction_counts())
+
     def send_batch(self, english, swahili=None, luo=None, auto='', send=False, control=False):
         """ Send a message to all participants in the query set
             english: required text
@@ -92,18 +101,14 @@ class ParticipantManager(models.Manager):
 
     def get_queryset(self):
         qs = super(ParticipantManager, self).get_queryset()
-        return qs.annotate(
-            note_count=models.Count('note', distinct=True),
-            phonecall_count=models.Count('phonecall', distinct=True),
-            message_count=models.Count('message', distinct=True),
-        ).prefetch_related('connection_set',
-                           models.Prefetch(
-                               'visit_set',
-                               queryset=Visit.objects.order_by('scheduled').filter(arrived__isnull=True,
-                                                                                   status='pending'),
-                               to_attr='pending_visits'
-                           )
-                       )
+        return qs.prefetch_related(
+            'connection_set',
+            models.Prefetch(
+                'visit_set',
+                queryset=Visit.objects.order_by('scheduled').filter(arrived__isnull=True, status='pending'),
+                to_attr='pending_visits'
+            )
+        )
 
 
 class Participant(BaseParticipant):
@@ -127,7 +132,7 @@ class Participant(BaseParticipant):
     second_preg = models.BooleanField(blank=True, choices=enums.BOOL_CHOICES, verbose_name='Second Pregnancy',default=False)
 
 
-    class Meta:
+    class Meta(BaseParticipant.Meta):
         app_label = 'mwhiv'
 
     def __init__(self, *args, **kwargs):
@@ -57,7 +57,7 @@ class Participant(BaseParticipant):
     preg_status = models.CharField(max_length=15, choices=PREG_STATUS_CHOICES, default='pregnant')
     condition = models.CharField(max_length=15, choices=CONDITION_CHOICES, default='normal')
 
-    class Meta:
+    class Meta(BaseParticipant.Meta):
         app_label = 'mwpriya'
 
     def __init__(self, *args, **kwargs):
@@ -2,6 +2,7 @@
 from rest_framework import routers
 
 # Local Imports
+from mwbase.serializers import changes
 from mwbase.serializers import messages
 from mwbase.serializers import misc
 from . import participants
@@ -14,3 +15,4 @@ router.register(r'messages', messages.MessageViewSet, 'message')
 router.register(r'visits', visits.VisitViewSet, 'visit')
 router.register(r'scheduled-calls', misc.PendingCallViewSet, 'pending-call')
 router.register(r'pending', misc.PendingViewSet, 'pending')
+router.register(r'changes', changes.ChangesViewSet, 'changes')
@@ -1,3 +1,3 @@
 from . import urls
-from .api import send
+from .api import send, send_many
 from .at_utils import AfricasTalkingException
@@ -2,10 +2,11 @@
 from django.conf import settings
 
 #Python Imports
-import requests, os
+import requests, collections
 
 #Local Imports
 from .at_utils import AfricasTalkingException
+from .client import GatewayClient
 
 #Import Afica's Talking Settings
 AFRICAS_TALKING_SETTINGS = getattr(settings,'AFRICAS_TALKING',{})
@@ -18,10 +19,23 @@ SHORTCODE = AFRICAS_TALKING_SETTINGS.get('SHORTCODE',None)
 
 AFRICAS_TALKING_SEND = AFRICAS_TALKING_SETTINGS.get('SEND',False)
 
-AFRICAS_TALKING_API_BASE = 'http://api.africastalking.com/version1'
+# Maximum number of comma separated numbers in a single bulk messaging POST
+MAX_RECIPIENTS = AFRICAS_TALKING_SETTINGS.get('MAX_RECIPIENTS',500)
+
+AFRICAS_TALKING_API_BASE = AFRICAS_TALKING_SETTINGS.get('API_BASE','http://api.africastalking.com/version1')
 
 HEADERS = {'Accept': 'application/json','apikey':API_KEY}
 
+# Shared keep-alive client for all gateway calls
+client = GatewayClient(
+    AFRICAS_TALKING_API_BASE,
+    headers=HEADERS,
+    timeout=AFRICAS_TALKING_SETTINGS.get('TIMEOUT',(5,30)),
+    retries=AFRICAS_TALKING_SETTINGS.get('RETRIES',2),
+    backoff=AFRICAS_TALKING_SETTINGS.get('BACKOFF',0.5),
+    pool_size=AFRICAS_TALKING_SETTINGS.get('POOL_SIZE',10),
+)
+
 PARAMS = {'username':USERNAME,'bulkSMSMode':1}
 if SHORTCODE:
     PARAMS['from'] = SHORTCODE
@@ -34,11 +48,14 @@ def send_raw(to,message):
     if USERNAME is None:
         raise AfricasTalkingException('AFRICAS_TALKING var has not set a USERNAME')
 
+    # to can be a single number or a list of numbers for a bulk send
+    if not isinstance(to,str):
+        to = ','.join(to)
+
     params = {'to':to,'message':message}
     params.update(PARAMS)
 
-    send_url = os.path.join(AFRICAS_TALKING_API_BASE,'messaging')
-    post = requests.post(send_url,data=params,headers=HEADERS)
+    post = client.post('messaging',data=params)
     #Raise requests.exceptions.HTTPError if 4XX or 5XX
     post.raise_for_status()
 
@@ -63,9 +80,45 @@ def send(to,message):
     # Return tuple (messageId, messageSuccess, extra_data)
     recipients = data['SMSMessageData']['Recipients']
     if len(recipients) == 1:
-        msg_id = recipients[0]['messageId']
-        msg_success = recipients[0]['status'] == 'Success'
-        return msg_id, msg_success, {'status':recipients[0]['status']}
+        return recipient_result(recipients[0])
+
+def send_many(identities,message):
+    ''' Send the same message to a list of identities using comma separated bulk POSTs
+        Identities are chunked into groups of at most MAX_RECIPIENTS numbers
+
+        Returns a list of (messageId, messageSuccess, extra_data) tuples in the same order as identities
+    '''
+    results = []
+    for start in range(0,len(identities),MAX_RECIPIENTS):
+        chunk = identities[start:start+MAX_RECIPIENTS]
+        try:
+            data = send_raw(chunk,message)
+        except requests.RequestException as e:
+            # The whole chunk failed but keep going so earlier chunks are not lost
+            results.extend( ("",False,{"error":str(e)}) for _ in chunk )
+        else:
+            results.extend( parse_recipients(chunk,data) )
+    return results
+
+def parse_recipients(identities,data):
+    ''' Map the Recipients array of a bulk send response back onto identities '''
+    recipients = collections.defaultdict(collections.deque)
+    for recipient in data['SMSMessageData']['Recipients']:
+        recipients[recipient['number']].append(recipient)
+
+    results = []
+    for identity in identities:
+        try:
+            results.append( recipient_result(recipients[identity].popleft()) )
+        except IndexError:
+            # Gateway did not return a status for this number
+            results.append( ("",False,{"status":"Failed","error":"no recipient in response"}) )
+    return results
+
+def recipient_result(recipient):
+    msg_id = recipient['messageId']
+    msg_success = recipient['status'] == 'Success'
+    return msg_id, msg_success, {'status':recipient['status']}
 
 def balance():
 
@@ -76,8 +129,7 @@ def balance():
 
     params = {'username':USERNAME}
 
-    send_url = os.path.join(AFRICAS_TALKING_API_BASE,'user')
-    post = requests.get(send_url,params=params,headers=HEADERS)
+    post = client.get('user',params=params)
     #Raise requests.exceptions.HTTPError if 4XX or 5XX
     post.raise_for_status()
 
@@ -94,7 +146,21 @@ def fetch(last_received_id=0):
 
     params = {'username':USERNAME,'lastReceivedId':last_received_id}
 
-    send_url = os.path.join(AFRICAS_TALKING_API_BASE,'messaging')
-    post = requests.get(send_url,params=params,headers=HEADERS)
+    post = client.get('messaging',params=params)
 
     return post
+
+def inbox(last_received_id=0):
+    ''' Page through the gateway inbox yielding lists of messages received after last_received_id
+        Each message is a dict with keys id, from, to, text, date and linkId. Stops at the first empty page.
+    '''
+    while True:
+        response = fetch(last_received_id)
+        #Raise requests.exceptions.HTTPError if 4XX or 5XX
+        response.raise_for_status()
+
+        messages = response.json()['SMSMessageData']['Messages']
+        if not messages:
+            return
+        yield messages
+        last_received_id = max(int(message['id']) for message in messages)
@@ -0,0 +1,133 @@
+#Python Imports
+import collections, random, threading, time, logging
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import NewConnectionError
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+# Status codes that are retried for idempotent (GET) requests
+RETRY_STATUS = (500, 502, 503, 504)
+
+
+class GatewayClient(object):
+    ''' Pooled keep-alive HTTP client for gateway calls
+
+        * A single requests.Session is shared so TCP/TLS connections are reused between calls
+        * Every request gets a (connect, read) timeout
+        * GET requests are retried with jittered exponential backoff on 5XX responses and
+          connection errors. POST requests are only retried when the connection could not be
+          established since otherwise the gateway may have already accepted the message.
+        * Per endpoint latency counters are kept in self.stats
+    '''
+
+    def __init__(self, base_url, headers=None, timeout=(5, 30), retries=2, backoff=0.5, pool_size=10):
+        self.base_url = base_url.rstrip('/')
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+
+        self._lock = threading.Lock()
+        self._session = None
+        self.reset_stats()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    session.headers.update(self.headers)
+                    self._session = session
+        return self._session
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def get(self, endpoint, **kwargs):
+        return self.request('GET', endpoint, **kwargs)
+
+    def post(self, endpoint, **kwargs):
+        return self.request('POST', endpoint, **kwargs)
+
+    def request(self, method, endpoint, **kwargs):
+        url = '{}/{}'.format(self.base_url, endpoint)
+        kwargs.setdefault('timeout', self.timeout)
+        idempotent = method == 'GET'
+
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.ConnectionError as e:
+                self.record(endpoint, time.perf_counter() - start, error=True)
+                if attempt >= self.retries or not (idempotent or is_connect_error(e)):
+                    raise
+                logger.warning('%s %s connection error (attempt %s): %s', method, endpoint, attempt + 1, e)
+            except requests.Timeout as e:
+                # A read timeout on POST is ambiguous so it is never retried
+                self.record(endpoint, time.perf_counter() - start, error=True)
+                if attempt >= self.retries or not idempotent:
+                    raise
+                logger.warning('%s %s timeout (attempt %s): %s', method, endpoint, attempt + 1, e)
+            else:
+                retry = idempotent and response.status_code in RETRY_STATUS
+                self.record(endpoint, time.perf_counter() - start, error=response.status_code >= 500)
+                if not retry or attempt >= self.retries:
+                    return response
+                logger.warning('%s %s status %s (attempt %s)', method, endpoint, response.status_code, attempt + 1)
+
+            self.record_retry(endpoint)
+            time.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+            attempt += 1
+
+    ########################################
+    # Latency Counters
+    ########################################
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = collections.defaultdict(lambda: {'count': 0, 'errors': 0, 'retries': 0,
+                                                          'total': 0.0, 'max': 0.0})
+
+    def record(self, endpoint, seconds, error=False):
+        with self._lock:
+            stats = self.stats[endpoint]
+            stats['count'] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            if error:
+                stats['errors'] += 1
+
+    def record_retry(self, endpoint):
+        with self._lock:
+            self.stats[endpoint]['retries'] += 1
+
+    def stats_str(self):
+        lines = []
+        for endpoint, stats in sorted(self.stats.items()):
+            lines.append('{}: Calls: {} Errors: {} Retries: {} Mean: {:.3f}s Max: {:.3f}s'.format(
+                endpoint, stats['count'], stats['errors'], stats['retries'],
+                stats['total'] / stats['count'] if stats['count'] else 0, stats['max']
+            ))
+        return '\n'.join(lines)
+
+
+def is_connect_error(error):
+    ''' Return True if the request failed before any data could have reached the server '''
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, 'reason', reason)
+    return isinstance(reason, NewConnectionError)
@@ -0,0 +1,231 @@
+''' Offline stand in for the Africa's Talking API used for load and failure testing
+
+    Implements the endpoints used by api.py under /version1:
+        * POST messaging: single and comma separated bulk sends
+        * GET messaging: inbox fetch after lastReceivedId
+        * GET user: account balance
+    Point AFRICAS_TALKING['API_BASE'] at GatewaySimulator.url (see the fake_gateway management command).
+'''
+#Python Imports
+import collections, heapq, itertools, json, logging, math, random, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+#Local Imports
+from transports.dispatch import TokenBucket
+
+# Get an instance of a logger
+logger = logging.getLogger(__name__)
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'exponential', 'lognormal')
+
+
+class GatewaySimulator(object):
+    ''' Fake gateway with configurable latency, failures and rate limiting
+
+        * latency: mean seconds before each response, drawn from latency_dist
+        * error_rate: fraction of requests answered with a 500
+        * reject_rate: fraction of send recipients rejected by the gateway (InvalidPhoneNumber)
+        * fail_rate: fraction of accepted messages with a Failed delivery report
+        * rate: requests per second before answering 429 (None for no limit)
+        * report_url: delivery report callback to POST to report_delay seconds after a send (None for no reports)
+        * seed: random seed so runs are reproducible
+    '''
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0, latency_dist='fixed', error_rate=0, reject_rate=0,
+                 fail_rate=0, rate=None, report_url=None, report_delay=1, balance='KES 1000.0000', page_size=100,
+                 seed=None):
+        if latency_dist not in LATENCY_DISTRIBUTIONS:
+            raise ValueError('latency_dist must be one of {}'.format(', '.join(LATENCY_DISTRIBUTIONS)))
+        self.latency = latency
+        self.latency_dist = latency_dist
+        self.error_rate = error_rate
+        self.reject_rate = reject_rate
+        self.fail_rate = fail_rate
+        self.report_url = report_url
+        self.report_delay = report_delay
+        self.balance = balance
+        self.page_size = page_size
+
+        self.stats = collections.Counter()
+        self.inbox = []
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._bucket = TokenBucket(rate, capacity=max(rate, 1)) if rate else None
+
+        self._reports = []
+        self._reports_ready = threading.Condition(self._lock)
+        self._running = False
+
+        self.server = ThreadingHTTPServer((host, port), GatewayHandler)
+        self.server.daemon_threads = True
+        self.server.simulator = self
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}/version1'.format(host, port)
+
+    def start(self):
+        self._running = True
+        for target in (self.server.serve_forever, self._send_reports):
+            threading.Thread(target=target, daemon=True).start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+            self._reports_ready.notify()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def random(self):
+        with self._lock:
+            return self._random.random()
+
+    def sample_latency(self):
+        if not self.latency:
+            return 0
+        with self._lock:
+            if self.latency_dist == 'uniform':
+                return self._random.uniform(0, 2 * self.latency)
+            elif self.latency_dist == 'exponential':
+                return self._random.expovariate(1 / self.latency)
+            elif self.latency_dist == 'lognormal':
+                # sigma 0.5 with the mean kept at latency
+                return self._random.lognormvariate(math.log(self.latency) - 0.125, 0.5)
+            return self.latency
+
+    def throttled(self):
+        ''' Take a token without blocking. Returns True if the request is over the rate limit '''
+        if self._bucket is None:
+            return False
+        with self._lock:
+            self._bucket.refill()
+            if self._bucket.tokens < 1:
+                return True
+            self._bucket.tokens -= 1
+            return False
+
+    def add_inbound(self, identity, text, to='28901'):
+        ''' Add a message to the inbox. Returns its inbox id '''
+        with self._lock:
+            message_id = len(self.inbox) + 1
+            self.inbox.append({'id': message_id, 'from': identity, 'to': to, 'text': text,
+                               'date': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime()),
+                               'linkId': 'SimLink{}'.format(message_id)})
+        return message_id
+
+    def fetch(self, last_received_id):
+        with self._lock:
+            return self.inbox[last_received_id:last_received_id + self.page_size]
+
+    def send(self, numbers):
+        ''' Return the Recipients for a send to numbers and queue their delivery reports '''
+        recipients = []
+        for number in numbers:
+            if self.random() < self.reject_rate:
+                recipients.append({'status': 'InvalidPhoneNumber', 'cost': '0', 'number': number, 'messageId': 'None'})
+                self.count('rejected')
+                continue
+            message_id = 'ATXid_sim{}'.format(next(self._ids))
+            recipients.append({'status': 'Success', 'cost': 'KES 0.8000', 'number': number, 'messageId': message_id})
+            self.count('messages')
+            if self.report_url:
+                self.queue_report(message_id, 'Failed' if self.random() < self.fail_rate else 'Success')
+        return recipients
+
+    def queue_report(self, message_id, status):
+        report = {'id': message_id, 'status': status}
+        if status == 'Failed':
+            report['failureReason'] = 'DeliveryFailure'
+        with self._lock:
+            heapq.heappush(self._reports, (time.monotonic() + self.report_delay, message_id, report))
+            self._reports_ready.notify()
+
+    def post_report(self, report):
+        try:
+            requests.post(self.report_url, data=report, timeout=5).raise_for_status()
+            self.count('reports')
+        except requests.RequestException as e:
+            self.count('report_errors')
+            logger.warning('Delivery report %s failed: %s', report['id'], e)
+
+    def _send_reports(self):
+        while True:
+            with self._lock:
+                while self._running and (not self._reports or self._reports[0][0] > time.monotonic()):
+                    self._reports_ready.wait(self._reports[0][0] - time.monotonic() if self._reports else None)
+                if not self._running:
+                    return
+                due, message_id, report = heapq.heappop(self._reports)
+            self.post_report(report)
+
+
+class GatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path.endswith('/user'):
+            self.handle_request(lambda: (200, {'UserData': {'balance': self.simulator.balance}}))
+        elif url.path.endswith('/messaging'):
+            messages = lambda: self.simulator.fetch(int(params.get('lastReceivedId', 0)))
+            self.handle_request(lambda: (200, {'SMSMessageData': {'Messages': messages()}}))
+        else:
+            self.respond(404, {'error': 'not found'})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        params = {key: values[0] for key, values in parse_qs(body).items()}
+        if urlsplit(self.path).path.endswith('/messaging') and 'to' in params:
+            def send():
+                recipients = self.simulator.send(params['to'].split(','))
+                accepted = sum(recipient['status'] == 'Success' for recipient in recipients)
+                return 201, {'SMSMessageData': {'Message': 'Sent to {}/{}'.format(accepted, len(recipients)),
+                                                'Recipients': recipients}}
+            self.handle_request(send)
+        else:
+            self.respond(400, {'error': 'bad request'})
+
+    @property
+    def simulator(self):
+        return self.server.simulator
+
+    def handle_request(self, make_response):
+        simulator = self.simulator
+        simulator.count('requests')
+        time.sleep(simulator.sample_latency())
+        if simulator.throttled():
+            simulator.count('throttled')
+            self.respond(429, {'error': 'Too Many Requests'})
+        elif simulator.random() < simulator.error_rate:
+            simulator.count('errors')
+            self.respond(500, {'error': 'Internal Server Error'})
+        else:
+            self.respond(*make_response())
+
+    def respond(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
@@ -2,15 +2,15 @@
 import logging
 
 #Django Imports
+from django.conf import settings
 from django.http import HttpResponse
 from django.shortcuts import render, redirect
 from django.views.decorators.csrf import csrf_exempt
-from django.utils import timezone
 
 #Local Imports
 from . import forms
 import mwbase.models as mwbase
-import transports
+from transports import router
 
 
 # Get an instance of a logger
@@ -25,7 +25,7 @@ def receive(request):
 	if request.method == 'POST' and can_submit(request):
 		form = forms.AfricasTalkingForm(request.POST)
 		if form.is_valid():
-			message = transports.receive(
+			message = router.receive(
 				identity=form.cleaned_data['from'],
 				message_text=form.cleaned_data['text'],
 				external_id=form.cleaned_data['id'],
@@ -38,8 +38,8 @@ def receive(request):
 	return render(request,'transports/africas_talking/test_receive.html',{'form':form})
 
 def can_submit(request):
-	if request.POST.has_key('web_token'):
-		return request.user.is_authenticated()
+	if 'web_token' in request.POST:
+		return request.user.is_authenticated
 	return True
 
 @csrf_exempt
@@ -50,18 +50,19 @@ def delivery_report(request):
 		message_id = request.POST['id']
 		failure_reason = request.POST.get('failureReason')
 
-		try:
-			message = mwbase.Message.objects.get_or_none(external_id=message_id)
-		except NameError as e:
+		output = "{} , {} , {}\n".format( status , message_id , failure_reason )
+		# Gateway retries of a report that was just handled
+		if (message_id,status) in router.delivery_report_ids:
+			return HttpResponse(output)
+
+		# Buffered reports are applied in bulk by the delivery_reports command
+		report = mwbase.DeliveryReport(external_id=message_id,status=status,failure_reason=failure_reason)
+		if getattr(settings,'DELIVERY_REPORT_BUFFER',False):
+			report.save()
+		elif not report.apply():
 			return HttpResponse("NO MESSAGE FOR ID FOUND")
-		else:
-			message.external_status = status
-			message.external_success_time = timezone.now()
-			if failure_reason is not None:
-				message.external_data['reason'] = failure_reason
-			message.save()
 
-			output = "{} , {} , {}\n".format( status , message_id , failure_reason )
-			return HttpResponse(output)
+		router.delivery_report_ids.add( (message_id,status) )
+		return HttpResponse(output)
 	else:
 		return HttpResponse("HTTP POST REQUIRED")
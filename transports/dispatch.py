@@ -0,0 +1,116 @@
+'''
+Bounded concurrent dispatch of transport calls.
+
+Transport calls (HTTP requests to the gateway) are run on a thread pool while everything
+that touches the database stays on the calling thread. Each submitted call returns a
+PendingSend whose callbacks are run on the calling thread, in submission order, once the
+number of calls in flight reaches the limit or when the dispatcher is drained.
+'''
+# Python Imports
+import collections
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class PendingSend(object):
+    ''' A transport call that has been submitted but whose result has not been processed yet '''
+
+    def __init__(self, future, callback=None):
+        self.future = future
+        self.callbacks = []
+        if callback is not None:
+            self.then(callback)
+
+    def then(self, callback, errback=None):
+        ''' Add a callback to run on the result. The return value is passed to the next callback.
+            errback is called with the exception if the transport call or an earlier callback fails.
+        '''
+        self.callbacks.append((callback, errback))
+        return self
+
+    def complete(self):
+        error = self.future.exception()
+        value = None if error is not None else self.future.result()
+        for callback, errback in self.callbacks:
+            if error is None:
+                try:
+                    value = callback(value)
+                except Exception as e:
+                    error = e
+            elif errback is not None:
+                errback(error)
+                return
+        if error is not None:
+            raise error
+        return value
+
+
+class Dispatcher(object):
+
+    def __init__(self, workers=4, in_flight=None):
+        self.workers = workers
+        self.in_flight = in_flight if in_flight is not None else 2 * workers
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.queue = collections.deque()
+
+    def submit(self, fn, callback=None):
+        ''' Run fn on the thread pool and callback(fn()) on this thread. Returns a PendingSend '''
+        # Block on the oldest calls until there is room in flight
+        while self.queue and len(self.queue) >= self.in_flight:
+            self.queue.popleft().complete()
+
+        pending = PendingSend(self.executor.submit(fn), callback)
+        self.queue.append(pending)
+        return pending
+
+    def drain(self):
+        ''' Wait for all calls in flight and run their callbacks '''
+        while self.queue:
+            self.queue.popleft().complete()
+
+    def shutdown(self):
+        self.drain()
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.shutdown()
+        else:
+            self.executor.shutdown(wait=False)
+
+
+def then(value, callback, errback=None):
+    ''' Run callback on value now or once it resolves if value is a PendingSend '''
+    if isinstance(value, PendingSend):
+        return value.then(callback, errback)
+    return callback(value)
+
+
+class TokenBucket(object):
+    ''' Limit calls to rate per second with bursts of up to capacity calls '''
+
+    def __init__(self, rate, capacity=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.last = clock()
+
+    def take(self, tokens=1):
+        ''' Block until tokens are available and take them. Returns the seconds waited '''
+        self.refill()
+        wait = max(tokens - self.tokens, 0) / self.rate
+        if wait:
+            self.sleep(wait)
+            self.refill()
+        self.tokens -= tokens
+        return wait
+
+    def refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
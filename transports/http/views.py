@@ -4,7 +4,7 @@ from django.shortcuts import render
 
 #Local Imports
 from . import forms
-import transports
+from transports import router
 
 
 def send_message(request):
@@ -20,7 +20,7 @@ def send_message(request):
             if participant_send_form.is_valid():
                 identity = participant_send_form.cleaned_data['participant'].phone_number()
                 text = participant_send_form.cleaned_data['text']
-                transports.receive(identity=identity,message_text=text)
+                router.receive(identity=identity,message_text=text)
 
                 #reset form on valid
                 participant_send_form = forms.ParticipantSendForm()
@@ -1,13 +1,47 @@
 # Python Imports
+import collections
 import datetime
 import importlib
+import threading
 
 # Django imports
 from django.conf import settings
+from django.db import IntegrityError, transaction
 
 # Local imports
 from mwbase import models as mwbase
-from . import validation
+from . import validation, TransportError
+
+
+class RecentIds(object):
+    '''
+    Bounded set of recently handled gateway ids so retried callbacks are dropped without a query.
+    The oldest ids are forgotten once there are more than RECENT_ID_CACHE_SIZE.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = collections.OrderedDict()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._ids
+
+    def add(self, key):
+        with self._lock:
+            self._ids[key] = None
+            self._ids.move_to_end(key)
+            while len(self._ids) > getattr(settings, 'RECENT_ID_CACHE_SIZE', 10000):
+                self._ids.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+
+# (identity, external_id) of received messages and (external_id, status) of delivery reports
+received_ids = RecentIds()
+delivery_report_ids = RecentIds()
 
 
 def send(identity, message, transport_name=None):
@@ -24,6 +58,37 @@ def send(identity, message, transport_name=None):
     return id, success, data
 
 
+def send_many(messages, transport_name=None):
+    ''' Bulk hook for sending a list of (identity, message) tuples.
+        Identities with identical message text are grouped into a single transport call
+        when the transport implements send_many otherwise falls back to transport.send
+
+        Returns a list of (id, success, data) tuples in the same order as messages
+    '''
+    if transport_name is None:
+        transport_name = getattr(settings, 'SMS_TRANSPORT', 'default')
+    transport = importlib.import_module(f'transports.{transport_name}')
+
+    # Group message indexes by text
+    by_text = collections.OrderedDict()
+    for idx, (identity, text) in enumerate(messages):
+        by_text.setdefault(text, []).append(idx)
+
+    results = [None] * len(messages)
+    for text, indexes in by_text.items():
+        identities = [messages[idx][0] for idx in indexes]
+        try:
+            if hasattr(transport, 'send_many'):
+                group_results = transport.send_many(identities, text)
+            else:
+                group_results = [transport.send(identity, text) for identity in identities]
+        except TransportError as e:
+            group_results = [("", False, {"error": str(e)})] * len(identities)
+        for idx, result in zip(indexes, group_results):
+            results[idx] = result
+    return results
+
+
 def receive(identity, message_text, external_id='', **kwargs):
     '''
     Main hook for receiving messages
@@ -31,30 +96,46 @@ def receive(identity, message_text, external_id='', **kwargs):
         * message_text: the text of the incoming message
         * external_id: id associated with external transport
         * kwargs: dict of extra data associated with transport
+
+    Returns the new Message or None if external_id was already received from identity
     '''
-    # Get incoming connection or create if not found
-    connection, created = mwbase.Connection.objects.get_or_create(identity=identity)
-    participant = None if created else connection.participant
+    key = (identity, external_id)
+    if external_id:
+        if key in received_ids:
+            return None
+        if mwbase.Message.objects.filter(connection_id=identity, external_id=external_id, is_outgoing=False).exists():
+            received_ids.add(key)
+            return None
+
+    # Cached identity -> participant lookup. Creates the connection if not found
+    participant_id = mwbase.Connection.objects.participant_id(identity)
     message = mwbase.Message(
         is_system=False,
         is_outgoing=False,
         text=message_text.strip(),
-        connection=connection,
-        participant=participant,
+        connection_id=identity,
+        participant_id=participant_id,
         external_id=external_id,
         external_data=kwargs,
     )
 
-    if participant:
-        for validator in validation.validators:
-            valid = validator(message)
-            if valid:
-                if validator.action(message) is False:
-                    break
+    # Replies from validator actions are sent once this commits
+    try:
+        with transaction.atomic():
+            if participant_id is not None:
+                validation.dispatch(message)
+
+                # Set last_msg_client
+                message.participant.last_msg_client = datetime.date.today()
+                message.participant.save(update_fields=['last_msg_client', 'modified'])
 
-        # Set last_msg_client
-        participant.last_msg_client = datetime.date.today()
-        participant.save()
+            message.save()
+    except IntegrityError:
+        # A concurrent retry saved the same (connection, external_id) first
+        if not external_id:
+            raise
+        return None
 
-    message.save()
+    if external_id:
+        transaction.on_commit(lambda: received_ids.add(key))
     return message
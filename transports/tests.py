@@ -0,0 +1,351 @@
+import datetime
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+import requests
+import swapper
+from constance import config
+from django.db import IntegrityError, transaction
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+import mwbase.models as mwbase
+from mwbase.models import pending
+import utils
+
+from . import router, africas_talking, validation
+from .africas_talking import api
+from .africas_talking.client import GatewayClient
+from .africas_talking.simulator import GatewaySimulator
+from .dispatch import Dispatcher, TokenBucket
+from utils.management.commands.poll_inbox import poll_inbox
+
+
+def bulk_response(*recipients):
+    return {'SMSMessageData': {
+        'Message': 'Sent to {0}/{0}'.format(len(recipients)),
+        'Recipients': [
+            {'status': status, 'cost': 'KES 1.0000', 'number': number, 'messageId': 'ATXid_{}'.format(number)}
+            for number, status in recipients
+        ]
+    }}
+
+
+class AfricasTalkingBulkTests(SimpleTestCase):
+
+    def test_parse_recipients(self):
+        data = bulk_response(('+2541', 'Success'), ('+2542', 'Invalid Phone Number'))
+        results = api.parse_recipients(['+2542', '+2541', '+2543'], data)
+
+        self.assertEqual(results[0], ('ATXid_+2542', False, {'status': 'Invalid Phone Number'}))
+        self.assertEqual(results[1], ('ATXid_+2541', True, {'status': 'Success'}))
+        self.assertEqual(results[2][:2], ('', False))
+
+    @mock.patch.object(api, 'MAX_RECIPIENTS', 2)
+    def test_send_many_chunks(self):
+        identities = ['+2541', '+2542', '+2543']
+
+        def fake_send_raw(to, message):
+            return bulk_response(*[(number, 'Success') for number in to])
+
+        with mock.patch.object(api, 'send_raw', side_effect=fake_send_raw) as send_raw:
+            results = api.send_many(identities, 'Hello')
+
+        self.assertEqual(send_raw.call_count, 2)
+        self.assertEqual([call[0][0] for call in send_raw.call_args_list], [['+2541', '+2542'], ['+2543']])
+        self.assertEqual([r[0] for r in results], ['ATXid_+2541', 'ATXid_+2542', 'ATXid_+2543'])
+
+    def test_router_groups_identical_text(self):
+        messages = [('+2541', 'A'), ('+2542', 'B'), ('+2543', 'A')]
+
+        def fake_send_many(identities, text):
+            return [('{}-{}'.format(text, identity), True, {}) for identity in identities]
+
+        with mock.patch.object(africas_talking, 'send_many', side_effect=fake_send_many) as send_many:
+            results = router.send_many(messages, transport_name='africas_talking')
+
+        self.assertEqual(send_many.call_count, 2)
+        self.assertEqual([r[0] for r in results], ['A-+2541', 'B-+2542', 'A-+2543'])
+
+
+class FakeGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests += 1
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.respond(status, {'UserData': {'balance': 'KES 100.0000'}})
+
+    def do_POST(self):
+        self.server.requests += 1
+        self.rfile.read(int(self.headers['Content-Length']))
+        status = self.server.statuses.pop(0) if self.server.statuses else 201
+        self.respond(status, bulk_response(('+2541', 'Success')))
+
+    def respond(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class GatewayClientTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(('127.0.0.1', 0), FakeGatewayHandler)
+        self.server.connections, self.server.requests, self.server.statuses = 0, 0, []
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.client = GatewayClient('http://127.0.0.1:{}/version1'.format(self.server.server_port),
+                                    timeout=(1, 1), backoff=0)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reuse(self):
+        for _ in range(5):
+            self.client.post('messaging', data={'to': '+2541', 'message': 'Hello'}).raise_for_status()
+            self.client.get('user').raise_for_status()
+
+        self.assertEqual(self.server.requests, 10)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(self.client.stats['messaging']['count'], 5)
+        self.assertEqual(self.client.stats['user']['count'], 5)
+
+    def test_get_retries_server_error(self):
+        self.server.statuses = [503, 502]
+        response = self.client.get('user')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(self.client.stats['user']['retries'], 2)
+
+    def test_post_not_retried_on_server_error(self):
+        self.server.statuses = [500]
+        response = self.client.post('messaging', data={'to': '+2541', 'message': 'Hello'})
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.server.requests, 1)
+
+
+class GatewaySimulatorTests(SimpleTestCase):
+
+    def simulate(self, **kwargs):
+        simulator = GatewaySimulator(page_size=100, seed=1, **kwargs).start()
+        self.addCleanup(simulator.stop)
+        client = GatewayClient(simulator.url, timeout=(1, 1), retries=0)
+        self.addCleanup(client.close)
+        for name, value in (('client', client), ('AFRICAS_TALKING_SEND', True), ('API_KEY', 'key'), ('USERNAME', 'user')):
+            patcher = mock.patch.object(api, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        return simulator
+
+    def test_send_and_reports(self):
+        simulator = self.simulate(reject_rate=0.5, report_url='http://testserver/', report_delay=0)
+        reported = threading.Event()
+        simulator.post_report = mock.Mock(side_effect=lambda report: reported.set())
+
+        results = api.send_many(['+2541', '+2542', '+2543', '+2544'], 'Hello')
+        accepted = [msg_id for msg_id, success, data in results if success]
+        self.assertEqual(len(accepted), 4 - simulator.stats['rejected'])
+        self.assertEqual(api.balance(), 'KES 1000.0000')
+
+        self.assertTrue(reported.wait(1))
+        self.assertIn(simulator.post_report.call_args[0][0]['id'], accepted)
+
+    def test_inbox_pages(self):
+        simulator = self.simulate()
+        for i in range(250):
+            simulator.add_inbound('+2541', 'Hello {}'.format(i))
+        self.assertEqual([len(page) for page in api.inbox(0)], [100, 100, 50])
+        self.assertEqual([len(page) for page in api.inbox(200)], [50])
+
+    def test_rate_limit(self):
+        simulator = self.simulate(rate=1)
+        self.assertEqual(api.fetch().status_code, 200)
+        self.assertEqual(api.fetch().status_code, 429)
+        self.assertEqual(simulator.stats['throttled'], 1)
+
+    def test_errors(self):
+        simulator = self.simulate(error_rate=1)
+        with self.assertRaises(requests.HTTPError):
+            list(api.inbox(0))
+        self.assertEqual(simulator.stats['errors'], 1)
+
+
+class DispatcherTests(SimpleTestCase):
+
+    def test_callbacks_run_in_order_on_calling_thread(self):
+        results, threads = [], set()
+
+        def record(value):
+            threads.add(threading.current_thread())
+            results.append(value)
+
+        with Dispatcher(workers=4, in_flight=2) as dispatcher:
+            for i in range(10):
+                dispatcher.submit(lambda i=i: i * i, record)
+                self.assertLessEqual(len(dispatcher.queue), 2)
+
+        self.assertEqual(results, [i * i for i in range(10)])
+        self.assertEqual(threads, {threading.current_thread()})
+
+    def test_errback(self):
+        errors = []
+
+        def fail():
+            raise ValueError('gateway down')
+
+        with Dispatcher(workers=2) as dispatcher:
+            dispatcher.submit(fail, lambda value: value).then(lambda value: value, errors.append)
+
+        self.assertEqual([str(e) for e in errors], ['gateway down'])
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def test_rate(self):
+        now = [0.0]
+
+        def sleep(seconds):
+            now[0] += seconds
+
+        bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0], sleep=sleep)
+        waits = [bucket.take() for _ in range(6)]
+
+        self.assertEqual(waits, [0, 0, 0.5, 0.5, 0.5, 0.5])
+        self.assertEqual(now[0], 2)
+
+        now[0] += 10  # Tokens do not build up past capacity
+        self.assertEqual([bucket.take() for _ in range(3)], [0, 0, 0.5])
+
+
+@mock.patch.object(validation.transaction, 'on_commit')
+class ReceiveTests(TestCase):
+
+    def setUp(self):
+        mwbase.Connection.objects.participant_id('+254700000001')  # Seen before linking to a participant
+        Participant = swapper.load_model('mwbase', 'Participant')
+        self.participant = Participant.objects.create(
+            study_id='0001', anc_num='1', facility='bondo', study_group='two-way', sms_name='Jane',
+            display_name='Jane', birthdate=datetime.date(1990, 1, 1), due_date=datetime.date(2020, 1, 1))
+        mwbase.Connection.objects.filter(identity='+254700000001').delete()
+        self.participant.connection_set.create(identity='+254700000001', is_primary=True)
+
+    def replies(self, on_commit):
+        """ Callbacks left for after the commit other than waking the pending count waiters """
+        return [args[0] for args, kwargs in on_commit.call_args_list if args[0] is not pending.notify_all_waiters]
+
+    def test_receive(self, on_commit):
+        router.receive('+254700000001', 'Hello ')
+        with self.assertNumQueries(7):  # savepoint, participant, update, insert, counters, pending, release
+            message = router.receive('+254700000001', 'Hello again')
+
+        self.assertEqual(message.participant, self.participant)
+        self.assertEqual(message.text, 'Hello again')
+        self.participant.refresh_from_db()
+        self.assertEqual(self.participant.last_msg_client, datetime.date.today())
+        self.assertEqual(self.replies(on_commit), [])
+
+    def test_stop_keyword_reply_deferred(self, on_commit):
+        with mock.patch.object(type(self.participant), 'send_automated_message') as send:
+            message = router.receive('+254700000001', ' Stop. ')
+            send.assert_not_called()
+            self.replies(on_commit)[0]()
+            self.assertEqual(send.call_args[1]['send_base'], 'stop')
+
+        self.assertEqual(message.text, 'Stop. - participant withdrew')
+        self.participant.refresh_from_db()
+        self.assertEqual(self.participant.sms_status, 'stopped')
+
+    def test_stop_keywords(self, on_commit):
+        for text in ('STOP', 'Acha!', 'simamisha', 'Weyo.', 'chung'):
+            self.assertTrue(validation.stop_validator(mwbase.Message(text=text)), text)
+        self.assertFalse(validation.stop_validator(mwbase.Message(text='acha tu')))
+
+    def test_stop_reply_keeps_counters(self, on_commit):
+        # The reply saves a participant loaded before the inbound message was counted
+        automated = mock.Mock(english='Goodbye', **{'description.return_value': 'stop.0.two-way'})
+        with mock.patch.object(type(self.participant), 'automated_message', return_value=(automated, 'Goodbye')):
+            router.receive('+254700000001', 'Stop')
+            self.replies(on_commit)[0]()
+
+        self.participant.refresh_from_db()
+        self.assertEqual(self.participant.last_msg_system, utils.today())
+        self.assertEqual((self.participant.message_count, self.participant.message_incoming_count,
+                          self.participant.message_outgoing_count), (2, 1, 1))
+
+    def test_retry_not_saved(self, on_commit):
+        router.received_ids.clear()
+        self.assertIsNotNone(router.receive('+254700000001', 'Hello', external_id='ATXid_1'))
+        with self.assertNumQueries(1):
+            self.assertIsNone(router.receive('+254700000001', 'Hello', external_id='ATXid_1'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(router.receive('+254700000001', 'Hello', external_id='ATXid_1'))
+        self.assertEqual(mwbase.Message.objects.filter(external_id='ATXid_1').count(), 1)
+
+        # The unique index catches retries that get past the check
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            mwbase.Message.objects.create(text='Hello', is_outgoing=False, connection_id='+254700000001',
+                                          external_id='ATXid_1')
+
+    def test_receive_view(self, on_commit):
+        response = self.client.post(reverse('africas-talking-receive'), {
+            'from': '+254700000001', 'to': '28901', 'text': 'Hello', 'date': '2018-03-19 08:34:18',
+            'id': 'ATXid_view', 'linkId': '1'})
+        self.assertEqual(response.status_code, 200)
+        message = mwbase.Message.objects.get(external_id='ATXid_view')
+        self.assertEqual((message.participant, message.text), (self.participant, 'Hello'))
+
+        # Posts from the test page need a logged in user
+        response = self.client.post(reverse('africas-talking-receive'), {
+            'from': '+254700000001', 'to': '28901', 'text': 'Hello', 'date': '2018-03-19 08:34:18',
+            'id': 'ATXid_web', 'linkId': '1', 'web_token': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(mwbase.Message.objects.filter(external_id='ATXid_web').exists())
+
+    def test_unknown_identity(self, on_commit):
+        message = router.receive('+254700000002', 'stop')
+        self.assertIsNone(message.participant)
+        self.assertTrue(mwbase.Connection.objects.filter(identity='+254700000002').exists())
+        self.assertIsNone(router.receive('+254700000002', 'Hello').participant)
+
+        # Linked by another process, which only invalidates its own cache
+        mwbase.Connection.objects.filter(identity='+254700000002').update(participant=self.participant)
+        self.assertEqual(router.receive('+254700000002', 'Hello').participant, self.participant)
+
+
+def inbox_response(*ids):
+    response = mock.Mock()
+    response.json.return_value = {'SMSMessageData': {'Messages': [
+        {'id': id, 'from': '+254700000009', 'to': '28901', 'text': 'Hello {}'.format(id),
+         'date': '2018-03-19T08:34:18.445Z', 'linkId': ''}
+        for id in ids
+    ]}}
+    return response
+
+
+class PollInboxTests(TestCase):
+
+    def test_dedupe_and_checkpoint(self):
+        router.receive('+254700000009', 'Hello 2', external_id='2')
+        pages = {0: inbox_response(1, 2), 2: inbox_response(2, 3), 3: inbox_response()}
+        with mock.patch.object(api, 'fetch', side_effect=lambda since: pages[since]) as fetch:
+            self.assertEqual(poll_inbox(), (2, 2))
+        self.assertEqual([call[0][0] for call in fetch.call_args_list], [0, 2, 3])
+        self.assertEqual(config.AT_LAST_RECEIVED_ID, 3)
+        self.assertEqual(sorted(mwbase.Message.objects.values_list('external_id', flat=True)), ['1', '2', '3'])
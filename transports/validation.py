@@ -1,17 +1,42 @@
+import itertools
 import re
 
-from .validators import KeywordValidator, Validator
+from django.conf import settings
+from django.db import transaction
 
-# Arrary of validator actions
+from .validators import KeywordValidator, Validator, normalize
+
+# Keyword validators by normalized keyword and the other validators in check order
+keywords = {}
 validators = []
 
+
+def add(validator):
+    if isinstance(validator, KeywordValidator):
+        keywords.update(dict.fromkeys(validator.keywords, validator))
+    else:
+        validators.append(validator)
+
+
+def dispatch(message):
+    ''' Run the validator for a keyword message then the others in order until an action returns False '''
+    keyword = keywords.get(normalize(message.text))
+    for validator in itertools.chain([keyword] if keyword else [], validators):
+        if validator(message) and validator.action(message) is False:
+            break
+
+
+def defer(func):
+    ''' Run func (e.g. sending a reply) after the receive transaction commits '''
+    transaction.on_commit(func)
+
 ########################################
 # Define Validators
 ########################################
 
 #############
-stop_validator = KeywordValidator('stop')
-validators.append(stop_validator)
+stop_validator = KeywordValidator('stop', keywords=getattr(settings, 'STOP_KEYWORDS', None))
+add(stop_validator)
 
 
 @stop_validator.set('action')
@@ -19,19 +44,20 @@ def validator_action(message):
     print('STOP messaging for {}'.format(message.participant))
     message.participant.set_status('stopped', 'Participant sent stop keyword')
     message.text += ' - participant withdrew'
-    message.participant.send_automated_message(
+    defer(lambda: message.participant.send_automated_message(
         send_base='stop',
         send_offset=0,
         group='one-way',
         hiv_messaging=False,
-        control=True
-    )
+        control=True,
+        enqueue=getattr(settings, 'SMS_OUTBOX', False)
+    ))
     return False
 
 
 ###############
 validation_validator = Validator('validation')
-validators.append(validation_validator)
+add(validation_validator)
 
 
 @validation_validator.set('check')
@@ -52,13 +78,13 @@ def validator_action(message):
 @validation_validator.set('action')
 def validator_action(message):
     message.participant.is_validated = True
-    message.contparticipant.save()
+    message.participant.save(update_fields=['is_validated', 'modified'])
     return False  # Don't continue validation check  s
 
 
 ###############
 study_group_validator = Validator('study_group')
-validators.append(study_group_validator)
+add(study_group_validator)
 
 
 @study_group_validator.set('check')
@@ -73,4 +99,5 @@ def validator_action(message):
 @study_group_validator.set('action')
 def validator_action(message):
     # Send participant bounce message
-    message.participant.send_automated_message(send_base='bounce', send_offset=0, hiv_messaging=False, control=True)
+    defer(lambda: message.participant.send_automated_message(send_base='bounce', send_offset=0, hiv_messaging=False,
+                                                             control=True, enqueue=getattr(settings, 'SMS_OUTBOX', False)))
@@ -21,8 +21,15 @@ class Validator(object):
 
 class KeywordValidator(Validator):
 
-    def __init__(self, name, action=None):
+    def __init__(self, name, keywords=None, action=None):
+        self.keywords = {normalize(keyword) for keyword in (keywords or [name])}
+
         def keyword_check(message):
-            return name.lower() == message.text.lower()
+            return normalize(message.text) in self.keywords
 
         super(KeywordValidator, self).__init__(name, keyword_check, action)
+
+
+def normalize(text):
+    ''' Keyword form of text: lower case without surrounding space or trailing punctuation '''
+    return text.strip().rstrip('.!').strip().lower()
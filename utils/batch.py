@@ -0,0 +1,175 @@
+# Python Imports
+import collections
+import functools
+import itertools
+
+# Django Imports
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Case, Value, When
+from django.db.models.functions import Cast
+from django.dispatch import Signal
+
+# Sent with the created objs after WriteBatch bulk creates them since bulk_create sends no post_save
+post_bulk_create = Signal(providing_args=['objs'])
+# Sent with the updated objs and fields after WriteBatch bulk updates them
+post_bulk_update = Signal(providing_args=['objs', 'fields'])
+
+
+def default_chunk_size(size=None):
+    return size or getattr(settings, 'WRITE_BATCH_SIZE', 500)
+
+
+def chunks(iterable, size=None):
+    """ Yield lists of at most size items from iterable """
+    size = default_chunk_size(size)
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+@functools.lru_cache(maxsize=None)
+def auto_now_fields(model):
+    return tuple(field.name for field in model._meta.concrete_fields if getattr(field, 'auto_now', False))
+
+
+def bulk_update(objs, fields, batch_size=None):
+    """ Save fields on objs with one UPDATE per batch (QuerySet.bulk_update is only in Django >= 2.2)
+        auto_now fields in fields are set like save(update_fields=fields) would
+        :returns: number of rows updated
+    """
+    if not objs:
+        return 0
+    model = type(objs[0])
+    fields = [model._meta.get_field(name) for name in fields]
+    for obj in objs:
+        for field in fields:
+            if getattr(field, 'auto_now', False):
+                field.pre_save(obj, False)
+
+    db = router.db_for_write(model)
+    connection = connections[db]
+    # Each object takes two parameters (WHEN pk THEN value) per field plus one for the IN clause
+    max_batch_size = connection.ops.bulk_batch_size(['pk', 'pk'] * len(fields), objs)
+    batch_size = min(batch_size, max_batch_size) if batch_size else max_batch_size
+
+    updated = 0
+    for batch in chunks(objs, max(batch_size, 1)):
+        update_kwargs = {}
+        for field in fields:
+            values = [getattr(obj, field.attname) for obj in batch]
+            if all(value == values[0] for value in values):
+                update_kwargs[field.attname] = Value(values[0], output_field=field)
+                continue
+            case = Case(*[When(pk=obj.pk, then=Value(value, output_field=field))
+                          for obj, value in zip(batch, values)], output_field=field)
+            if connection.vendor == 'postgresql':
+                case = Cast(case, output_field=field)
+            update_kwargs[field.attname] = case
+        updated += model._base_manager.using(db).filter(pk__in=[obj.pk for obj in batch]).update(**update_kwargs)
+    return updated
+
+
+class WriteBatch(object):
+    """
+    Group the database writes of a long loop into chunked transactions
+
+        with WriteBatch(chunk_size=500) as batch:
+            for participant in participants:
+                batch.create(Note(participant=participant, comment=comment))
+                participant.last_msg_system = today
+                batch.update(participant, 'last_msg_system', 'modified')
+                batch.tick()
+
+    create() and update() are buffered and written with bulk_create and bulk_update once chunk_size
+    writes are pending and on exit. With atomic=True a transaction is also held open around the loop
+    so plain save() and create() calls are committed together every chunk_size calls to tick().
+    An error rolls back the current chunk.
+
+    Use atomic=False when the loop waits on the network (e.g. transport calls) so the database is
+    only locked while a chunk is written. An error then still writes the pending chunk.
+    """
+
+    def __init__(self, chunk_size=None, atomic=True):
+        self.chunk_size = default_chunk_size(chunk_size)
+        self.atomic = atomic
+        self._atomic = None
+        self.creates = collections.OrderedDict()
+        self.updates = collections.OrderedDict()
+        self.pending = 0
+        self.ticks = 0
+
+    def __enter__(self):
+        if self.atomic:
+            self.begin()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None or not self.atomic:
+            try:
+                self.flush()
+            finally:
+                self.end()
+        else:
+            self.discard()
+            self.end(exc_type, exc_value, traceback)
+
+    def create(self, obj):
+        """ Add an unsaved obj for bulk_create. Note: obj.pk is not set on SQLite """
+        self.creates.setdefault(type(obj), []).append(obj)
+        self.added()
+
+    def update(self, obj, *fields):
+        """ Save fields on obj with the next bulk_update. auto_now fields (modified) are always saved like save() """
+        fields += tuple(name for name in auto_now_fields(type(obj)) if name not in fields)
+        self.updates.setdefault((type(obj), fields), collections.OrderedDict())[obj.pk] = obj
+        self.added()
+
+    def added(self):
+        self.pending += 1
+        if self.pending >= self.chunk_size:
+            self.commit()
+
+    def tick(self):
+        """ Mark one unit of work done and commit if the chunk is full """
+        self.ticks += 1
+        if self.ticks >= self.chunk_size:
+            self.commit()
+
+    def commit(self):
+        """ Write pending creates and updates and commit the current chunk """
+        self.flush()
+        self.ticks = 0
+        if self._atomic is not None:
+            self.end()
+            self.begin()
+
+    def flush(self):
+        if not self.pending:
+            return
+        creates, updates = self.creates, self.updates
+        self.discard()
+        with transaction.atomic():
+            for model, objs in creates.items():
+                model._base_manager.bulk_create(objs, batch_size=self.chunk_size)
+                post_bulk_create.send(sender=model, objs=objs)
+            for (model, fields), objs in updates.items():
+                objs = list(objs.values())
+                bulk_update(objs, fields, batch_size=self.chunk_size)
+                post_bulk_update.send(sender=model, objs=objs, fields=fields)
+
+    def discard(self):
+        self.creates, self.updates = collections.OrderedDict(), collections.OrderedDict()
+        self.pending = 0
+
+    def begin(self):
+        self._atomic = transaction.atomic()
+        self._atomic.__enter__()
+
+    def end(self, exc_type=None, exc_value=None, traceback=None):
+        if self._atomic is not None:
+            atomic, self._atomic = self._atomic, None
+            atomic.__exit__(exc_type, exc_value, traceback)
@@ -0,0 +1,48 @@
+import fcntl
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management import base
+
+import utils
+
+
+class RunLock(object):
+    """
+    Exclusive lock held while a command runs so two copies (e.g. a cron job and the scheduler)
+    never overlap. Raises CommandError if the lock is already held.
+    """
+
+    def __init__(self, name):
+        lock_dir = getattr(settings, 'RUN_LOCK_DIR', None) or tempfile.gettempdir()
+        self.path = os.path.join(lock_dir, 'mwachx-{}.lock'.format(name))
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.file.close()
+            raise base.CommandError('{} is locked by another process'.format(self.path)) from None
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+class BaseCommand(base.BaseCommand):
+    """ BaseCommand that reads the current date once for the whole command (see utils.current_date)
+        Set run_lock to a name to hold a RunLock while the command runs.
+    """
+
+    run_lock = None
+
+    def execute(self, *args, **options):
+        with utils.current_date():
+            if self.run_lock is None:
+                return super().execute(*args, **options)
+            with RunLock(self.run_lock):
+                return super().execute(*args, **options)
@@ -6,12 +6,14 @@ import argparse
 import os
 
 # Django Imports
-from django.core.management.base import BaseCommand, CommandError
+from django.core.management.base import CommandError
 from django.utils import timezone
 from django.db import models , transaction
 
 # Local Imports
 import mwbase.models as mwbase
+from utils.management.base import BaseCommand
+from utils.batch import chunks
 
 class Command(BaseCommand):
 
@@ -25,7 +27,12 @@ class Command(BaseCommand):
         subparsers = parser.add_subparsers(help='at status actions')
 
         # The cmd argument is required for django.core.management.base.CommandParser
-        find_parser = subparsers.add_parser('find',cmd=parser.cmd,help='find AT IDs')
+        find_parser = subparsers.add_parser('find',cmd=parser.cmd,help='match AT dump rows to messages and fix statuses')
+        find_parser.add_argument('input_csv',nargs='?',default='at_dump.csv',help='AT message dump csv')
+        find_parser.add_argument('--window',type=int,default=1,help='minutes after the AT date a message can be created')
+        find_parser.add_argument('--no-text',action='store_false',dest='with_text',default=True,help='do not match on message text')
+        find_parser.add_argument('--live-run',action='store_true',default=False,help='update message statuses')
+        find_parser.add_argument('--chunk-size',type=int,default=None,help='dump rows per transaction (default settings.WRITE_BATCH_SIZE)')
         find_parser.set_defaults(action='find_at_ids')
         find_parser.formatter_class = argparse.ArgumentDefaultsHelpFormatter
 
@@ -50,6 +57,7 @@ class Command(BaseCommand):
         update_parser = subparsers.add_parser('update',cmd=parser.cmd,help='update database')
         update_parser.add_argument('input_csv',nargs='?',default='at_update_ids.csv',help='input csv file to check')
         update_parser.add_argument('--live-run',action='store_true',default=False,help='make updates')
+        update_parser.add_argument('--chunk-size',type=int,default=None,help='messages per UPDATE (default settings.WRITE_BATCH_SIZE)')
         update_parser.set_defaults(action='update_ids')
         update_parser.formatter_class = argparse.ArgumentDefaultsHelpFormatter
 
@@ -61,53 +69,57 @@ class Command(BaseCommand):
 
     def find_at_ids(self):
 
-        self.print_header( "Finding AT Ids" )
+        self.print_header( "Finding AT Ids: Live={}".format(self.options['live_run']) )
 
-        self.stdout.write( self.style.ERROR( 'Exiting' ) )
-        return
+        dump_fp = self.dir_fp(self.options['input_csv'])
+        window = datetime.timedelta(minutes=self.options['window'])
 
-        at_msg_ids = csv.writer(open("ignore/at_msg_ids.csv",'w'))
+        # First pass only reads the dates so every candidate message can be loaded with one query
+        dates = [ row.date for row in csv_row_maker(dump_fp) ]
+        if not dates:
+            self.stdout.write( self.style.ERROR( 'No rows in {}'.format(dump_fp) ) )
+            return
+        index = MessageIndex(min(dates),max(dates) + window)
+        self.stdout.write( 'Loaded {} messages from {:%Y-%m-%d} to {:%Y-%m-%d}'.format(len(index),min(dates),max(dates)) )
+
+        at_msg_ids = csv.writer(open(self.dir_fp('at_msg_ids.csv'),'w'))
         at_msg_ids.writerow( ('date','to','identity','at_id','at_status','msg_status','msg') )
 
-        at_msg_ids_2 = csv.writer(open('ignore/at_msg_ids_2.csv','w'))
+        at_msg_ids_2 = csv.writer(open(self.dir_fp('at_msg_ids_2.csv'),'w'))
         at_msg_ids_2.writerow( ('date','to','identity','at_id','status','msg_status','msg') )
 
-        at_msg_ids_0 = csv.writer(open('ignore/at_msg_ids_0.csv','w'))
+        at_msg_ids_0 = csv.writer(open(self.dir_fp('at_msg_ids_0.csv'),'w'))
         at_msg_ids_0.writerow( ('date','to','status','msg') )
 
-        at_csv = csv.reader(open("ignore/2017_01_31_at_dump.csv"))
-
-        # Make header row tuple
-        HeaderRow = co.namedtuple( "HeaderRow",next(at_csv) )
-        row_maker = row_factory_maker( HeaderRow )
-
-        for row in map(row_maker, at_csv ):
-            msgs = find_msg_match(row)
-
-            if msgs.count() == 1:
-                msg = msgs.first()
-                at_msg_ids.writerow( (
-                    row.date,
-                    row.to,
-                    msg.connection.identity,
-                    msg.external_id,
-                    row.status,
-                    msg.external_status,
-                    row.msg
-                ) )
-            elif msgs.count() > 1:
-                for msg in msgs:
-                    at_msg_ids_2.writerow( (
-                        row.date,
-                        row.to,
-                        msg.connection.identity,
-                        msg.external_id,
-                        row.status,
-                        msg.external_status,
-                        row.msg
-                    ) )
-            else:
-                at_msg_ids_0.writerow( (row.date, row.to, row.status, row.msg) )
+        counts = co.Counter()
+        for chunk in chunks(csv_row_maker(dump_fp),self.options['chunk_size']):
+            # Group message ids by new status so each status is one UPDATE per chunk
+            by_status = co.defaultdict(list)
+            for row in chunk:
+                msgs = index.match(row,window,self.options['with_text'])
+
+                if len(msgs) == 1:
+                    counts['matched'] += 1
+                    msg = msgs[0]
+                    at_msg_ids.writerow( (row.date,row.to,msg.identity,msg.external_id,row.status,msg.external_status,row.msg) )
+                    if msg.external_status != row.status:
+                        by_status[row.status].append(msg.id)
+                elif len(msgs) > 1:
+                    counts['ambiguous'] += 1
+                    for msg in msgs:
+                        at_msg_ids_2.writerow( (row.date,row.to,msg.identity,msg.external_id,row.status,msg.external_status,row.msg) )
+                else:
+                    counts['missing'] += 1
+                    at_msg_ids_0.writerow( (row.date,row.to,row.status,row.msg) )
+
+            counts['scheduled'] += sum( len(ids) for ids in by_status.values() )
+            if self.options['live_run']:
+                with transaction.atomic():
+                    for status, ids in by_status.items():
+                        counts['updated'] += mwbase.Message.objects.filter(id__in=ids).update(external_status=status,modified=timezone.now())
+
+        self.stdout.write( self.style.WARNING( "Matched: {0[matched]} Ambiguous: {0[ambiguous]} Missing: {0[missing]}".format(counts) ) )
+        self.stdout.write( self.style.WARNING( "Scheduled: {0[scheduled]} Updated: {0[updated]}".format(counts) ) )
 
     def check_csv(self):
 
@@ -149,13 +161,19 @@ class Command(BaseCommand):
 
         at_csv = csv_row_maker( self.dir_fp(self.options['input_csv']) )
 
+        # Group AT ids by new status so each chunk is one UPDATE
+        by_status = co.defaultdict(list)
         scheduled , updated = 0 , 0
-        with transaction.atomic():
-            for row in at_csv:
-                if row.at_status != row.msg_status:
-                    scheduled += 1
-                    if self.options['live_run']:
-                        updated += mwbase.Message.objects.filter(external_id=row.at_id).update(external_status=row.at_status)
+        for row in at_csv:
+            if row.at_status != row.msg_status:
+                scheduled += 1
+                by_status[row.at_status].append(row.at_id)
+
+        if self.options['live_run']:
+            with transaction.atomic():
+                for at_status, at_ids in by_status.items():
+                    for chunk in chunks(at_ids,self.options['chunk_size']):
+                        updated += mwbase.Message.objects.filter(external_id__in=chunk).update(external_status=at_status,modified=timezone.now())
 
         self.stdout.write( self.style.WARNING( "Scheduled: {} Updated: {}".format(scheduled,updated) ) )
 
@@ -191,11 +209,34 @@ def row_factory_maker(row_cls):
         return row_cls._make(row)
     return _row_factory
 
-def find_msg_match(row,with_text=True,td=1):
-    end_time = row.date + datetime.timedelta(minutes=td)
-    identity = "+%s" % row.to
-    msg_Q = models.Q(created__range=(row.date,end_time),connection__identity=identity)
-    if with_text is True:
-        msg_Q &= models.Q(text=row.msg.strip())
-    msgs = mwbase.Message.objects.filter(msg_Q)
-    return msgs
+MsgRow = co.namedtuple('MsgRow',('id','identity','created','text','external_id','external_status'))
+
+class MessageIndex(object):
+    """ Messages created between start and end indexed by (identity, minute created) """
+
+    def __init__(self,start,end):
+        self.index = co.defaultdict(list)
+        messages = mwbase.Message.objects.filter(created__range=(start,end)).order_by()
+        for msg in messages.values_list('id','connection_id','created','text','external_id','external_status').iterator():
+            msg = MsgRow._make(msg)
+            self.index[msg.identity,minute(msg.created)].append(msg)
+
+    def __len__(self):
+        return sum( len(msgs) for msgs in self.index.values() )
+
+    def match(self,row,window,with_text=True):
+        """ Return messages to "+row.to" created within window of row.date (with text row.msg) """
+        identity = "+%s" % row.to
+        end_time = row.date + window
+        text = row.msg.strip()
+
+        msgs, key_time = [], minute(row.date)
+        while key_time <= end_time:
+            for msg in self.index.get((identity,key_time),()):
+                if row.date <= msg.created <= end_time and (not with_text or msg.text == text):
+                    msgs.append(msg)
+            key_time += datetime.timedelta(minutes=1)
+        return msgs
+
+def minute(dt):
+    return dt.replace(second=0,microsecond=0)
@@ -1,12 +1,12 @@
 #!/usr/bin/python
 import datetime
 
-from django.core.management.base import BaseCommand
 
 from . import command_utils
 from transports.email import email
 import transports.africas_talking.api as at
 import utils
+from utils.management.base import BaseCommand
 from . import reports
 
 class Command(BaseCommand):
@@ -0,0 +1,32 @@
+#!/usr/bin/python
+import datetime, time
+
+import mwbase.models as mwbase
+from utils.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    ''' Apply staged gateway delivery reports to their Messages
+        With DELIVERY_REPORT_BUFFER on the delivery report callback only saves a DeliveryReport.
+        Run from cron every minute or with --loop as a long running worker.
+    '''
+
+    help = 'apply staged delivery reports'
+    run_lock = 'delivery_reports'
+
+    def add_arguments(self,parser):
+        parser.add_argument('--chunk-size',type=int,default=None,help='reports per transaction (default settings.WRITE_BATCH_SIZE)')
+        parser.add_argument('--max-age',type=float,default=24,help='hours to keep reports with no matching message (default 24)')
+        parser.add_argument('-l','--loop',action='store_true',default=False,help='keep polling for reports')
+        parser.add_argument('--sleep',type=float,default=5,help='seconds to wait between polls with --loop (default 5)')
+
+    def handle(self,*args,**options):
+        max_age = datetime.timedelta(hours=options['max_age'])
+        while True:
+            applied, unmatched = mwbase.DeliveryReport.objects.apply(options['chunk_size'],max_age=max_age)
+            if applied or not options['loop']:
+                self.stdout.write('{} Delivery Reports: applied: {} unmatched: {}'.format(
+                    datetime.datetime.now().strftime('%Y-%m-%d %H:%M'),applied,unmatched))
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
@@ -0,0 +1,61 @@
+#!/usr/bin/python
+import datetime, time
+
+from django.core.management.base import BaseCommand
+
+import mwbase.models as mwbase
+from transports.africas_talking.simulator import GatewaySimulator, LATENCY_DISTRIBUTIONS
+
+
+class Command(BaseCommand):
+    ''' Run an offline Africa's Talking gateway for load and failure testing
+        Set AFRICAS_TALKING['API_BASE'] to the printed url (with SEND on and any API_KEY and USERNAME) and
+        run send_messages or poll_inbox against it. Delivery reports are posted to --report-url.
+    '''
+
+    help = "run a fake Africa's Talking gateway"
+
+    def add_arguments(self,parser):
+        parser.add_argument('--host',default='127.0.0.1',help='address to listen on (default 127.0.0.1)')
+        parser.add_argument('-p','--port',type=int,default=8001,help='port to listen on (default 8001)')
+        parser.add_argument('--latency',type=float,default=0,help='mean response time in ms (default 0)')
+        parser.add_argument('--latency-dist',choices=LATENCY_DISTRIBUTIONS,default='fixed',help='response time distribution (default fixed)')
+        parser.add_argument('--error-rate',type=float,default=0,help='fraction of requests answered with a 500')
+        parser.add_argument('--reject-rate',type=float,default=0,help='fraction of recipients rejected')
+        parser.add_argument('--fail-rate',type=float,default=0,help='fraction of messages with a Failed delivery report')
+        parser.add_argument('--rate',type=float,default=None,help='requests per second before answering 429')
+        parser.add_argument('--report-url',default=None,help='delivery report callback url e.g. http://localhost:8000/africas_talking/delivery_report')
+        parser.add_argument('--report-delay',type=float,default=5,help='seconds before posting delivery reports (default 5)')
+        parser.add_argument('--inbox',type=int,default=0,help='fill the inbox with this many messages from existing connections')
+        parser.add_argument('--seed',type=int,default=None,help='random seed for reproducible runs')
+        parser.add_argument('--stats',type=float,default=10,help='seconds between stats lines (default 10)')
+
+    def handle(self,*args,**options):
+        simulator = GatewaySimulator(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency'] / 1000,
+            latency_dist=options['latency_dist'],
+            error_rate=options['error_rate'],
+            reject_rate=options['reject_rate'],
+            fail_rate=options['fail_rate'],
+            rate=options['rate'],
+            report_url=options['report_url'],
+            report_delay=options['report_delay'],
+            seed=options['seed'],
+        )
+
+        if options['inbox']:
+            identities = list(mwbase.Connection.objects.values_list('identity',flat=True)[:options['inbox']]) or ['+254700000000']
+            for i in range(options['inbox']):
+                simulator.add_inbound(identities[i % len(identities)],'Simulated message {}'.format(i + 1))
+
+        self.stdout.write('Fake gateway listening on {}'.format(simulator.url))
+        with simulator:
+            try:
+                while True:
+                    time.sleep(options['stats'])
+                    self.stdout.write('{} {}'.format(datetime.datetime.now().strftime('%H:%M:%S'),
+                        ' '.join('{}: {}'.format(key,value) for key, value in sorted(simulator.stats.items()))))
+            except KeyboardInterrupt:
+                pass
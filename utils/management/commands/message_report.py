@@ -4,10 +4,11 @@
 import datetime, openpyxl as xl, os
 import operator, collections, re, argparse, csv, code
 
-from django.core.management.base import BaseCommand, CommandError
+from django.core.management.base import CommandError
 from django.utils import timezone , dateparse
 
 import mwbase.models as mwbase
+from utils.management.base import BaseCommand
 
 class Command(BaseCommand):
 
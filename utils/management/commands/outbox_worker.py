@@ -0,0 +1,62 @@
+#!/usr/bin/python
+import collections, datetime, time
+
+from django.db import transaction
+
+import mwbase.models as mwbase
+from utils.management.base import BaseCommand
+from transports import router
+
+
+class Command(BaseCommand):
+    ''' Send queued Outbox messages
+        Messages created with enqueue=True are saved as Queued and sent here in batches.
+        Run from cron every minute or with --loop as a long running worker.
+    '''
+
+    help = 'send queued outbox messages'
+
+    def add_arguments(self,parser):
+        parser.add_argument('-b','--batch',type=int,default=100,help='messages to send per batch (default 100)')
+        parser.add_argument('-l','--loop',action='store_true',default=False,help='keep polling the outbox')
+        parser.add_argument('--sleep',type=float,default=5,help='seconds to wait between polls with --loop (default 5)')
+        parser.add_argument('--max-attempts',type=int,default=3,help='transport errors retried up to this many times (default 3)')
+
+    def handle(self,*args,**options):
+        self.options = options
+
+        stuck = mwbase.Outbox.objects.filter(status='sending').count()
+        if stuck:
+            # A previous worker died mid batch. These may have reached the gateway so are not resent
+            self.stderr.write('Warning: {} outbox messages left in sending state'.format(stuck))
+
+        counts = collections.Counter()
+        while True:
+            batch = self.drain_batch()
+            counts.update(batch)
+            if sum(batch.values()) == 0:
+                if not options['loop']:
+                    break
+                time.sleep(options['sleep'])
+
+        self.stdout.write('{} Outbox: {}'.format(
+            datetime.datetime.now().strftime('%Y-%m-%d %H:%M'),
+            ' '.join('{}: {}'.format(status,count) for status,count in sorted(counts.items())) or 'empty'
+        ))
+
+    def drain_batch(self):
+        ''' Claim and send one batch. Returns a Counter of outbox statuses '''
+        with transaction.atomic():
+            outbox = list(mwbase.Outbox.objects.claim(self.options['batch']))
+        if not outbox:
+            return collections.Counter()
+
+        # Transport calls are made outside of any transaction
+        results = router.send_many([(entry.identity,entry.message.text) for entry in outbox])
+
+        counts = collections.Counter()
+        with transaction.atomic():
+            for entry, result in zip(outbox,results):
+                entry.record(*result,max_attempts=self.options['max_attempts'])
+                counts[entry.status] += 1
+        return counts
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+import datetime, time
+
+from constance import config
+from django.db import transaction
+
+import mwbase.models as mwbase
+from transports import router
+from transports.africas_talking import api
+from utils.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    ''' Receive messages from the Africa's Talking inbox that never reached the receive callback
+        Pages through the inbox from the AT_LAST_RECEIVED_ID checkpoint. Messages whose id is already
+        a Message.external_id are skipped and each page is saved with its checkpoint in one transaction
+        so an interrupted poll resumes from the last saved page.
+    '''
+
+    help = "receive missed messages from the Africa's Talking inbox"
+    run_lock = 'poll_inbox'
+
+    def add_arguments(self,parser):
+        parser.add_argument('--since',type=int,default=None,help='inbox id to start after (default config.AT_LAST_RECEIVED_ID)')
+        parser.add_argument('-l','--loop',action='store_true',default=False,help='keep polling the inbox')
+        parser.add_argument('--sleep',type=float,default=60,help='seconds to wait between polls with --loop (default 60)')
+
+    def handle(self,*args,**options):
+        since = options['since']
+        while True:
+            received, skipped = poll_inbox(since)
+            if received or skipped or not options['loop']:
+                self.stdout.write('{} Inbox: received: {} skipped: {} last id: {}'.format(
+                    datetime.datetime.now().strftime('%Y-%m-%d %H:%M'),received,skipped,config.AT_LAST_RECEIVED_ID))
+            if not options['loop']:
+                break
+            since = None
+            time.sleep(options['sleep'])
+
+
+def poll_inbox(since=None):
+    ''' Receive every inbox message after since (default the saved checkpoint)
+        Returns (received,skipped) where skipped messages were already received
+    '''
+    if since is None:
+        since = config.AT_LAST_RECEIVED_ID
+
+    received, skipped = 0, 0
+    for page in api.inbox(since):
+        # One query per page to find messages that already came in through the callback
+        external_ids = [str(message['id']) for message in page]
+        seen = set(mwbase.Message.objects.filter(external_id__in=external_ids).values_list('external_id',flat=True))
+
+        with transaction.atomic():
+            for external_id, message in zip(external_ids,page):
+                if external_id in seen:
+                    skipped += 1
+                    continue
+                seen.add(external_id)
+                received_message = router.receive(
+                    identity=message['from'],
+                    message_text=message['text'],
+                    external_id=external_id,
+                    time_received=message['date'],
+                    external_linkId=message.get('linkId',''),
+                )
+                if received_message is None:
+                    skipped += 1
+                else:
+                    received += 1
+            config.AT_LAST_RECEIVED_ID = max(int(message['id']) for message in page)
+    return received, skipped
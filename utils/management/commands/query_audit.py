@@ -0,0 +1,117 @@
+#!/usr/bin/python
+import datetime, time
+
+from django.db import connection
+
+import mwbase.models as mwbase
+from utils.management.base import BaseCommand
+import utils
+import swapper
+Participant = swapper.load_model("mwbase", "Participant")
+
+
+class Command(BaseCommand):
+    ''' Show the query plan of the hot querysets and flag full table scans
+        Querysets come from PendingViewSet, send_messages, the delivery report applier, reports and the changes feed.
+        Use --time to also time each query.
+    '''
+
+    help = 'explain hot querysets and flag full table scans'
+
+    def add_arguments(self,parser):
+        parser.add_argument('-f','--facility',default='',help='facility for the pending querysets (default first facility)')
+        parser.add_argument('-t','--time',type=int,default=0,help='run each query this many times and show the best time')
+        parser.add_argument('-p','--plan',action='store_true',default=False,help='print the full query plans')
+        parser.add_argument('names',nargs='*',help='only audit querysets starting with these names')
+
+    def handle(self,*args,**options):
+        facility = options['facility'] or Participant._meta.get_field('facility').choices[0][0]
+        scans_total = 0
+
+        self.stdout.write('{:32} {:>8} {:>10}  {}'.format('Queryset','Rows','Time (ms)','Full Scans'))
+        for name, queryset in audit_querysets(facility):
+            if options['names'] and not any(name.startswith(n) for n in options['names']):
+                continue
+
+            plan = explain(queryset)
+            scans = full_scans(plan)
+            scans_total += len(scans)
+
+            rows, best = '', ''
+            if options['time']:
+                rows, best = time_query(queryset,options['time'])
+                best = '{:.1f}'.format(best * 1000)
+            self.stdout.write('{:32} {:>8} {:>10}  {}'.format(name,rows,best,', '.join(scans)))
+
+            if options['plan']:
+                self.stdout.write('\n'.join('\t{}'.format(line) for line in plan))
+
+        self.stdout.write('\nFull table scans: {}'.format(scans_total))
+
+
+def audit_querysets(facility):
+    ''' (name,queryset) pairs for the querysets on hot paths '''
+    today = utils.today()
+    week_start = utils.make_date(today - datetime.timedelta(days=7))
+    return [
+        # PendingViewSet
+        ('pending.messages',mwbase.Message.objects.by_facility(facility).pending()),
+        ('pending.translations',mwbase.Message.objects.by_facility(facility).to_translate()),
+        ('pending.visits',mwbase.Visit.objects.by_facility(facility).get_visit_checks()),
+        ('pending.calls',mwbase.ScheduledPhoneCall.objects.by_facility(facility).pending_calls()),
+        # send_messages
+        ('send.weekly',Participant.objects.active_users().filter(send_day=today.weekday())),
+        ('send.appointment',mwbase.Visit.objects.pending(scheduled=today + datetime.timedelta(days=2)).to_send()),
+        ('send.missed',mwbase.Visit.objects.get_missed_visits().to_send()),
+        ('send.outbox',mwbase.Outbox.objects.pending().order_by('id')),
+        # Delivery reports
+        ('delivery.messages',mwbase.Message.objects.filter(external_id__in=['ATXid_0','ATXid_1'])),
+        # reports
+        ('reports.message_status',mwbase.Message.objects.filter(created__gte=week_start)),
+        ('reports.failed_reasons',mwbase.Message.objects.exclude(is_outgoing=False).exclude(external_status__in=('Success','Sent'))),
+        ('reports.facility',Participant.objects.filter(facility=facility)),
+        # ChangesViewSet
+        ('changes.participants',Participant.objects.by_facility(facility).changed_since(week_start)[:500]),
+        ('changes.messages',mwbase.Message.objects.by_facility(facility).changed_since(week_start)[:500]),
+        ('changes.visits',mwbase.Visit.objects.by_facility(facility).changed_since(week_start)[:500]),
+    ]
+
+
+def explain(queryset):
+    ''' Return the database query plan for queryset as a list of lines '''
+    sql, params = queryset.query.sql_with_params()
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql,params)
+        rows = cursor.fetchall()
+    # SQLite rows are (id, parent, notused, detail)
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan):
+    ''' Return the tables read with a full table scan in plan '''
+    scans = []
+    for line in plan:
+        line = line.strip()
+        if connection.vendor == 'sqlite':
+            # SCAN [TABLE] x [USING (COVERING) INDEX i] reads every row of x or of one of its indexes
+            words = line.replace('SCAN TABLE','SCAN').split()
+            if words[0] == 'SCAN' and words[1] not in ('CONSTANT','SUBQUERY'):
+                scans.append(words[1] + (' (index)' if 'INDEX' in words else ''))
+        elif 'Seq Scan on' in line:
+            scans.append(line.split('Seq Scan on')[1].split()[0])
+    return scans
+
+
+def time_query(queryset,repeat):
+    ''' Return (rows,best seconds) of running the queryset SQL repeat times (without building models) '''
+    sql, params = queryset.query.sql_with_params()
+    best = None
+    with connection.cursor() as cursor:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            cursor.execute(sql,params)
+            rows = len(cursor.fetchall())
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best,elapsed)
+    return rows, best
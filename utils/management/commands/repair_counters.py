@@ -0,0 +1,30 @@
+#!/usr/bin/python
+from django.db import models
+
+from mwbase.models.interactions import interaction_counts
+from utils.management.base import BaseCommand
+import swapper
+Participant = swapper.load_model("mwbase", "Participant")
+
+
+class Command(BaseCommand):
+    ''' Recompute the denormalized participant interaction counters (note_count, message_count, ...)
+        The counters are kept current as interactions are saved and deleted. Run this after bulk
+        changes that skip signals (QuerySet.update, raw SQL) or to add the counters to an existing database.
+    '''
+
+    help = 'recompute participant interaction counters'
+
+    def add_arguments(self,parser):
+        parser.add_argument('-n','--dry-run',action='store_true',default=False,help='only report participants with wrong counters')
+
+    def handle(self,*args,**options):
+        wrong = models.Q()
+        for field in interaction_counts():
+            wrong |= ~models.Q(**{field:models.F('actual_' + field)})
+        stale = Participant.objects_no_link.add_actual_counts().filter(wrong).count()
+        self.stdout.write('Participants with wrong counters: {}'.format(stale))
+
+        if not options['dry_run'] and stale:
+            updated = Participant.objects_no_link.repair_counters()
+            self.stdout.write('Recomputed counters for {} participants'.format(updated))
@@ -7,11 +7,11 @@ import openpyxl as xl
 import operator
 import os
 
-from django.core.management.base import BaseCommand
 from django.db import models
 from django.utils import timezone
 
 import mwbase.models as mwbase
+from utils.management.base import BaseCommand
 import swapper
 Participant = swapper.load_model("mwbase", "Participant")
 StatusChange = swapper.load_model("mwbase", "StatusChange")
@@ -627,7 +627,9 @@ class Command(BaseCommand):
 
         print( "\nFailed Reasons" )
         reasons = collections.Counter()
-        for msg in mwbase.Message.objects.filter(is_outgoing=True).exclude(external_status__in=('Success', 'Sent')):
+        # exclude(is_outgoing=False) so SQLite scans the table instead of walking the pending() index over most of
+        # the messages (91ms against 679ms on 600k messages, see docs/overview.md)
+        for msg in mwbase.Message.objects.exclude(is_outgoing=False).exclude(external_status__in=('Success', 'Sent')):
             reasons[msg.external_data.get('reason','No Reason')] += 1
         for reason , count in reasons.items():
             print( "\t{:<20}: {}".format(reason,count) )
@@ -4,8 +4,10 @@ from argparse import Namespace
 import code
 import operator, collections, re, argparse
 
-from django.core.management.base import BaseCommand, CommandError
+from django.core.management.base import CommandError
 import mwbase.models as mwbase
+from utils.management.base import BaseCommand
+from utils.batch import WriteBatch
 import swapper
 Participant = swapper.load_model("mwbase", "Participant")
 
@@ -19,6 +21,7 @@ class Command(BaseCommand):
     help = "Manage 1mo and 1yr calls"
 
     def add_arguments(self,parser):
+        parser.add_argument('--chunk-size',type=int,default=None,help='participants per transaction (default settings.WRITE_BATCH_SIZE)')
         subparsers = parser.add_subparsers(help='manage scheduled calls')
 
         init_parser = subparsers.add_parser('init',cmd=parser.cmd,help='initialize phone calls and print report')
@@ -36,33 +39,37 @@ class Command(BaseCommand):
         """ Find all postpartum participants and schedule 1mo and 1yr call """
         self.stdout.write( "{0} Initializing Phonecalls {0}\n".format('*'*5) )
 
-        post = Participant.objects.filter(status='post').order_by('delivery_date')
+        post = Participant.objects.filter(preg_status='post').order_by('delivery_date')
         total_post , total_created = 0 , 0
-        for c in post:
-            total_post += 1
-            month_created , month_call = None , None
-            if c.delta_days() < 30:
-                month_created , month_call = c.schedule_month_call(created=True)
-            year_created , year_call = c.schedule_year_call(created=True)
-            if month_created or year_created:
-                total_created += 1
-                self.stdout.write( "{!r:35} {} ({}) M[{} {}] Y[{} {}]".format(
-                    c,c.delivery_date,c.delta_days(),
-                    month_created, month_call,
-                    year_created, year_call
-                ) )
+        with WriteBatch(self.options['chunk_size']) as batch:
+            for c in post:
+                total_post += 1
+                month_created , month_call = None , None
+                if c.delta_days() < 30:
+                    month_created , month_call = c.schedule_month_call(created=True)
+                year_created , year_call = c.schedule_year_call(created=True)
+                if month_created or year_created:
+                    total_created += 1
+                    self.stdout.write( "{!r:35} {} ({}) M[{} {}] Y[{} {}]".format(
+                        c,c.delivery_date,c.delta_days(),
+                        month_created, month_call,
+                        year_created, year_call
+                    ) )
+                batch.tick()
         self.stdout.write( "Total Post: {} Created: {} Not-Created: {}\n".format(total_post,total_created,total_post-total_created) )
 
         # Schedule calls for postdate participants
         today = datetime.date.today()
-        over = Participant.objects.filter(status='pregnant', due_date__lte=today).order_by('due_date')
+        over = Participant.objects.filter(preg_status='pregnant', due_date__lte=today).order_by('due_date')
         total_over , total_created = 0 , 0
-        for c in over:
-            total_over += 1
-            month_created , month_call = c.schedule_edd_call(created=True)
-            if month_created:
-                total_created += 1
-                self.stdout.write ( "{!r:35} {} ({})".format(c,c.due_date,c.delta_days()) )
+        with WriteBatch(self.options['chunk_size']) as batch:
+            for c in over:
+                total_over += 1
+                month_created , month_call = c.schedule_edd_call(created=True)
+                if month_created:
+                    total_created += 1
+                    self.stdout.write ( "{!r:35} {} ({})".format(c,c.due_date,c.delta_days()) )
+                batch.tick()
 
         self.stdout.write( "Total Over: {} Created: {} Not-Created: {}\n".format(total_over,total_created,total_over-total_created) )
 
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+import collections, datetime, time, traceback
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+import utils
+
+Job = collections.namedtuple('Job',['name','at','args'])
+
+
+class Command(BaseCommand):
+    ''' Long running replacement for the per window send_messages and nightly cron entries
+        Runs send_messages at each send window, spreading the window's messages over --spread minutes,
+        and cron nightly plus scheduled_calls init once a day. Staged delivery reports are applied after each. Caches (AutomatedMessage index, nurse names)
+        stay warm between runs. Each job gets its own current date scope and send_messages holds
+        a run lock so a window never overlaps a manual run.
+    '''
+
+    help = 'run send windows and nightly jobs as a daemon'
+
+    def add_arguments(self,parser):
+        parser.add_argument('-s','--send',action='store_true',default=False,help='send messages (default: plan only)')
+        parser.add_argument('-e','--email',action='store_true',default=False,help='email job reports')
+        parser.add_argument('--windows',nargs='*',type=int,default=[8,13,20],choices=(8,13,20),
+            help='send window hours, send_messages --hour values (default 8 13 20)')
+        parser.add_argument('--nightly',default='01:00',help='time to run nightly jobs HH:MM (default 01:00)')
+        parser.add_argument('--spread',type=float,default=getattr(settings,'SEND_WINDOW_SPREAD',0),
+            help='minutes to spread each window over (default settings.SEND_WINDOW_SPREAD)')
+        parser.add_argument('--rate',type=float,default=None,help='max messages per second (default settings.SMS_SEND_RATE)')
+        parser.add_argument('--workers',type=int,default=0,help='threads to use for transport calls')
+        parser.add_argument('--catch-up',action='store_true',default=False,help="run today's jobs that are already past")
+        parser.add_argument('--poll',type=float,default=30,help='seconds between checks for due jobs (default 30)')
+
+    def handle(self,*args,**options):
+        self.options = options
+        jobs = self.jobs()
+
+        now = datetime.datetime.now()
+        since = datetime.datetime.combine(now.date(),datetime.time()) if options['catch_up'] else now
+        self.log('Scheduler started: {}'.format(', '.join('{0.name} {0.at:%H:%M}'.format(job) for job in jobs)))
+
+        while True:
+            now = datetime.datetime.now()
+            for job in due(jobs,since,now):
+                self.run(job)
+            since = now
+            time.sleep(options['poll'])
+
+    def jobs(self):
+        options = self.options
+        send_args = ['-w','-a','-m','--spread',str(options['spread']),'--workers',str(options['workers'])]
+        if options['send']:
+            send_args.append('--send')
+        if options['rate']:
+            send_args.extend(['--rate',str(options['rate'])])
+        if options['email']:
+            send_args.append('--email')
+
+        # Unbuffered delivery reports that came before their message was saved are staged, fold them in after
+        # each window and purge the old ones nightly. With DELIVERY_REPORT_BUFFER a delivery_reports worker does it
+        reports = [] if getattr(settings,'DELIVERY_REPORT_BUFFER',False) else [('delivery_reports',)]
+
+        jobs = [ Job('send {}h'.format(hour),datetime.time(hour),[('send_messages','-t',str(hour),*send_args),*reports])
+            for hour in options['windows'] ]
+
+        nightly_args = ['nightly','--calls','--success','--balance'] + (['--email'] if options['email'] else [])
+        nightly = datetime.datetime.strptime(options['nightly'],'%H:%M').time()
+        jobs.append( Job('nightly',nightly,[('cron',*nightly_args),('scheduled_calls','init'),*reports]) )
+
+        return sorted(jobs,key=lambda job: job.at)
+
+    def run(self,job):
+        self.log('Starting {}'.format(job.name))
+        start = time.monotonic()
+        for args in job.args:
+            # Like a request: drop connections that timed out or broke while the daemon slept
+            close_old_connections()
+            try:
+                # Each job reads the current date again
+                with utils.current_date():
+                    call_command(*args,stdout=self.stdout,stderr=self.stderr)
+            except CommandError as e:
+                self.stderr.write('Error running {}: {}'.format(' '.join(args),e))
+            except Exception:
+                # Keep the daemon running. An interrupted SendPlan resumes on the next run
+                self.stderr.write('Error running {}\n{}'.format(' '.join(args),traceback.format_exc()))
+            finally:
+                close_old_connections()
+        self.log('Finished {} in {:.0f}s'.format(job.name,time.monotonic() - start))
+
+    def log(self,msg):
+        self.stdout.write('{} {}'.format(datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),msg))
+
+
+def due(jobs,since,now):
+    ''' Yield jobs scheduled in (since,now] in time order '''
+    day = since.date()
+    while day <= now.date():
+        for job in jobs:
+            if since < datetime.datetime.combine(day,job.at) <= now:
+                yield job
+        day += datetime.timedelta(days=1)
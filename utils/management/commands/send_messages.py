@@ -1,25 +1,30 @@
 #!/usr/bin/python
 import sys, datetime
 from argparse import Namespace as ns
-from requests import HTTPError
+from requests import RequestException
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
 from django.utils import dateparse
-from django.db import models
+from django.db import models, transaction
 
 
 import mwbase.models as mwbase
+from utils.management.base import BaseCommand
 import swapper
 Participant = swapper.load_model("mwbase", "Participant")
 from transports.email import email
+from transports.dispatch import Dispatcher, TokenBucket, then
+from utils.batch import WriteBatch, chunks
 
 
 class Command(BaseCommand):
 
     help = 'send daily sms messages'
+    run_lock = 'send_messages'
 
     def add_arguments(self,parser):
         parser.add_argument('-s','--send',help='flag to send messages default (False)',action='store_true',default=False)
+        parser.add_argument('--plan-only',action='store_true',default=False,help='save and report the send plan without sending (default without --send)')
         parser.add_argument('--date',default='',help='set testing date y-m-d')
         parser.add_argument('-t','--hour',help='set testing hour. use 0 for all',choices=(0,8,13,20),type=int)
         parser.add_argument('-d','--day',help='set testing day',choices=range(7),type=int)
@@ -31,6 +36,12 @@ class Command(BaseCommand):
         parser.add_argument('-m','--missed',help='send visit missed visit reminders',action='store_true',default=False)
 
         parser.add_argument('--exclude',nargs='*',help='list of 4 digit study_ids to exclude')
+        parser.add_argument('--workers',type=int,default=0,help='threads to use for transport calls (default 0: send serially)')
+        parser.add_argument('--in-flight',type=int,default=None,help='max transport calls in flight with --workers (default 2 x workers)')
+        parser.add_argument('--send-size',type=int,default=100,help='messages per bulk transport call (default 100)')
+        parser.add_argument('--chunk-size',type=int,default=None,help='max rows per bulk write (default settings.WRITE_BATCH_SIZE)')
+        parser.add_argument('--spread',type=float,default=0,help='minutes to spread the sends over (default 0: send at once)')
+        parser.add_argument('--rate',type=float,default=None,help='max messages per second (default settings.SMS_SEND_RATE)')
 
     def handle(self,*args,**options):
         if options.get('test'):
@@ -70,18 +81,34 @@ class Command(BaseCommand):
         # Convert hour to 8,13 or 20
         hour = [0,8,8,8,8,  8,8,8,8,8, 8,13,13,13,13, 13,20,20,20,20, 20,20,20,20][hour]
 
-        send = options.get('send')
-        email_subject = '{}{}'.format( date.strftime('%a %b %d (%j) %Y'), '' if options.get('send') else ' (FAKE)' )
+        send = options.get('send') and not options.get('plan_only')
+        email_subject = '{}{}'.format( date.strftime('%a %b %d (%j) %Y'), '' if send else ' (FAKE)' )
         email_body = [ "Script started at {}".format(datetime.datetime.now()),
                         "Options: {} D:{} H:{} Send:{}".format(date.strftime('%A %Y-%m-%d'),day,hour,send),
                         '' ]
 
-        if options["weekly"]:
-            weekly_messages(day,hour,date,email_body,options,send=send)
-        if options["appointment"]:
-            appointment_reminders(date,hour,email_body,options,send=send)
-        if options["missed"]:
-            missed_visit_reminders(hour,email_body,options,send=send)
+        # Transport calls go to a thread pool, database writes stay on this thread
+        dispatcher = None
+        if send and options.get('workers'):
+            dispatcher = Dispatcher(options['workers'],options.get('in_flight'))
+
+        plans = []
+        for stage in ('weekly','appointment','missed'):
+            if options[stage]:
+                plan = get_plan(stage,date,day,hour,options)
+                plans.append( (plan,plan.is_started) )
+
+        if send:
+            bucket = rate_limit(sum(plan.pending().count() for plan,_ in plans),options)
+            for plan, _ in plans:
+                execute_plan(plan,dispatcher=dispatcher,chunk_size=options.get('chunk_size'),bucket=bucket,
+                    send_size=options['send_size'])
+
+        for plan, resumed in plans:
+            plan_report(plan,email_body,resumed=resumed)
+
+        if dispatcher is not None:
+            dispatcher.shutdown()
 
         email_body = '\n'.join(email_body)
         if options.get('email'):
@@ -90,120 +117,245 @@ class Command(BaseCommand):
             self.stdout.write(email_subject)
             self.stdout.write(email_body)
 
-def weekly_messages(day,hour,date,email_body,options,send=False):
-    ''' Send weeky messages to participants based on day of week and time of day
+########################################
+# Plan
+########################################
+
+def get_plan(stage,date,day,hour,options):
+    ''' Return the SendPlan for stage on date and hour
+        A plan that has started sending is returned as is so the run can resume.
+        Otherwise the plan is (re)built so it is current when sending starts.
+    '''
+    plan = mwbase.SendPlan.objects.get_or_none(stage=stage,date=date,day=day,hour=hour)
+    if plan is None:
+        plan = mwbase.SendPlan(stage=stage,date=date,day=day,hour=hour)
+    elif plan.is_started:
+        return plan
+
+    summary, items = STAGES[stage][2](date,day,hour,options)
+    with transaction.atomic():
+        plan.summary = summary
+        plan.save()
+        plan.items.all().delete()
+        for item in items:
+            item.plan = plan
+        mwbase.SendPlanItem.objects.bulk_create(items)
+    return plan
+
+def plan_item(participant,description,visit=None,extra_kwargs=None):
+    ''' Return an unsaved SendPlanItem for description or None if there is no message '''
+    message, text = participant.automated_message(description,extra_kwargs=extra_kwargs)
+    if text is None:
+        return None
+    return mwbase.SendPlanItem(participant=participant,visit=visit,description=description,
+        auto=message.description(),text=text,
+        translated_text=message.english if participant.language != 'english' else '')
+
+def plan_weekly(date,day,hour,options):
+    ''' Plan weekly messages for participants based on day of week and time of day
         :param day(int): day of week to select participants for
         :param hour(int): hour of day (0 for all)
-        :email_body(array): array of strings for email body
+        :returns: (summary,items) report counts and unsaved SendPlanItems
     '''
+    participants = list(Participant.objects.active_users().filter(send_day=day))
 
-    email_body.append("***** Weekly Messages ******\n")
-
-    participants = Participant.objects.active_users().filter(send_day=day)
-
-    vals = ns(times={8:0,13:0,20:0}, control=0,
-        no_messages=[],sent_to=[],errors=[],exclude=[])
+    summary = dict(total=len(participants),control=0,times={8:0,13:0,20:0},no_messages=[],exclude=[])
+    items = []
 
     for p in participants:
         if p.study_group == 'control':
-            vals.control += 1
+            summary['control'] += 1
         else:
-            vals.times[p.send_time] += 1
+            summary['times'][p.send_time] += 1
             if p.study_id in options.get('exclude',[]):
-                vals.exclude.append( '{} (#{})'.format( p.description(today=date),p.study_id) )
+                summary['exclude'].append( '{} (#{})'.format( p.description(today=date),p.study_id) )
             elif hour==0 or hour==p.send_time:
-                try:
-                    message = p.send_automated_message(today=date,send=send)
-                except HTTPError as e:
-                    vals.errors.append( '{} (#{})'.format( p.description(today=date),p.study_id) )
+                description = p.description(today=date)
+                item = plan_item(p,description)
+                if item is None:
+                    summary['no_messages'].append( '{} (#{})'.format(description,p.study_id) )
                 else:
-                    if message is None:
-                        vals.no_messages.append( '{} (#{})'.format( p.description(today=date),p.study_id)  )
-                    else:
-                        vals.sent_to.append( "{} (#{}) {}".format(message.description(),p.study_id,p.send_time) )
-
-    email_body.append( "Total: {0} Control: {1}".format(participants.count(), vals.control ) )
-
-    append_errors(email_body,vals)
+                    items.append(item)
 
-def appointment_reminders(date,hour,email_body,options,send=False):
+    return summary, items
 
-    email_body.append( "***** Appointment Reminders *****\n" )
+def plan_appointment_reminders(date,day,hour,options):
     # Find visits scheduled within delta_days and not attended early
     scheduled_date = date + datetime.timedelta(days=2)
-    upcoming_visits = mwbase.Visit.objects.pending(scheduled=scheduled_date)\
-        .to_send().select_related('participant')
+    upcoming_visits = list(mwbase.Visit.objects.pending(scheduled=scheduled_date)\
+        .to_send().select_related('participant'))
 
-    vals = ns(sent_to={}, no_messages=[], control=0, duplicates=0, not_active=0 , times={8:0,13:0,20:0},
-        errors=[],exclude=[]
-    )
+    summary = dict(total=len(upcoming_visits),control=0,duplicates=0,not_active=0,times={8:0,13:0,20:0},
+        no_messages=[],exclude=[])
+    items = []
+    # Participants with a reminder planned
+    planned = set()
 
     for visit in upcoming_visits:
-        if visit.participant.study_group == 'control':
-            vals.control += 1
-        elif visit.participant.id in vals.sent_to:
-            vals.duplicates += 1
-        elif not visit.participant.is_active:
-            vals.not_active += 1
+        participant = visit.participant
+        if participant.study_group == 'control':
+            summary['control'] += 1
+        elif participant.id in planned:
+            summary['duplicates'] += 1
+        elif not participant.is_active:
+            summary['not_active'] += 1
         else:
-            vals.times[visit.participant.send_time] += 1
-            if visit.participant.study_id in options.get('exclude',[]):
-                vals.exclude.append( '{} (#{})'.format( visit.participant.description(today=date),visit.participant.study_id) )
-            elif hour == 0 or visit.participant.send_time == hour:
-                try:
-                    message = visit.send_visit_reminder(send=send)
-                except HTTPError as e:
-                    vals.errors.append( '{} (#{})'.format( visit.participant.description(today=date),visit.participant.study_id) )
+            summary['times'][participant.send_time] += 1
+            if participant.study_id in options.get('exclude',[]):
+                summary['exclude'].append( '{} (#{})'.format( participant.description(today=date),participant.study_id) )
+            elif hour == 0 or participant.send_time == hour:
+                condition = visit.get_condition('pre')
+                description = participant.description(send_base='visit',condition=condition)
+                item = plan_item(participant,description,visit=visit,extra_kwargs=visit.reminder_kwargs())
+                if item is None:
+                    summary['no_messages'].append('{}-{}'.format(participant.description(),condition))
                 else:
-                    if message is None:
-                        condition = visit.get_condition('pre')
-                        vals.no_messages.append('{}-{}'.format(visit.participant.description(),condition))
-                    else:
-                        vals.sent_to[visit.participant.id] = "{} (#{})".format(
-                            message.description(),visit.participant.study_id
-                        )
-
-    email_body.append(
-        'Total: {0} Control: {1.control} Duplicate: {1.duplicates} Not-Active: {1.not_active}'.format(
-         upcoming_visits.count(),vals)
-    )
+                    planned.add(participant.id)
+                    items.append(item)
 
-    append_errors(email_body,vals)
-
-def missed_visit_reminders(hour,email_body,options,send=False):
+    return summary, items
 
-    email_body.append( "***** Missed Visit Reminders *****\n" )
-    missed_visits = mwbase.Visit.objects.get_missed_visits().to_send()
+def plan_missed_visit_reminders(date,day,hour,options):
+    missed_visits = list(mwbase.Visit.objects.get_missed_visits().to_send().select_related('participant'))
 
-    vals = ns(sent_to=[], no_messages=[], control=0, not_active=0, times={8:0,13:0,20:0},
-        exclude=[],errors=[])
+    # Visits with no message still count as reminded when the plan is sent (see count_missed_visits)
+    summary = dict(total=len(missed_visits),control=0,not_active=0,times={8:0,13:0,20:0},
+        no_messages=[],exclude=[],uncounted=[])
+    items = []
 
     for visit in missed_visits:
-        if visit.participant.study_group == 'control':
-            vals.control += 1
-        elif not visit.participant.is_active:
-            vals.not_active += 1
-        elif visit.participant.study_id in options.get('exclude',[]):
-            vals.exclude.append( '{} (#{})'.format( visit.participant.description(today=date),visit.participant.study_id) )
+        participant = visit.participant
+        if participant.study_group == 'control':
+            summary['control'] += 1
+        elif not participant.is_active:
+            summary['not_active'] += 1
+        elif participant.study_id in options.get('exclude',[]):
+            summary['exclude'].append( '{} (#{})'.format( participant.description(today=date),participant.study_id) )
         else:
-            vals.times[visit.participant.send_time] += 1
-            if hour == 0 or visit.participant.send_time == hour:
-                try:
-                    message = visit.send_missed_visit_reminder(send=send)
-                except HTTPError as e:
-                    vals.errors.append( '{} (#{})'.format( visit.participant.description(today=date),visit.participant.study_id) )
+            summary['times'][participant.send_time] += 1
+            if hour == 0 or participant.send_time == hour:
+                condition = visit.get_condition('missed')
+                description = participant.description(send_base='visit',condition=condition)
+                item = plan_item(participant,description,visit=visit)
+                if item is None:
+                    summary['no_messages'].append('{}-{}'.format(participant.description(),condition))
+                    summary['uncounted'].append(visit.id)
                 else:
-                    if message is None:
-                        condition = visit.get_condition('missed')
-                        vals.no_messages.append('{}-{}'.format(visit.participant.description(),condition))
-                    else:
-                        vals.sent_to.append( "{} (#{})".format(message.description(),visit.participant.study_id) )
-
-    email_body.append(
-        'Total: {0} Control: {1.control} Not-Active: {1.not_active}'.format( missed_visits.count(),vals,len(vals.sent_to))
-    )
+                    items.append(item)
+
+    return summary, items
+
+# stage: (report title, report totals, planner)
+STAGES = {
+    'weekly': ("***** Weekly Messages ******\n",
+        "Total: {total} Control: {control}",plan_weekly),
+    'appointment': ("***** Appointment Reminders *****\n",
+        "Total: {total} Control: {control} Duplicate: {duplicates} Not-Active: {not_active}",plan_appointment_reminders),
+    'missed': ("***** Missed Visit Reminders *****\n",
+        "Total: {total} Control: {control} Not-Active: {not_active}",plan_missed_visit_reminders),
+}
+
+########################################
+# Execute
+########################################
+
+def rate_limit(pending,options):
+    ''' Return a TokenBucket that sends pending messages over --spread minutes no faster than --rate
+        or None to send as fast as possible
+    '''
+    max_rate = options.get('rate') or getattr(settings,'SMS_SEND_RATE',None)
+    rate = pending / (options['spread'] * 60) if options.get('spread') and pending else None
+    if rate is None or (max_rate and max_rate < rate):
+        rate = max_rate
+    return TokenBucket(rate) if rate else None
+
+def execute_plan(plan,dispatcher=None,chunk_size=None,bucket=None,send_size=100):
+    ''' Send the pending items in plan
+        :dispatcher(Dispatcher): optional thread pool for transport calls
+        :chunk_size(int): max rows per bulk_create / bulk_update
+        :bucket(TokenBucket): optional rate limit taken for each message before it is sent
+        :send_size(int): items sent with each router.send_many call
+
+        Messages and item updates are written after every send_many call so after a crash at most
+        send_size sent items per call in flight are left pending and sent again.
+    '''
+    count_missed_visits(plan)
+
+    with WriteBatch(chunk_size,atomic=False) as batch:
+        def record(items,messages):
+            for item, message in zip(items,messages):
+                # Gateway and transport errors are saved as failed messages with the error
+                item.record('error' if 'error' in message.external_data else 'sent',batch=batch)
+            batch.commit()
+
+        def error(items,e):
+            for item in items:
+                item.record('error',batch=batch)
+            batch.commit()
+
+        for items in chunks(plan.pending(),send_size):
+            if bucket is not None:
+                for _ in items:
+                    bucket.take()
+
+            dispatch(lambda: mwbase.SendPlanItem.send_many(items,dispatcher=dispatcher,batch=batch),
+                lambda messages,items=items: record(items,messages),lambda e,items=items: error(items,e))
+
+        if dispatcher is not None:
+            dispatcher.drain()
+
+def count_missed_visits(plan):
+    ''' Count a reminder for the missed visits planned without a message like send_missed_visit_reminder does
+        The visit ids are cleared in the same transaction so a resumed plan does not count them again.
+    '''
+    uncounted = plan.summary.get('uncounted')
+    if not uncounted:
+        return
+    with transaction.atomic():
+        for visit in mwbase.Visit.objects.filter(id__in=uncounted):
+            visit.missed_sms_sent()
+        plan.summary['uncounted'] = []
+        plan.save()
+
+def plan_report(plan,email_body,resumed=False):
+    title, totals, _ = STAGES[plan.stage]
+    summary = plan.summary
+
+    email_body.append(title)
+    if resumed:
+        email_body.append( "Continuing plan from {}".format(plan.created_str()) )
+
+    vals = ns(times={int(key):count for key,count in summary['times'].items()},
+        no_messages=summary['no_messages'],exclude=summary['exclude'],sent_to=[],errors=[])
+
+    for item in plan.items.select_related('participant'):
+        if item.status == 'error':
+            vals.errors.append( '{} (#{})'.format(item.description,item.participant.study_id) )
+        elif plan.stage == 'weekly':
+            vals.sent_to.append( "{} (#{}) {}".format(item.auto,item.participant.study_id,item.participant.send_time) )
+        else:
+            vals.sent_to.append( "{} (#{})".format(item.auto,item.participant.study_id) )
+
+    email_body.append( totals.format(**summary) )
+
     append_errors(email_body,vals)
 
+def dispatch(send,record,error):
+    ''' Call send() and pass the resulting message to record or a gateway exception to error.
+        When send() returns a PendingSend record and error run once the transport call resolves.
+    '''
+    def on_error(e):
+        if not isinstance(e,RequestException):
+            raise e
+        error(e)
+
+    try:
+        message = send()
+    except RequestException as e:
+        error(e)
+    else:
+        then(message,record,on_error)
+
 def append_errors(email_body,vals):
 
     email_body.append( "\t8h: {0.times[8]} 13h: {0.times[13]} 20h: {0.times[20]}".format(vals) )
@@ -0,0 +1,63 @@
+#!/usr/bin/python
+import time
+
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+import mwbase.models as mwbase
+from mwbase.serializers.messages import MessageSimpleSerializer, ParticipantSimpleSerializer
+from mwbase.serializers.rows import MessageRows, ParticipantRows, VisitRows
+from mwbase.serializers.visits import VisitSimpleSerializer
+from utils.management.base import BaseCommand
+import swapper
+Participant = swapper.load_model("mwbase", "Participant")
+
+
+class Command(BaseCommand):
+    ''' Time the list serializers against the .values() row serializers in mwbase.serializers.rows
+        Each run fetches, serializes and renders the first N rows to JSON. The two outputs must be the same.
+    '''
+
+    help = 'benchmark list serializers against row serializers'
+
+    def add_arguments(self,parser):
+        parser.add_argument('-n','--rows',type=int,nargs='+',default=[1000,10000],help='row counts to time (default 1000 10000)')
+        parser.add_argument('-r','--repeat',type=int,default=3,help='show the best of this many runs')
+
+    # The hrefs are built for a fake request to testserver
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def handle(self,*args,**options):
+        context = {'request':Request(APIRequestFactory().get('/'))}
+        benches = (
+            ('participants',Participant.objects.order_by('study_id'),ParticipantSimpleSerializer,ParticipantRows),
+            ('messages',mwbase.Message.objects.order_by('-created','-id'),MessageSimpleSerializer,MessageRows),
+            ('visits',mwbase.Visit.objects.order_by('id'),VisitSimpleSerializer,VisitRows),
+        )
+
+        self.stdout.write('{:14} {:>7} {:>14} {:>10} {:>8}  {}'.format('List','Rows','Serializer (s)','Rows (s)','Speedup','Same'))
+        for name, queryset, serializer_class, rows_class in benches:
+            for count in options['rows']:
+                render_serializer = lambda: JSONRenderer().render(
+                    serializer_class(queryset[:count],many=True,context=context).data)
+                render_rows = lambda: JSONRenderer().render(
+                    rows_class(rows_class.project(queryset)[:count],many=True,context=context).data)
+
+                serializer_time, serializer_json = best_time(render_serializer,options['repeat'])
+                rows_time, rows_json = best_time(render_rows,options['repeat'])
+                self.stdout.write('{:14} {:>7} {:>14.3f} {:>10.3f} {:>7.1f}x  {}'.format(
+                    name,len(queryset[:count]),serializer_time,rows_time,serializer_time / rows_time,
+                    serializer_json == rows_json
+                ))
+
+
+def best_time(render,repeat):
+    ''' (best time, output) of repeat calls to render '''
+    best = None
+    for _ in range(max(repeat,1)):
+        start = time.perf_counter()
+        output = render()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best,elapsed)
+    return best, output
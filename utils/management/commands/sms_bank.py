@@ -5,9 +5,11 @@ import code
 import operator, collections, re, argparse
 
 from django.conf import settings
-from django.core.management.base import BaseCommand, CommandError
+from django.core.management.base import CommandError
 import utils.sms_utils as sms
+from utils.batch import WriteBatch
 import mwbase.models as mwbase
+from utils.management.base import BaseCommand
 import swapper
 AutomatedMessage = swapper.load_model("mwbase", "AutomatedMessage")
 Participant = swapper.load_model("mwbase", "Participant")
@@ -39,6 +41,7 @@ class Command(BaseCommand):
         import_parser.add_argument('-d','--done',default=False,action='store_true',help='only import messages marked as done')
         import_parser.add_argument('--clear',default=False,action='store_true',help='clear all existing backend messages')
         import_parser.add_argument('-f','--file',help='location of translation xlsx (default translations/translations.xlsx')
+        import_parser.add_argument('--chunk-size',type=int,default=None,help='messages per transaction (default settings.WRITE_BATCH_SIZE)')
         import_parser.set_defaults(action='import_messages')
 
         participant_parser = subparsers.add_parser('part',help='try to find messages for all current participants')
@@ -285,25 +288,31 @@ class Command(BaseCommand):
         total , add , todo, create = 0 , 0 , 0 , 0
         counts = collections.defaultdict(int)
         diff , existing = [] , []
-        for message in messages:
-            valid, msg = message
-            if not valid:
-                pass
-            counts['total'] += 1
-
-            if do_all or msg.status == 'done':
-                auto , status = AutomatedMessage.objects.from_excel(msg)
-                counts['add'] += 1
-                counts[status] += 1
-
-                if status != 'created':
-                    existing.append( (msg,auto) )
-                if status == 'changed':
-                    diff.append( (msg,auto) )
-
-                if msg.is_todo():
-                    self.stdout.write('Warning: message {} still todo'.format(msg.description()))
-                    counts['todo'] += 1
+        try:
+            with WriteBatch(self.options['chunk_size']) as batch:
+                for message in messages:
+                    valid, msg = message
+                    if not valid:
+                        pass
+                    counts['total'] += 1
+
+                    if do_all or msg.status == 'done':
+                        auto , status = AutomatedMessage.objects.from_excel(msg,batch=batch)
+                        counts['add'] += 1
+                        counts[status] += 1
+
+                        if status != 'created':
+                            existing.append( (msg,auto) )
+                        if status == 'changed':
+                            diff.append( (msg,auto) )
+
+                        if msg.is_todo():
+                            self.stdout.write('Warning: message {} still todo'.format(msg.description()))
+                            counts['todo'] += 1
+                    batch.tick()
+        finally:
+            # from_excel saves may be rolled back
+            AutomatedMessage.objects.invalidate_index()
 
         self.stdout.write('Messages Found: {0[total]} Imported: {0[add]} Created: {0[created]} Changed: {0[changed]} Todo: {0[todo]}'.format(counts))
 
@@ -7,10 +7,12 @@ import importlib
 import swapper
 
 #Django Imports
-from django.core.management.base import BaseCommand, CommandError
+from django.core.management.base import CommandError
 from django.db import transaction, connection
 
 import mwbase.models as mwbase
+from utils.management.base import BaseCommand
+from utils.batch import WriteBatch
 AutomatedMessage = swapper.load_model("mwbase", "AutomatedMessage")
 Participant = swapper.load_model("mwbase", "Participant")
 import backend.models as back
@@ -107,7 +109,7 @@ class Command(BaseCommand):
 
         auto_messages = mwbase.Message.objects.filter(translation_status='auto').prefetch_related('participant')
 
-        with transaction.atomic():
+        with WriteBatch() as batch:
             counts = Namespace(total=0,changed=0,not_found=[],english=0)
             for msg in auto_messages:
                 counts.total += 1
@@ -119,7 +121,7 @@ class Command(BaseCommand):
                     msg.translated_text = auto_message.english
                     counts.changed += 1
                     if not self.options['dry_run']:
-                        msg.save()
+                        batch.update(msg,'translated_text','modified')
                 else:
                     counts.not_found.append(msg.auto)
 
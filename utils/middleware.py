@@ -0,0 +1,12 @@
+import utils
+
+
+class CurrentDateMiddleware(object):
+    """ Read the current date once per request instead of on every utils.today() call """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with utils.current_date():
+            return self.get_response(request)
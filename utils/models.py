@@ -42,6 +42,14 @@ class BaseQuerySet(models.QuerySet):
         except ObjectDoesNotExist:
             return default
 
+    def changed_since(self, modified=None, pk=0):
+        """ Rows modified after (modified, pk) in (modified, id) order. A range scan on an index on modified """
+        changed = self.order_by('modified', 'id')
+        if modified is None:
+            return changed
+        return changed.filter(models.Q(modified__gt=modified) | models.Q(modified=modified, id__gt=pk),
+                              modified__gte=modified)
+
 
 class ForUserQuerySet(BaseQuerySet):
     participant_field = 'participant'
@@ -63,7 +71,8 @@ class ForUserQuerySet(BaseQuerySet):
 
     def active_users(self):
         ''' Filter queryset based on active users who should receive SMS messages.'''
-        q = self._participant_Q(status__in=enums.NO_SMS_STATUS)
+        q = self._participant_Q(preg_status__in=enums.NO_SMS_STATUS) | \
+            self._participant_Q(sms_status__in=enums.NO_SMS_STATUS)
         return self.exclude(q)
 
     def pregnant(self):
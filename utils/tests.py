@@ -1,6 +1,25 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import os
+import tempfile
+from unittest import mock
 
-from . import sms_utils as sms
+from constance import config
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+import swapper
+
+import mwbase.models as mwbase
+
+import utils
+from transports import router
+from . import batch, sms_utils as sms
+from .management.commands import scheduler
+
+Participant = swapper.load_model('mwbase', 'Participant')
 
 
 class UtilsTestCase(TestCase):
@@ -10,3 +29,188 @@ class UtilsTestCase(TestCase):
         cleaned = ['Hello. World', 'Hello. World', 'Hello? World', 'Hello World.']
         for msg, clean in zip(msgs, cleaned):
             self.assertEqual(sms.clean_msg(msg), clean)
+
+
+class WriteBatchTestCase(TestCase):
+
+    def test_bulk_update(self):
+        users = [User.objects.create(username='user{}'.format(i)) for i in range(5)]
+        for i, user in enumerate(users):
+            user.first_name = 'First{}'.format(i)
+            user.last_name = 'Last'
+
+        with self.assertNumQueries(1):
+            self.assertEqual(batch.bulk_update(users, ('first_name', 'last_name')), 5)
+
+        names = User.objects.order_by('username').values_list('first_name', 'last_name')
+        self.assertEqual(list(names), [('First{}'.format(i), 'Last') for i in range(5)])
+
+    def test_create_and_update_flushed_in_chunks(self):
+        user = User.objects.create(username='user')
+        with batch.WriteBatch(chunk_size=3) as writes:
+            writes.create(User(username='new1'))
+            user.first_name = 'Changed'
+            writes.update(user, 'first_name')
+            self.assertEqual(User.objects.count(), 1)
+
+            writes.create(User(username='new2'))
+            self.assertEqual(User.objects.count(), 3)
+
+            writes.create(User(username='new3'))
+        self.assertEqual(User.objects.count(), 4)
+        self.assertEqual(User.objects.get(username='user').first_name, 'Changed')
+
+    def test_update_saves_modified(self):
+        connection = mwbase.Connection.objects.create(identity='+254700000001')
+        message = mwbase.Message.objects.create(text='Hi', connection=connection)
+        mwbase.Message.objects.filter(pk=message.pk).update(modified=timezone.now() - datetime.timedelta(days=1))
+
+        with batch.WriteBatch() as writes:
+            message.external_status = 'Success'
+            writes.update(message, 'external_status')
+
+        message.refresh_from_db()
+        self.assertEqual(message.external_status, 'Success')
+        self.assertGreater(message.modified, timezone.now() - datetime.timedelta(hours=1))
+
+    def test_error_rolls_back_current_chunk(self):
+        with self.assertRaises(ValueError):
+            with batch.WriteBatch(chunk_size=2) as writes:
+                for i in range(3):
+                    User.objects.create(username='user{}'.format(i))
+                    writes.tick()
+                raise ValueError('stop')
+
+        self.assertEqual(list(User.objects.values_list('username', flat=True)), ['user0', 'user1'])
+
+
+class CurrentDateTestCase(TestCase):
+
+    def setUp(self):
+        config.CURRENT_DATE = datetime.date(2016, 2, 1)
+
+    def test_config_read_once(self):
+        with utils.current_date():
+            today = utils.today()
+            self.assertEqual(today, datetime.date(2016, 2, 1))
+            with self.assertNumQueries(0):
+                self.assertEqual(utils.today(), today)
+                with utils.current_date():
+                    self.assertEqual(utils.today(), today)
+
+    def test_override(self):
+        with utils.current_date():
+            with utils.current_date('2017-03-04'):
+                self.assertEqual(utils.today(), datetime.date(2017, 3, 4))
+                utils.current_date.set(datetime.date(2017, 3, 5))
+                self.assertEqual(utils.today(), datetime.date(2017, 3, 5))
+            self.assertEqual(utils.today(), datetime.date(2016, 2, 1))
+        config.CURRENT_DATE = datetime.date(2016, 2, 2)
+        self.assertEqual(utils.today(), datetime.date(2016, 2, 2))
+
+    @override_settings(FAKE_DATE=False)
+    def test_real_date_not_fixed(self):
+        with utils.current_date():
+            self.assertEqual(utils.today(), datetime.date.today())
+        with utils.current_date('2017-03-04'):
+            self.assertEqual(utils.today(), datetime.date(2017, 3, 4))
+
+
+class AtStatusTestCase(TestCase):
+
+    def test_find_matches_dump(self):
+        sent = datetime.datetime(2017, 1, 5, 8, 0, 30, tzinfo=timezone.utc)
+        connection = mwbase.Connection.objects.create(identity='+254700000001')
+        for text, seconds in (('Hello', 0), ('Hello', 10), ('Bye', 40), ('Hi', 120)):
+            mwbase.Message.objects.create(text=text, connection=connection, external_status='Sent',
+                                          created=sent + datetime.timedelta(seconds=seconds))
+
+        with tempfile.TemporaryDirectory() as dump_dir:
+            with open(os.path.join(dump_dir, 'at_dump.csv'), 'w') as fp:
+                dump = csv.writer(fp)
+                dump.writerow(('date', 'to', 'status', 'msg'))
+                dump.writerow(('2017-01-05 08:00:20+00:00', '254700000001', 'Success', 'Bye'))
+                dump.writerow(('2017-01-05 08:00:20+00:00', '254700000001', 'Success', 'Hello'))
+                dump.writerow(('2017-01-05 08:00:20+00:00', '254700000002', 'Failed', 'Hi'))
+
+            stdout = io.StringIO()
+            with self.assertNumQueries(4):  # load messages, savepoint, update, release
+                call_command('at_status', '-d', dump_dir, 'find', '--live-run', stdout=stdout)
+            with open(os.path.join(dump_dir, 'at_msg_ids_2.csv')) as fp:
+                self.assertEqual(len(fp.readlines()), 3)
+
+        self.assertIn('Matched: 1 Ambiguous: 1 Missing: 1', stdout.getvalue())
+        self.assertEqual(mwbase.Message.objects.get(text='Bye').external_status, 'Success')
+        self.assertEqual(mwbase.Message.objects.filter(external_status='Sent').count(), 3)
+
+
+class SchedulerTestCase(TestCase):
+
+    def jobs(self, *args):
+        command = scheduler.Command()
+        command.options = vars(command.create_parser('manage.py', 'scheduler').parse_args(args))
+        return {job.name: [job_args[0] for job_args in job.args] for job in command.jobs()}
+
+    def test_delivery_reports_scheduled(self):
+        jobs = self.jobs('--windows', '8', '20')
+        self.assertEqual(jobs, {'send 8h': ['send_messages', 'delivery_reports'],
+                                'send 20h': ['send_messages', 'delivery_reports'],
+                                'nightly': ['cron', 'scheduled_calls', 'delivery_reports']})
+        with override_settings(DELIVERY_REPORT_BUFFER=True):
+            self.assertEqual(self.jobs()['nightly'], ['cron', 'scheduled_calls'])
+
+
+class SendMessagesTestCase(TestCase):
+
+    def setUp(self):
+        # The message index is process wide and test transactions are rolled back without signals
+        mwbase.AutomatedMessage.objects.invalidate_index()
+
+    def missed_visit(self, study_id):
+        participant = Participant.objects.create(
+            study_id=study_id, anc_num=study_id, facility='bondo', study_group='two-way', sms_name='Jane',
+            display_name='Jane', birthdate=datetime.date(1990, 1, 1), due_date=datetime.date(2015, 9, 1)
+        )
+        mwbase.Connection.objects.create(identity='+25470000{}'.format(study_id), participant=participant,
+                                         is_primary=True)
+        return mwbase.Visit.objects.create(participant=participant, scheduled=datetime.date(2015, 7, 1), notify_count=1)
+
+    def test_missed_visit_without_message_counted(self):
+        visit = self.missed_visit('0001')
+
+        # A dry run only plans, there is no AutomatedMessage so the visit has no item
+        call_command('send_messages', '--missed', '--hour', '0', stdout=io.StringIO())
+        visit.refresh_from_db()
+        self.assertEqual(visit.missed_sms_count, 0)
+
+        call_command('send_messages', '--missed', '--hour', '0', '--send', stdout=io.StringIO())
+        visit.refresh_from_db()
+        self.assertEqual(visit.missed_sms_count, 1)
+        self.assertEqual(mwbase.SendPlan.objects.get().summary['uncounted'], [])
+
+        # Sending the same plan again does not count the visit twice
+        call_command('send_messages', '--missed', '--hour', '0', '--send', stdout=io.StringIO())
+        visit.refresh_from_db()
+        self.assertEqual(visit.missed_sms_count, 1)
+
+    def test_plan_sent_with_send_many(self):
+        mwbase.AutomatedMessage.objects.create(send_base='visit', send_offset=0, group='two-way',
+                                               condition='anc_missed', english='We missed you {name}')
+        visits = [self.missed_visit('000{}'.format(i)) for i in range(3)]
+
+        def send_many(messages):
+            return [('ATXid_{}'.format(identity), True, {}) if identity != '+254700000002' else
+                    ('', False, {'error': 'timeout'}) for identity, text in messages]
+
+        with mock.patch.object(router, 'send_many', side_effect=send_many) as transport:
+            call_command('send_messages', '--missed', '--hour', '0', '--send', '--send-size', '2',
+                         stdout=io.StringIO())
+        self.assertEqual([len(call[0][0]) for call in transport.call_args_list], [2, 1])
+
+        items = mwbase.SendPlanItem.objects.order_by('visit_id')
+        self.assertEqual([item.status for item in items], ['sent', 'sent', 'error'])
+        messages = mwbase.Message.objects.order_by('connection_id')
+        self.assertEqual([(m.text, m.external_status) for m in messages],
+                         [('We missed you Jane', 'Sent')] * 2 + [('We missed you Jane', 'Failed')])
+        self.assertEqual([v.missed_sms_count for v in mwbase.Visit.objects.filter(pk__in=[v.pk for v in visits])],
+                         [1, 1, 1])
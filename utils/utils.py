@@ -1,4 +1,6 @@
+import contextlib
 import datetime
+import threading
 
 import django.db.models as db
 from constance import config
@@ -6,18 +8,69 @@ from django.conf import settings
 from django.utils import dateparse, timezone
 
 
+_current_date = threading.local()
+_READ_CONFIG = object()
+
+
 def today(today=None):
     if today is not None:
         return dateparse.parse_date(today) if isinstance(today, str) else today
-    elif not getattr(settings, 'FAKE_DATE', True):
+    scoped = getattr(_current_date, 'stack', None)
+    if scoped:
+        if scoped[-1] is _READ_CONFIG:
+            scoped[-1] = config_today()
+        if scoped[-1] is not None:
+            return scoped[-1]
+    return config_today()
+
+
+def config_today():
+    if not getattr(settings, 'FAKE_DATE', True):
         return datetime.date.today()
-    elif hasattr(config, 'CURRENT_DATE'):
-        if isinstance(config.CURRENT_DATE, datetime.date):
-            return config.CURRENT_DATE
-        else:
-            return datetime.date(*[int(i) for i in config.CURRENT_DATE.split('-')])
-    else:
+    current = getattr(config, 'CURRENT_DATE', None)
+    if current is None:
         return datetime.date.today()
+    elif isinstance(current, datetime.date):
+        return current
+    else:
+        return datetime.date(*[int(i) for i in current.split('-')])
+
+
+class current_date(contextlib.ContextDecorator):
+    """
+    Fix the value of utils.today() for a request, command or simulation
+
+        with utils.current_date():              # read CURRENT_DATE from constance once, when first used
+        with utils.current_date('2016-02-01'):  # override (date or YYYY-MM-DD string)
+
+    Without a date an enclosing scope is kept. With FAKE_DATE off only an explicit date is fixed
+    so long running processes still see the real date change.
+    """
+
+    def __init__(self, date=None):
+        self.date = date
+
+    def __enter__(self):
+        stack = _current_date.__dict__.setdefault('stack', [])
+        if self.date is not None:
+            date = today(self.date)
+        elif stack:
+            date = stack[-1]
+        elif getattr(settings, 'FAKE_DATE', True):
+            date = _READ_CONFIG
+        else:
+            date = None
+        stack.append(date)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current_date.stack.pop()
+
+    @staticmethod
+    def set(date):
+        """ Change the date of the current scope (e.g. after changing CURRENT_DATE) """
+        stack = getattr(_current_date, 'stack', None)
+        if stack:
+            stack[-1] = today(date)
 
 
 def parse_date(datestr):